@@ -0,0 +1,616 @@
+"""
+app-memorybench.py
+
+Memory retrieval benchmarks for TARS-AI.
+
+Runs synthetic micro-benchmarks against the HyperDB building blocks so changes to
+the memory path can be measured on the target hardware (e.g. a Raspberry Pi).
+
+Usage:
+    python app-memorybench.py bm25
+    python app-memorybench.py ann --sizes 10000,100000,1000000
+    python app-memorybench.py cosine
+    python app-memorybench.py quant --sizes 10000,100000
+    python app-memorybench.py ingest --sizes 50000 --strategy hybrid
+    python app-memorybench.py hybrid --sizes 10000,100000 --model
+    python app-memorybench.py rerank --rerankers cross_encoder:BAAI/bge-reranker-base,onnx:cross-encoder/ms-marco-MiniLM-L-6-v2
+    python app-memorybench.py embed --backends sentence_transformers,onnx --threads 4
+    python app-memorybench.py remote --latency 0.02
+    python app-memorybench.py filter --size 200000
+    python app-memorybench.py segments --size 200000 --segment-size 20000
+    python app-memorybench.py dedup --size 100000 --duplicates 0.3
+"""
+
+# === Standard Libraries ===
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BASE_DIR)
+
+# === Helper Functions ===
+def synthetic_corpus(num_docs, vocab_size=20000, min_len=8, max_len=40, seed=0):
+    """
+    Build a Zipf-distributed token corpus that looks roughly like chat turns.
+
+    Parameters:
+    - num_docs (int): Number of documents to generate.
+    - vocab_size (int): Number of distinct terms.
+    - min_len / max_len (int): Token length range per document.
+    - seed (int): RNG seed.
+
+    Returns:
+    - list[list[str]]: Tokenized documents.
+    """
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(min_len, max_len, size=num_docs)
+    terms = np.minimum(rng.zipf(1.2, size=int(lengths.sum())), vocab_size)
+    corpus, offset = [], 0
+    for length in lengths:
+        corpus.append([f"t{term}" for term in terms[offset:offset + length]])
+        offset += length
+    return corpus
+
+def synthetic_vectors(num_vectors, dim=384, clusters=1024, noise=1.5, seed=0):
+    """
+    Unit vectors drawn around random topic centres, a rough stand-in for sentence embeddings.
+
+    Parameters:
+    - num_vectors (int): Number of vectors.
+    - dim (int): Dimensionality (all-MiniLM-L6-v2 uses 384).
+    - clusters (int): Number of topic centres.
+    - noise (float): Spread around each centre.
+    - seed (int): RNG seed.
+
+    Returns:
+    - np.ndarray: (num_vectors, dim) float32 matrix.
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = np.empty((num_vectors, dim), dtype=np.float32)
+    for start in range(0, num_vectors, 65536):
+        stop = min(start + 65536, num_vectors)
+        chunk = centres[rng.integers(clusters, size=stop - start)]
+        chunk += noise * rng.standard_normal(chunk.shape).astype(np.float32)
+        vectors[start:stop] = chunk / np.linalg.norm(chunk, axis=1, keepdims=True)
+    return vectors
+
+def timed(fn, *args, repeat=1, **kwargs):
+    """Run fn `repeat` times and return (last result, mean seconds per call)."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - start) / repeat
+
+def peak_allocation(fn, *args, **kwargs):
+    """Peak bytes allocated (as seen by tracemalloc, which NumPy reports to) during one call."""
+    tracemalloc.start()
+    try:
+        fn(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+# === Benchmarks ===
+def bench_bm25(args):
+    """
+    Per-insert cost of the incremental BM25 index versus a full bm25s rebuild,
+    and the score difference between the two on sample queries.
+    """
+    import bm25s
+    from modules.module_bm25 import IncrementalBM25
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    corpus = synthetic_corpus(max(sizes) + args.inserts)
+    queries = synthetic_corpus(args.queries, min_len=2, max_len=6, seed=1)
+
+    print(f"{'docs':>8} {'incremental/insert':>20} {'rebuild/insert':>16} {'max |score diff|':>18}")
+    for size in sizes:
+        index = IncrementalBM25()
+        index.add_many(corpus[:size])
+
+        start = time.perf_counter()
+        for tokens in corpus[size:size + args.inserts]:
+            index.add(tokens)
+        incremental = (time.perf_counter() - start) / args.inserts
+
+        rebuild, max_diff = None, None
+        if size <= args.max_rebuild:
+            full = bm25s.BM25(method="lucene")
+            _, rebuild = timed(full.index, corpus[:size + args.inserts], show_progress=False, repeat=3)
+            max_diff = 0.0
+            for query in queries:
+                reference = full.get_scores(query)
+                max_diff = max(max_diff, float(np.abs(index.get_scores(query) - reference).max()))
+
+        print(
+            f"{size:>8} {incremental * 1e6:>17.1f} us "
+            f"{(f'{rebuild * 1e3:.1f} ms' if rebuild is not None else 'skipped'):>16} "
+            f"{(f'{max_diff:.2e}' if max_diff is not None else '-'):>18}"
+        )
+
+def bench_ann(args):
+    """
+    Recall@k and latency of the IVF-flat index against brute-force cosine search.
+    """
+    from modules.module_ann import IVFFlatIndex
+    from modules.module_hyperdb import hyper_SVM_ranking_algorithm_sort, cosine_similarity
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    nprobes = [int(nprobe) for nprobe in args.nprobe.split(",")]
+    print(f"{'vectors':>8} {'nprobe':>6} {'build':>9} {'exact/query':>12} {'ivf/query':>10} {f'recall@{args.k}':>10}")
+    for size in sizes:
+        vectors = synthetic_vectors(size, dim=args.dim)
+        rng = np.random.default_rng(1)
+        queries = vectors[rng.integers(size, size=args.queries)] + 0.05 * rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+
+        start = time.perf_counter()
+        exact = [hyper_SVM_ranking_algorithm_sort(vectors, query, top_k=args.k, metric=cosine_similarity)[0] for query in queries]
+        exact_latency = (time.perf_counter() - start) / args.queries
+
+        index = IVFFlatIndex(metric="cosine", nlist=args.nlist, exact_threshold=0)
+        _, build = timed(index.build, vectors)
+        for nprobe in nprobes:
+            index.nprobe = nprobe
+            start = time.perf_counter()
+            approx = [index.search(vectors, query, args.k) for query in queries]
+            ivf_latency = (time.perf_counter() - start) / args.queries
+            recall = np.mean([
+                len(set(truth.tolist()) & set(result[0].tolist())) / args.k if result is not None else 1.0
+                for truth, result in zip(exact, approx)
+            ])
+            print(
+                f"{size:>8} {nprobe:>6} {build:>8.2f}s {exact_latency * 1e3:>9.2f} ms "
+                f"{ivf_latency * 1e3:>7.2f} ms {recall:>10.3f}"
+            )
+
+def bench_cosine(args):
+    """
+    Per-query latency and peak allocation of cosine top-k search: the original
+    normalize-everything + argsort path versus HyperDB's cached unit rows + argpartition.
+    """
+    from modules.module_hyperdb import HyperDB, cosine_similarity
+
+    def original(vectors, query, k):
+        similarities = cosine_similarity(vectors, query)
+        top_indices = np.argsort(similarities, axis=0)[-k:][::-1]
+        return top_indices.flatten(), similarities[top_indices].flatten()
+
+    print(f"{'vectors':>8} {'original':>10} {'cached':>10} {'speedup':>8} {'orig peak':>10} {'cached peak':>12}")
+    for size in [int(size) for size in args.sizes.split(",")]:
+        vectors = synthetic_vectors(size, dim=args.dim) * 3.0
+        query = vectors[0] + 0.1
+        db = HyperDB(vectors=vectors, documents=[None] * size, similarity_metric="cosine")
+        assert set(original(db.vectors, query, args.k)[0]) == set(db._vector_search(query, args.k)[0])
+
+        _, original_latency = timed(original, db.vectors, query, args.k, repeat=args.repeat)
+        _, cached_latency = timed(db._vector_search, query, args.k, repeat=args.repeat)
+        original_peak = peak_allocation(original, db.vectors, query, args.k)
+        cached_peak = peak_allocation(db._vector_search, query, args.k)
+        print(
+            f"{size:>8} {original_latency * 1e3:>7.2f} ms {cached_latency * 1e3:>7.2f} ms "
+            f"{original_latency / cached_latency:>7.1f}x {original_peak / 2**20:>7.1f} MB {cached_peak / 2**20:>9.2f} MB"
+        )
+
+def bench_quant(args):
+    """
+    Memory used by the search copy of the vectors, per-query latency and recall@k
+    of float16 / int8 storage (with float32 rescoring) against float32 search.
+    """
+    from modules.module_hyperdb import HyperDB
+
+    storages = args.storage.split(",")
+    print(f"{'vectors':>8} {'storage':>8} {'search MB':>10} {'saved':>7} {'/query':>10} {f'recall@{args.k}':>10}")
+    for size in [int(size) for size in args.sizes.split(",")]:
+        vectors = synthetic_vectors(size, dim=args.dim)
+        rng = np.random.default_rng(1)
+        queries = vectors[rng.integers(size, size=args.queries)] + 0.05 * rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+
+        reference = HyperDB(vectors=vectors, documents=[None] * size, similarity_metric="cosine")
+        truth = [set(reference._vector_search(query, args.k)[0].tolist()) for query in queries]
+        baseline_bytes = reference.unit_vectors.nbytes
+
+        for storage in ["float32"] + storages:
+            db = reference if storage == "float32" else HyperDB(
+                vectors=vectors, documents=[None] * size, similarity_metric="cosine",
+                vector_storage=storage, rescore_factor=args.rescore_factor,
+            )
+            search_bytes = baseline_bytes if db.quantized is None else db.quantized.nbytes
+            start = time.perf_counter()
+            results = [db._vector_search(query, args.k)[0] for query in queries]
+            latency = (time.perf_counter() - start) / args.queries
+            recall = np.mean([len(expected & set(rows.tolist())) / args.k for expected, rows in zip(truth, results)])
+            print(
+                f"{size:>8} {storage:>8} {search_bytes / 2**20:>10.1f} {1 - search_bytes / baseline_bytes:>6.0%} "
+                f"{latency * 1e3:>7.2f} ms {recall:>10.3f}"
+            )
+
+def bench_ingest(args):
+    """
+    Bulk ingestion throughput of HyperDB.add_documents (storage and index cost only:
+    a synthetic embedding function stands in for the model unless --model is given).
+    """
+    from modules.module_hyperdb import HyperDB
+
+    def synthetic_embedding(documents):
+        return synthetic_vectors(len(documents), dim=args.dim, seed=len(documents))
+
+    print(f"{'docs':>8} {'strategy':>8} {'seconds':>8} {'docs/s':>9}")
+    for size in [int(size) for size in args.sizes.split(",")]:
+        corpus = synthetic_corpus(size, seed=2)
+        documents = [
+            {"time": f"{i}", "user_input": " ".join(tokens[:len(tokens) // 2]), "bot_response": " ".join(tokens[len(tokens) // 2:])}
+            for i, tokens in enumerate(corpus)
+        ]
+        for strategy in args.strategy.split(","):
+            db = HyperDB(
+                rag_strategy=strategy,
+                embedding_function=None if args.model else synthetic_embedding,
+                embed_batch_size=args.batch_size,
+            )
+            if strategy == "hybrid":
+                db.reranker = None  # not used while ingesting
+            _, elapsed = timed(db.add_documents, documents)
+            print(f"{size:>8} {strategy:>8} {elapsed:>8.2f} {size / elapsed:>9.0f}")
+
+def bench_hybrid(args):
+    """
+    Per-stage latency of HyperDB.hybrid_query with the vector and BM25 branches run
+    one after another versus concurrently (synthetic query embeddings and no
+    cross-encoder unless --model is given).
+    """
+    from modules.module_hyperdb import HyperDB
+
+    def synthetic_embedding(documents):
+        return synthetic_vectors(len(documents), dim=args.dim, seed=len(documents))
+
+    class LengthReranker:
+        """Stand-in for the cross-encoder: scores candidates by text length."""
+        def predict(self, pairs):
+            return np.array([len(text) for _, text in pairs], dtype=np.float32)
+
+    stages = ["embed", "vector", "bm25", "fuse", "rerank", "total"]
+    print(f"{'docs':>8} {'mode':>10} " + " ".join(f"{stage + ' ms':>10}" for stage in stages))
+    for size in [int(size) for size in args.sizes.split(",")]:
+        corpus = synthetic_corpus(size, seed=3)
+        db = HyperDB(rag_strategy="hybrid", embedding_function=None if args.model else synthetic_embedding)
+        if not args.model:
+            db.reranker = LengthReranker()
+        db.add_documents([{"user_input": " ".join(tokens)} for tokens in corpus])
+        queries = [" ".join(tokens[:6]) for tokens in synthetic_corpus(args.queries, seed=4)]
+
+        for parallel in (False, True):
+            db.parallel_hybrid = parallel
+            db.embedding_cache.clear()
+            db.rerank_cache.clear()
+            db.timings.reset()
+            for query in queries:
+                db.hybrid_query(query, top_k=args.k)
+            stats = db.timing_stats()
+            cells = " ".join(f"{stats[stage]['avg_ms'] if stage in stats else 0.0:>10.2f}" for stage in stages)
+            print(f"{size:>8} {'parallel' if parallel else 'sequential':>10} {cells}")
+
+def bench_rerank(args):
+    """
+    Reranker quality versus latency across backends, models and candidate counts.
+
+    Each query is a word sample of one stored memory (or, with --memory, a stored
+    memory's user input), so hit@1 is the fraction of queries whose source memory
+    ranks first. agree@1 compares the top result with the first reranker at the
+    largest candidate count. Skip margins report how often adaptive skipping fires
+    and what it costs in hit@1.
+    """
+    from modules.module_hyperdb import HyperDB
+    from modules.module_reranker import load_reranker
+
+    rng = np.random.default_rng(5)
+    db = HyperDB(rag_strategy="hybrid", reranker_backend="none")
+    if args.memory:
+        db.load(args.memory)
+        rows = [row for row in db.view().rows() if isinstance(db.documents[row], dict) and db.documents[row].get("user_input")]
+        rows = [int(row) for row in rng.choice(rows, size=min(args.queries, len(rows)), replace=False)]
+        queries = [(db.documents[row]["user_input"], row) for row in rows]
+    else:
+        corpus = synthetic_corpus(args.size, seed=6)
+        db.add_documents([{"user_input": " ".join(tokens)} for tokens in corpus])
+        rows = rng.choice(len(corpus), size=args.queries, replace=False)
+        queries = [(" ".join(rng.choice(corpus[row], size=min(6, len(corpus[row])), replace=False)), int(row)) for row in rows]
+
+    candidate_counts = [int(count) for count in args.candidates.split(",")]
+    margins = [float(margin) for margin in args.skip_margins.split(",")]
+    reference = None
+    print(f"{'reranker':>48} {'cand':>5} {'skip':>5} {'rerank ms':>10} {'skipped':>8} {'hit@1':>6} {'agree@1':>8}")
+    for spec in args.rerankers.split(","):
+        backend, _, model = spec.partition(":")
+        db.reranker = load_reranker(backend, model or "BAAI/bge-reranker-base", max_length=args.max_length)
+        for count in sorted(candidate_counts, reverse=True):
+            for margin in margins:
+                db.rerank_candidates, db.rerank_skip_margin = count, margin
+                db.rerank_cache.clear()
+                db.timings.reset()
+                db.rerank_skipped = 0
+                tops = [db.hybrid_query(query, top_k=args.k, return_similarities=False, return_rows=True)[0][1] for query, _ in queries]
+                if reference is None:
+                    reference = tops
+                hit = np.mean([top == row for top, (_, row) in zip(tops, queries)])
+                agree = np.mean([top == ref for top, ref in zip(tops, reference)])
+                rerank_ms = db.timing_stats().get("rerank", {}).get("avg_ms", 0.0)
+                print(f"{spec:>48} {count:>5} {margin:>5.2f} {rerank_ms:>10.2f} {db.rerank_skipped / len(queries):>8.0%} {hit:>6.2f} {agree:>8.2f}")
+
+def bench_embed(args):
+    """
+    Embedding throughput (sentences/s), load time and cosine agreement of each
+    backend with the first one (the current sentence-transformers encoder by default).
+    """
+    from modules.module_embedding import load_embedding_provider
+
+    sentences = [" ".join(tokens) for tokens in synthetic_corpus(args.sentences, seed=7)]
+    reference = None
+    print(f"{'backend':>22} {'load s':>7} {'sent/s':>9} {'cos mean':>9} {'cos min':>8}")
+    for backend in args.backends.split(","):
+        provider = load_embedding_provider(backend, args.model, threads=args.threads, batch_size=args.batch_size)
+        _, load_time = timed(provider.warmup)
+        vectors, elapsed = timed(provider.encode, sentences)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        if reference is None:
+            reference = vectors
+        agreement = np.sum(vectors * reference, axis=1)
+        print(f"{backend:>22} {load_time:>7.2f} {len(sentences) / elapsed:>9.0f} {agreement.mean():>9.4f} {agreement.min():>8.4f}")
+
+def bench_remote(args):
+    """
+    RemoteEmbeddingProvider throughput against the local stand-in server, for float
+    versus base64 responses and several request concurrencies (results are
+    checked against the server's embeddings).
+    """
+    from modules.module_embedding import RemoteEmbeddingProvider
+    from modules.module_embedserver import StandInEmbeddingServer, stand_in_embedding
+
+    sentences = [" ".join(tokens) for tokens in synthetic_corpus(args.sentences, seed=8)]
+    expected = np.stack([stand_in_embedding(sentence, args.dim) for sentence in sentences])
+    print(f"{'encoding':>9} {'concurrency':>11} {'requests':>9} {'sent/s':>9} {'max err':>9}")
+    with StandInEmbeddingServer(dim=args.dim, latency=args.latency) as server:
+        for encoding in ("float", "base64"):
+            for concurrency in [int(count) for count in args.concurrency.split(",")]:
+                provider = RemoteEmbeddingProvider(
+                    "stand-in", server.url, batch_size=args.batch_size,
+                    concurrency=concurrency, encoding_format=encoding,
+                )
+                vectors, elapsed = timed(provider.encode, sentences)
+                error = np.abs(vectors - expected).max()
+                print(f"{encoding:>9} {concurrency:>11} {provider.requests:>9} {len(sentences) / elapsed:>9.0f} {error:>9.1e}")
+
+def bench_filter(args):
+    """
+    Time-filtered vector search versus scoring the whole corpus.
+
+    Memories get one timestamp per minute; each window selects the most recent
+    fraction of them, and only the selected rows are scored.
+    """
+    from datetime import datetime, timedelta
+    from modules.module_hyperdb import HyperDB
+
+    vectors = synthetic_vectors(args.size, dim=args.dim, seed=9)
+    start = datetime(2024, 1, 1)
+    documents = [
+        {"timestamp": (start + timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S"), "user_input": f"memory {i}"}
+        for i in range(args.size)
+    ]
+    db = HyperDB(documents=documents, vectors=vectors)
+    _, build = timed(lambda: db.metadata)
+    print(f"metadata columns built in {build * 1000:.0f} ms for {args.size} memories")
+    queries = synthetic_vectors(args.queries, dim=args.dim, seed=10)
+
+    _, full = timed(lambda: [db._vector_search(query, args.k) for query in queries])
+    print(f"{'window':>8} {'rows':>8} {'select ms':>10} {'search ms':>10} {'speedup':>8}")
+    print(f"{'all':>8} {args.size:>8} {0.0:>10.3f} {full / len(queries) * 1000:>10.3f} {1.0:>7.1f}x")
+    for fraction in [float(value) for value in args.windows.split(",")]:
+        since = start + timedelta(minutes=int(args.size * (1 - fraction)))
+        rows, select = timed(db.filter_rows, {"since": since}, repeat=20)
+        _, search = timed(lambda: [db._vector_search(query, args.k, rows) for query in queries])
+        print(f"{fraction:>8.0%} {rows.shape[0]:>8} {select * 1000:>10.3f} {search / len(queries) * 1000:>10.3f} {full / max(search, 1e-9):>7.1f}x")
+
+def bench_segments(args):
+    """
+    Flat memory versus hot + sealed segments: in-RAM vector bytes, query latency
+    (all segments, and a time filter that prunes all but the newest), and top-1
+    agreement with the flat memory.
+    """
+    import shutil
+    import tempfile
+    from datetime import datetime, timedelta
+    from modules.module_hyperdb import HyperDB
+    from modules.module_segments import SegmentedHyperDB
+
+    vectors = synthetic_vectors(args.size, dim=args.dim, seed=11)
+    start = datetime(2024, 1, 1)
+    documents = [
+        {"timestamp": (start + timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S"), "user_input": f"memory {i}"}
+        for i in range(args.size)
+    ]
+    queries = synthetic_vectors(args.queries, dim=args.dim, seed=12)
+    query_vectors = {f"query {i}": vector for i, vector in enumerate(queries)}
+    embed = lambda texts: np.stack([query_vectors[text] for text in texts])
+
+    flat = HyperDB(documents=documents, vectors=vectors, embedding_function=embed)
+    directory = tempfile.mkdtemp()
+    try:
+        hot = HyperDB(documents=list(documents), vectors=vectors, embedding_function=embed)
+        segmented = SegmentedHyperDB(
+            hot, directory, segment_size=args.segment_size, segment_storage=args.storage,
+            segment_factory=lambda: HyperDB(vector_storage=args.storage, embedding_function=embed),
+        )
+        _, seal = timed(segmented.maybe_seal, os.path.join(directory, "hot.pickle.gz"))
+        print(f"sealed {len(segmented.segments)} segments of {args.segment_size} in {seal:.1f}s; hot holds {hot.live_count}")
+
+        recent = {"since": start + timedelta(minutes=args.size - args.segment_size)}
+        texts = list(query_vectors)
+        flat_top = [flat.query(text, top_k=args.k, return_similarities=False)[0] for text in texts]
+        print(f"{'memory':>10} {'RAM vectors MB':>15} {'query ms':>9} {'recent ms':>10} {'agree@1':>8}")
+        for name, db in (("flat", flat), ("segmented", segmented)):
+            in_ram = flat if db is flat else hot
+            resident = in_ram.vectors.nbytes + in_ram.unit_vectors.nbytes
+            tops, elapsed = timed(lambda: [db.query(text, top_k=args.k, return_similarities=False)[0] for text in texts])
+            _, filtered = timed(lambda: [db.query(text, top_k=args.k, filters=recent) for text in texts])
+            agree = np.mean([top == expected for top, expected in zip(tops, flat_top)])
+            print(f"{name:>10} {resident / 2**20:>15.1f} {elapsed / len(texts) * 1000:>9.2f} {filtered / len(texts) * 1000:>10.2f} {agree:>8.2f}")
+        segmented.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+def bench_dedup(args):
+    """
+    Insert-time near-duplicate suppression: bulk import throughput with and without
+    it, plus recall (duplicates caught) and false suppressions against ground truth.
+
+    A fraction of the synthetic memories are perturbed copies of earlier ones at
+    cosine similarity ~`--similarity` to their original.
+    """
+    from modules.module_hyperdb import HyperDB
+
+    rng = np.random.default_rng(13)
+    originals = synthetic_vectors(args.size, dim=args.dim, seed=13)
+    vectors = originals.copy()
+    duplicates = np.flatnonzero(rng.random(args.size) < args.duplicates)
+    duplicates = duplicates[duplicates > 0]
+    sources = (rng.random(duplicates.shape[0]) * duplicates).astype(np.int64)
+    sources = np.where(np.isin(sources, duplicates), 0, sources)  # copy an original, never another copy
+    noise = rng.standard_normal((duplicates.shape[0], args.dim)).astype(np.float32)
+    noise -= np.sum(noise * originals[sources], axis=1, keepdims=True) * originals[sources]
+    noise /= np.linalg.norm(noise, axis=1, keepdims=True)
+    angle = np.arccos(args.similarity)
+    vectors[duplicates] = np.cos(angle) * originals[sources] + np.sin(angle) * noise
+    documents = [{"bot_response": f"memory {i}"} for i in range(args.size)]
+
+    print(f"{args.size} memories, {duplicates.shape[0]} near-duplicates at cosine {args.similarity}")
+    print(f"{'threshold':>9} {'batch':>6} {'docs/s':>9} {'stored':>8} {'caught':>7} {'false':>6}")
+    for threshold in [0.0] + [float(value) for value in args.thresholds.split(",")]:
+        for batch_size in [int(value) for value in args.batch_sizes.split(",")]:
+            db = HyperDB(dedup_threshold=threshold)
+            def run():
+                for offset in range(0, args.size, batch_size):
+                    db.add_documents(documents[offset:offset + batch_size], vectors[offset:offset + batch_size], journal=False)
+            _, elapsed = timed(run)
+            stored = {document["bot_response"] for document in db.documents}
+            missing = np.array([f"memory {i}" not in stored for i in range(args.size)])
+            caught = missing[duplicates].mean() if duplicates.size else 0.0
+            false = missing.sum() - missing[duplicates].sum()
+            print(f"{threshold:>9.2f} {batch_size:>6} {args.size / elapsed:>9.0f} {db.live_count:>8} {caught:>7.1%} {false:>6}")
+
+BENCHMARKS = {
+    "bm25": bench_bm25,
+    "ann": bench_ann,
+    "cosine": bench_cosine,
+    "quant": bench_quant,
+    "ingest": bench_ingest,
+    "hybrid": bench_hybrid,
+    "rerank": bench_rerank,
+    "embed": bench_embed,
+    "remote": bench_remote,
+    "filter": bench_filter,
+    "segments": bench_segments,
+    "dedup": bench_dedup,
+}
+
+# === Main Application Logic ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TARS-AI memory retrieval benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    bm25_parser = subparsers.add_parser("bm25", help="incremental BM25 insert cost and accuracy")
+    bm25_parser.add_argument("--sizes", default="1000,10000,100000")
+    bm25_parser.add_argument("--inserts", type=int, default=200)
+    bm25_parser.add_argument("--queries", type=int, default=50)
+    bm25_parser.add_argument("--max-rebuild", type=int, default=10000, help="largest corpus to time a full rebuild for")
+
+    ann_parser = subparsers.add_parser("ann", help="IVF index recall@k and latency versus brute force")
+    ann_parser.add_argument("--sizes", default="10000,100000,1000000")
+    ann_parser.add_argument("--dim", type=int, default=384)
+    ann_parser.add_argument("--k", type=int, default=10)
+    ann_parser.add_argument("--nlist", type=int, default=0, help="0 = about sqrt(N)")
+    ann_parser.add_argument("--nprobe", default="4,8,16,32")
+    ann_parser.add_argument("--queries", type=int, default=100)
+
+    cosine_parser = subparsers.add_parser("cosine", help="cached unit vectors versus per-query normalization")
+    cosine_parser.add_argument("--sizes", default="1000,10000,100000")
+    cosine_parser.add_argument("--dim", type=int, default=384)
+    cosine_parser.add_argument("--k", type=int, default=5)
+    cosine_parser.add_argument("--repeat", type=int, default=20)
+
+    quant_parser = subparsers.add_parser("quant", help="float16 / int8 vector storage memory and recall@k")
+    quant_parser.add_argument("--sizes", default="10000,100000")
+    quant_parser.add_argument("--dim", type=int, default=384)
+    quant_parser.add_argument("--k", type=int, default=10)
+    quant_parser.add_argument("--storage", default="float16,int8")
+    quant_parser.add_argument("--rescore-factor", type=int, default=4)
+    quant_parser.add_argument("--queries", type=int, default=100)
+
+    ingest_parser = subparsers.add_parser("ingest", help="bulk add_documents throughput")
+    ingest_parser.add_argument("--sizes", default="10000,50000")
+    ingest_parser.add_argument("--strategy", default="naive,hybrid")
+    ingest_parser.add_argument("--dim", type=int, default=384)
+    ingest_parser.add_argument("--batch-size", type=int, default=256)
+    ingest_parser.add_argument("--model", action="store_true", help="embed with the real SentenceTransformer model")
+
+    hybrid_parser = subparsers.add_parser("hybrid", help="hybrid_query stage latency, sequential versus parallel branches")
+    hybrid_parser.add_argument("--sizes", default="10000,100000")
+    hybrid_parser.add_argument("--dim", type=int, default=384)
+    hybrid_parser.add_argument("--k", type=int, default=5)
+    hybrid_parser.add_argument("--queries", type=int, default=50)
+    hybrid_parser.add_argument("--model", action="store_true", help="embed and rerank with the real models")
+
+    rerank_parser = subparsers.add_parser("rerank", help="reranker quality versus latency across backends and candidate counts")
+    rerank_parser.add_argument("--rerankers", default="cross_encoder:BAAI/bge-reranker-base,cross_encoder:cross-encoder/ms-marco-MiniLM-L-6-v2",
+                               help="comma-separated backend:model pairs; the first is the agreement reference")
+    rerank_parser.add_argument("--candidates", default="4,10,20")
+    rerank_parser.add_argument("--skip-margins", default="0,0.3")
+    rerank_parser.add_argument("--size", type=int, default=5000, help="synthetic corpus size")
+    rerank_parser.add_argument("--memory", default="", help="use a saved memory file (.pickle.gz or .memdb) instead")
+    rerank_parser.add_argument("--queries", type=int, default=50)
+    rerank_parser.add_argument("--k", type=int, default=5)
+    rerank_parser.add_argument("--max-length", type=int, default=256)
+
+    embed_parser = subparsers.add_parser("embed", help="embedding backend throughput and cosine agreement")
+    embed_parser.add_argument("--backends", default="sentence_transformers,onnx", help="the first is the agreement reference")
+    embed_parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    embed_parser.add_argument("--threads", type=int, default=0)
+    embed_parser.add_argument("--batch-size", type=int, default=32)
+    embed_parser.add_argument("--sentences", type=int, default=2000)
+
+    remote_parser = subparsers.add_parser("remote", help="remote embeddings client against the local stand-in server")
+    remote_parser.add_argument("--sentences", type=int, default=5000)
+    remote_parser.add_argument("--dim", type=int, default=384)
+    remote_parser.add_argument("--batch-size", type=int, default=64)
+    remote_parser.add_argument("--concurrency", default="1,4")
+    remote_parser.add_argument("--latency", type=float, default=0.02, help="simulated server latency per request (s)")
+
+    filter_parser = subparsers.add_parser("filter", help="time-filtered vector search versus full-corpus scoring")
+    filter_parser.add_argument("--size", type=int, default=100000)
+    filter_parser.add_argument("--dim", type=int, default=384)
+    filter_parser.add_argument("--queries", type=int, default=50)
+    filter_parser.add_argument("--k", type=int, default=5)
+    filter_parser.add_argument("--windows", default="0.001,0.01,0.1,0.5")
+
+    segments_parser = subparsers.add_parser("segments", help="flat memory versus hot + sealed memory-mapped segments")
+    segments_parser.add_argument("--size", type=int, default=100000)
+    segments_parser.add_argument("--segment-size", type=int, default=10000)
+    segments_parser.add_argument("--storage", default="int8", choices=["float32", "float16", "int8"])
+    segments_parser.add_argument("--dim", type=int, default=384)
+    segments_parser.add_argument("--queries", type=int, default=50)
+    segments_parser.add_argument("--k", type=int, default=5)
+
+    dedup_parser = subparsers.add_parser("dedup", help="insert-time near-duplicate suppression throughput and recall")
+    dedup_parser.add_argument("--size", type=int, default=50000)
+    dedup_parser.add_argument("--dim", type=int, default=384)
+    dedup_parser.add_argument("--duplicates", type=float, default=0.2, help="fraction of memories that copy an earlier one")
+    dedup_parser.add_argument("--similarity", type=float, default=0.98, help="cosine similarity of a copy to its original")
+    dedup_parser.add_argument("--thresholds", default="0.95,0.97")
+    dedup_parser.add_argument("--batch-sizes", default="1,256,50000")
+
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
@@ -116,5 +116,6 @@ if __name__ == "__main__":
 
     finally:
         stt_manager.stop()
+        memory_manager.close()  # Write queued memories before exiting
         bt_controller_thread.join()
         queue_message(f"INFO: All threads and executor stopped gracefully.")
\ No newline at end of file
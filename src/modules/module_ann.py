@@ -0,0 +1,200 @@
+"""
+module_ann.py
+
+Approximate Nearest-Neighbour Index for TARS-AI HyperDB.
+
+Implements an IVF-flat index in NumPy: vectors are partitioned into `nlist`
+k-means cells, and a query only scores the rows in its `nprobe` closest cells
+instead of the whole memory. Rows keep the same numbering as HyperDB.vectors so
+results can be used directly as document indices.
+"""
+
+# === Standard Libraries ===
+import math
+import threading
+from array import array
+
+import numpy as np
+
+from modules.module_messageQue import queue_message
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+class IVFFlatIndex:
+    """
+    Inverted-file index with exact (flat) scoring inside the probed cells.
+
+    Recall/latency are tuned with `nprobe` (more cells scored = higher recall)
+    and `nlist` (0 = about sqrt(N) cells). Below `exact_threshold` rows the
+    index stays untrained and `search` returns None so the caller falls back to
+    brute force.
+    """
+    def __init__(
+        self,
+        metric: str = "cosine",
+        nlist: int = 0,
+        nprobe: int = 8,
+        exact_threshold: int = 10000,
+        train_iters: int = 10,
+        retrain_factor: float = 4.0,
+        seed: int = 0,
+    ):
+        if metric not in ("cosine", "dot"):
+            raise ValueError("IVFFlatIndex supports only 'cosine' and 'dot' metrics.")
+        self.metric = metric
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.exact_threshold = exact_threshold
+        self.train_iters = train_iters
+        self.retrain_factor = retrain_factor
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.RLock()
+
+        self.centroids = None   # (nlist, d), unit-normalized
+        self._lists = []        # cell -> array('q') of rows
+        self._assign = array("i")  # row -> cell
+        self._trained_size = 0
+
+    def __len__(self):
+        return len(self._assign)
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    def _prepare(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return _normalize_rows(vectors) if self.metric == "cosine" else vectors
+
+    def _nearest_cells(self, vectors: np.ndarray, block: int = 8192) -> np.ndarray:
+        """Nearest centroid (by inner product) for each row, in blocks to bound memory."""
+        cells = np.empty(vectors.shape[0], dtype=np.int32)
+        for start in range(0, vectors.shape[0], block):
+            chunk = self._prepare(vectors[start:start + block])
+            cells[start:start + block] = np.argmax(chunk @ self.centroids.T, axis=1)
+        return cells
+
+    def _train(self, vectors: np.ndarray):
+        """Spherical k-means on a sample of the vectors."""
+        n = vectors.shape[0]
+        nlist = self.nlist or int(np.clip(round(math.sqrt(n)), 8, 1024))
+        nlist = min(nlist, n)
+        sample_size = min(n, nlist * 64)
+        sample = self._prepare(vectors[np.sort(self._rng.choice(n, size=sample_size, replace=False))])
+
+        centroids = sample[self._rng.choice(sample_size, size=nlist, replace=False)].copy()
+        for _ in range(self.train_iters):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            counts = np.bincount(assignment, minlength=nlist)
+            empty = counts == 0
+            if empty.any():
+                # Re-seed empty cells with random sample points
+                sums[empty] = sample[self._rng.choice(sample_size, size=int(empty.sum()), replace=False)]
+            centroids = _normalize_rows(sums)
+        self.centroids = centroids.astype(np.float32)
+
+    def build(self, vectors):
+        """
+        (Re)build the index over all rows of `vectors`.
+
+        Parameters:
+        - vectors (np.ndarray): (N, d) matrix, row i = document i.
+        """
+        with self._lock:
+            n = 0 if vectors is None else vectors.shape[0]
+            self.centroids = None
+            self._lists = []
+            self._assign = array("i", bytes(4 * n)) if n else array("i")
+            self._trained_size = 0
+            if n < self.exact_threshold:
+                return
+
+            self._train(vectors)
+            cells = self._nearest_cells(vectors)
+            self._assign = array("i", cells.tobytes())
+            order = np.argsort(cells, kind="stable")
+            bounds = np.searchsorted(cells[order], np.arange(self.centroids.shape[0] + 1))
+            self._lists = [array("q", order[bounds[c]:bounds[c + 1]].astype(np.int64).tobytes()) for c in range(self.centroids.shape[0])]
+            self._trained_size = n
+            queue_message(f"INFO: Built IVF index with {self.centroids.shape[0]} cells over {n} vectors")
+
+    def add_many(self, new_vectors, vectors=None):
+        """
+        Index a block of vectors appended as the next rows, assigning cells in one pass.
+
+        Parameters:
+        - new_vectors (np.ndarray): (M, d) new rows.
+        - vectors (np.ndarray, optional): All rows including the new ones; when given,
+          the index (re)trains once the corpus crosses `exact_threshold` or outgrows
+          its training set by `retrain_factor`.
+        """
+        with self._lock:
+            first = len(self._assign)
+            total = first + new_vectors.shape[0]
+            if vectors is not None and (
+                (not self.trained and total >= self.exact_threshold)
+                or (self.trained and total >= self._trained_size * self.retrain_factor)
+            ):
+                self.build(vectors)
+                return
+            if not self.trained:
+                self._assign.extend(array("i", bytes(4 * new_vectors.shape[0])))
+                return
+            cells = self._nearest_cells(np.asarray(new_vectors, dtype=np.float32))
+            self._assign.extend(array("i", cells.astype(np.int32).tobytes()))
+            for row, cell in zip(range(first, total), cells.tolist()):
+                self._lists[cell].append(row)
+
+    def compact(self, keep):
+        """
+        Drop every row where `keep` is False in one pass; later rows shift up, no retraining.
+
+        Parameters:
+        - keep (np.ndarray): Boolean mask over the current rows.
+        """
+        with self._lock:
+            keep = np.asarray(keep, dtype=bool)
+            self._assign = array("i", np.array(self._assign, dtype=np.int32)[keep].tobytes())
+            if not self.trained:
+                return
+            new_rows = np.cumsum(keep) - 1
+            for c, rows in enumerate(self._lists):
+                members = np.array(rows, dtype=np.int64)
+                self._lists[c] = array("q", new_rows[members[keep[members]]].astype(np.int64).tobytes())
+
+    def search(self, vectors: np.ndarray, query_vector: np.ndarray, top_k: int = 5, exclude=None):
+        """
+        Approximate top-k rows for a query.
+
+        Parameters:
+        - vectors (np.ndarray): (N, d) matrix the index was built over.
+        - query_vector (np.ndarray): Query embedding.
+        - top_k (int): Number of results.
+        - exclude (np.ndarray, optional): Boolean mask of rows to skip (e.g. deleted rows).
+
+        Returns:
+        - tuple or None: (rows, scores) like hyper_SVM_ranking_algorithm_sort, or None
+          when the index is untrained or probed too few rows (use exact search).
+        """
+        with self._lock:
+            if not self.trained:
+                return None
+            query = self._prepare(np.asarray(query_vector, dtype=np.float32).reshape(1, -1))[0]
+            nprobe = min(self.nprobe, self.centroids.shape[0])
+            cell_scores = self.centroids @ query
+            probe = np.argpartition(-cell_scores, nprobe - 1)[:nprobe]
+            candidates = np.concatenate([np.array(self._lists[c], dtype=np.int64) for c in probe])
+
+        if exclude is not None:
+            candidates = candidates[~exclude[candidates]]
+        if candidates.shape[0] < top_k:
+            return None
+        scores = self._prepare(vectors[candidates]) @ query
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return candidates[top], scores[top]
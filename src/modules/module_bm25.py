@@ -0,0 +1,333 @@
+"""
+module_bm25.py
+
+Incremental BM25 Index for TARS-AI HyperDB.
+
+Keeps an inverted index (term -> postings) that can be appended to one document
+at a time, instead of re-tokenizing and re-indexing the whole corpus with
+`bm25s.BM25.index` on every memory write. Scores use the same Lucene BM25
+formulas as `bm25s.BM25(method="lucene")` but are evaluated lazily at query time
+from live document-frequency and average-length statistics, so they always
+match a full rebuild.
+"""
+
+# === Standard Libraries ===
+import math
+import threading
+from array import array
+from collections import Counter
+
+import numpy as np
+
+from modules.module_messageQue import queue_message
+
+class IncrementalBM25:
+    """
+    Append-friendly BM25 (Lucene variant) over pre-tokenized documents.
+
+    Documents are addressed by row (their position in HyperDB.documents). Each
+    document also gets an internal id used by the postings lists; removing a row
+    only marks its id dead and adjusts the statistics. Dead postings ("drift")
+    are compacted away once they exceed `rebuild_threshold` of all ids,
+    optionally on a background thread.
+
+    `delete` tombstones rows without shifting later rows (matching HyperDB's
+    tombstone deletion); `compact` later drops the tombstoned rows.
+    """
+    def __init__(self, k1: float = 1.5, b: float = 0.75, rebuild_threshold: float = 0.25, background_rebuild: bool = True):
+        self.k1 = k1
+        self.b = b
+        self.rebuild_threshold = rebuild_threshold
+        self.background_rebuild = background_rebuild
+
+        self._lock = threading.RLock()
+        self._rebuild_thread = None
+        self._reset()
+
+    def _reset(self):
+        self._postings = {}      # term -> (array('q') ids, array('f') term frequencies)
+        self._df = Counter()     # term -> number of live documents containing it
+        self._doc_terms = []     # id -> (terms, tfs) kept for compaction
+        self._doc_len = np.empty(64, dtype=np.float32)
+        self._alive = np.empty(64, dtype=bool)
+        self._rows = np.empty(64, dtype=np.int64)  # row -> id
+        self._num_ids = 0
+        self._num_rows = 0
+        self._num_live = 0       # rows whose document is not deleted
+        self._total_len = 0
+        self._identity = True    # True while row == id for every row
+        self._version = 0
+
+    def __len__(self):
+        return self._num_rows
+
+    @property
+    def drift(self) -> float:
+        """Fraction of ids in the postings lists that belong to removed documents."""
+        if not self._num_ids:
+            return 0.0
+        return 1.0 - self._num_live / self._num_ids
+
+    def _grow(self, ids: int):
+        """Double the per-id and per-row buffers until they can hold `ids` entries."""
+        capacity = self._doc_len.shape[0]
+        if ids <= capacity:
+            return
+        capacity = max(ids, capacity * 2)
+        for name in ("_doc_len", "_alive", "_rows"):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:old.shape[0]] = old
+            setattr(self, name, new)
+
+    def _add_locked(self, tokens):
+        doc_id = self._num_ids
+        self._grow(doc_id + 1)
+
+        counts = Counter(tokens)
+        terms = tuple(counts.keys())
+        tfs = tuple(counts.values())
+        for term, tf in zip(terms, tfs):
+            posting = self._postings.get(term)
+            if posting is None:
+                posting = self._postings[term] = (array("q"), array("f"))
+            posting[0].append(doc_id)
+            posting[1].append(tf)
+            self._df[term] += 1
+
+        self._doc_terms.append((terms, tfs))
+        self._doc_len[doc_id] = len(tokens)
+        self._alive[doc_id] = True
+        self._rows[self._num_rows] = doc_id
+        self._num_ids += 1
+        self._num_rows += 1
+        self._num_live += 1
+        self._total_len += len(tokens)
+        self._version += 1
+
+    def add(self, tokens):
+        """
+        Append one tokenized document as the next row.
+
+        Parameters:
+        - tokens (list[str]): Tokens (already stemmed / stopword-filtered) of the document.
+        """
+        with self._lock:
+            self._add_locked(tokens)
+
+    def add_many(self, corpus_tokens):
+        """
+        Append several tokenized documents as consecutive rows.
+
+        Parameters:
+        - corpus_tokens (list[list[str]]): One token list per document.
+        """
+        with self._lock:
+            for tokens in corpus_tokens:
+                self._add_locked(tokens)
+
+    def remove(self, row: int):
+        """
+        Remove the document at `row`; later rows shift up by one, like list.pop.
+
+        Parameters:
+        - row (int): Row of the document to remove.
+        """
+        with self._lock:
+            if row < 0:
+                row += self._num_rows
+            if not 0 <= row < self._num_rows:
+                raise IndexError("BM25 row index out of range")
+
+            doc_id = int(self._rows[row])
+            self._rows[row:self._num_rows - 1] = self._rows[row + 1:self._num_rows]
+            self._num_rows -= 1
+            self._identity = False
+            self._kill_locked(doc_id)
+            self._version += 1
+
+        if self.drift > self.rebuild_threshold:
+            self.rebuild(background=self.background_rebuild)
+
+    def _kill_locked(self, doc_id: int):
+        """Mark an id dead and take it out of the statistics."""
+        if not self._alive[doc_id]:
+            return
+        self._alive[doc_id] = False
+        self._num_live -= 1
+        self._total_len -= int(self._doc_len[doc_id])
+        for term in self._doc_terms[doc_id][0]:
+            self._df[term] -= 1
+
+    def delete(self, rows):
+        """
+        Tombstone documents without shifting later rows; they score 0 and are never retrieved.
+
+        Parameters:
+        - rows (iterable[int]): Rows of the documents to delete.
+        """
+        with self._lock:
+            for row in rows:
+                if not 0 <= row < self._num_rows:
+                    raise IndexError("BM25 row index out of range")
+                self._kill_locked(int(self._rows[row]))
+            self._version += 1
+
+    def compact(self):
+        """
+        Drop tombstoned rows (later rows shift up, keeping their order), then rebuild
+        the postings lists if drift exceeds `rebuild_threshold`.
+        """
+        with self._lock:
+            if self._num_live == self._num_rows:
+                return
+            live = self._rows[:self._num_rows][self._alive[self._rows[:self._num_rows]]]
+            self._rows[:live.shape[0]] = live
+            self._num_rows = live.shape[0]
+            self._identity = False
+            self._version += 1
+
+        if self.drift > self.rebuild_threshold:
+            self.rebuild(background=self.background_rebuild)
+
+    def _build(self, row_terms):
+        """Build fresh index state (ids == rows) from per-row (terms, tfs, alive)."""
+        fresh = IncrementalBM25(self.k1, self.b, self.rebuild_threshold, self.background_rebuild)
+        for terms, tfs, alive in row_terms:
+            doc_id = fresh._num_ids
+            fresh._grow(doc_id + 1)
+            if not alive:
+                # Tombstoned row: keep its position, drop its postings
+                fresh._doc_terms.append(((), ()))
+                fresh._doc_len[doc_id] = 0
+                fresh._alive[doc_id] = False
+                fresh._rows[doc_id] = doc_id
+                fresh._num_ids += 1
+                fresh._num_rows += 1
+                continue
+            length = 0
+            for term, tf in zip(terms, tfs):
+                posting = fresh._postings.get(term)
+                if posting is None:
+                    posting = fresh._postings[term] = (array("q"), array("f"))
+                posting[0].append(doc_id)
+                posting[1].append(tf)
+                fresh._df[term] += 1
+                length += tf
+            fresh._doc_terms.append((terms, tfs))
+            fresh._doc_len[doc_id] = length
+            fresh._alive[doc_id] = True
+            fresh._rows[doc_id] = doc_id
+            fresh._num_ids += 1
+            fresh._num_rows += 1
+            fresh._num_live += 1
+            fresh._total_len += length
+        return fresh
+
+    def _swap_in(self, fresh):
+        for name in ("_postings", "_df", "_doc_terms", "_doc_len", "_alive", "_rows",
+                     "_num_ids", "_num_rows", "_num_live", "_total_len", "_identity"):
+            setattr(self, name, getattr(fresh, name))
+        self._version += 1
+
+    def rebuild(self, background: bool = False):
+        """
+        Compact the postings lists, dropping removed documents and renumbering ids to rows.
+
+        Parameters:
+        - background (bool): Build on a worker thread and swap in the result only if
+          no add/remove happened meanwhile (otherwise the next removal retries).
+        """
+        with self._lock:
+            if self._rebuild_thread is not None and self._rebuild_thread.is_alive():
+                return
+            version = self._version
+            row_terms = [self._doc_terms[doc_id] + (bool(self._alive[doc_id]),) for doc_id in self._rows[:self._num_rows]]
+
+        def _run():
+            fresh = self._build(row_terms)
+            with self._lock:
+                if self._version == version:
+                    self._swap_in(fresh)
+                elif not background:
+                    raise RuntimeError("BM25 index changed during rebuild")
+
+        if background:
+            self._rebuild_thread = threading.Thread(target=self._run_background, args=(_run,), daemon=True)
+            self._rebuild_thread.start()
+        else:
+            with self._lock:
+                _run()
+
+    @staticmethod
+    def _run_background(task):
+        try:
+            task()
+        except Exception as e:
+            queue_message(f"WARNING: Background BM25 rebuild failed: {e}")
+
+    def get_scores(self, query_tokens) -> np.ndarray:
+        """
+        BM25 score of every row for one tokenized query.
+
+        Parameters:
+        - query_tokens (list[str]): Query tokens, processed like the corpus tokens.
+
+        Returns:
+        - np.ndarray: float32 scores, one per row.
+        """
+        with self._lock:
+            scores = np.zeros(self._num_ids, dtype=np.float32)
+            if self._num_live:
+                avg_len = self._total_len / self._num_live
+                doc_len = self._doc_len[:self._num_ids]
+                for term in query_tokens:
+                    df = self._df.get(term, 0)
+                    if df <= 0:
+                        continue
+                    ids, tfs = self._postings[term]
+                    ids = np.array(ids, dtype=np.int64)
+                    tfs = np.array(tfs, dtype=np.float32)
+                    idf = math.log(1 + (self._num_live - df + 0.5) / (df + 0.5))
+                    norm = self.k1 * ((1 - self.b) + self.b * doc_len[ids] / avg_len)
+                    scores[ids] += idf * tfs / (norm + tfs)
+                if self._num_live != self._num_ids:
+                    scores[~self._alive[:self._num_ids]] = 0.0
+
+            if self._identity:
+                return scores
+            return scores[self._rows[:self._num_rows]]
+
+    def retrieve(self, queries_tokens, k: int = 10, weight_mask=None):
+        """
+        Top-k rows for each query, shaped like `bm25s.BM25.retrieve` output.
+
+        Parameters:
+        - queries_tokens (list[list[str]]): One token list per query.
+        - k (int): Number of rows to return per query.
+        - weight_mask (np.ndarray, optional): Per-row score weights, as in bm25s; rows
+          weighted 0 are never returned (except as padding when fewer than k rows remain).
+
+        Returns:
+        - tuple: (rows, scores), each an array of shape (len(queries_tokens), k).
+          Tombstoned rows are never returned.
+        """
+        k = min(k, self._num_live)
+        all_rows = np.zeros((len(queries_tokens), k), dtype=np.int64)
+        all_scores = np.zeros((len(queries_tokens), k), dtype=np.float32)
+        for i, query_tokens in enumerate(queries_tokens):
+            with self._lock:
+                scores = self.get_scores(query_tokens)
+                if weight_mask is not None:
+                    scores *= weight_mask[:scores.shape[0]]
+                    scores[weight_mask[:scores.shape[0]] == 0] = -np.inf
+                if self._num_live != self._num_rows:
+                    scores[~self._alive[self._rows[:self._num_rows]]] = -np.inf
+            k = min(k, scores.shape[0])
+            if k == 0:
+                continue
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind="stable")]
+            all_rows[i, :k] = top
+            all_scores[i, :k] = scores[top]
+        return all_rows, all_scores
@@ -0,0 +1,117 @@
+"""
+module_cache.py
+
+Bounded LRU cache for TARS-AI retrieval.
+
+Used by HyperDB to avoid re-encoding repeated queries (wake-word phrases, repeated
+questions) and re-running the reranker on (query, document) pairs it has already
+scored. Size is bounded in megabytes rather than entry count, and hit/miss
+counters are kept so the cache can be tuned from the logs.
+"""
+
+# === Standard Libraries ===
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+def estimate_size(key, value) -> int:
+    """Approximate memory footprint in bytes of a cache entry."""
+    size = sys.getsizeof(key)
+    if isinstance(key, tuple):
+        size += sum(sys.getsizeof(part) for part in key)
+    if isinstance(value, np.ndarray):
+        size += value.nbytes + 112
+    else:
+        size += sys.getsizeof(value)
+    return size + 64  # OrderedDict node overhead
+
+def normalize_query(text: str) -> str:
+    """Cache key form of a query: lower-cased with whitespace collapsed."""
+    return " ".join(str(text).lower().split())
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache bounded by approximate size in MB.
+
+    A `max_mb` of 0 disables the cache (every lookup misses, nothing is stored).
+    """
+    def __init__(self, max_mb: float, sizeof=estimate_size):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.sizeof = sizeof
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key, default=None):
+        """Return the cached value for key (marking it recently used), or default."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """Store a value, evicting least recently used entries to stay under max_mb."""
+        if self.max_bytes <= 0:
+            return
+        size = self.sizeof(key, value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def invalidate(self, predicate):
+        """
+        Drop every entry whose key matches predicate.
+
+        Parameters:
+        - predicate (callable): Called with each key; True means drop it.
+
+        Returns:
+        - int: Number of entries dropped.
+        """
+        with self._lock:
+            stale = [key for key in self._entries if predicate(key)]
+            for key in stale:
+                self._bytes -= self._entries.pop(key)[1]
+            return len(stale)
+
+    def clear(self):
+        """Drop all entries (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "size_mb": self._bytes / (1024 * 1024),
+                "max_mb": self.max_bytes / (1024 * 1024),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
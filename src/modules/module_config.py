@@ -165,6 +165,8 @@ def load_config():
             "api_key": get_api_key(config['LLM']['llm_backend']),
             "openai_model": config['LLM']['openai_model'],
             "override_encoding_model": config['LLM']['override_encoding_model'],
+            "local_tokenizer_path": config.get('LLM', 'local_tokenizer_path', fallback=''),
+            "tokenizer_crosscheck_every": config.getint('LLM', 'tokenizer_crosscheck_every', fallback=0),
             "contextsize": int(config['LLM']['contextsize']),
             "max_tokens": int(config['LLM']['max_tokens']),
             "temperature": float(config['LLM']['temperature']),
@@ -204,6 +206,43 @@ def load_config():
             "strategy": config.get('RAG', 'strategy', fallback='naive'),
             "vector_weight": config.getfloat('RAG', 'vector_weight', fallback=0.5),
             "top_k": config.getint('RAG', 'top_k', fallback=5),
+            "bm25_mode": config.get('RAG', 'bm25_mode', fallback='incremental'),
+            "bm25_rebuild_threshold": config.getfloat('RAG', 'bm25_rebuild_threshold', fallback=0.25),
+            "wal_fsync_every": config.getint('RAG', 'wal_fsync_every', fallback=8),
+            "wal_compact_every": config.getint('RAG', 'wal_compact_every', fallback=256),
+            "storage_format": config.get('RAG', 'storage_format', fallback='pickle'),
+            "segment_size": config.getint('RAG', 'segment_size', fallback=0),
+            "segment_storage": config.get('RAG', 'segment_storage', fallback='int8'),
+            "index_type": config.get('RAG', 'index_type', fallback='exact'),
+            "ann_nlist": config.getint('RAG', 'ann_nlist', fallback=0),
+            "ann_nprobe": config.getint('RAG', 'ann_nprobe', fallback=8),
+            "ann_exact_threshold": config.getint('RAG', 'ann_exact_threshold', fallback=10000),
+            "embedding_cache_mb": config.getfloat('RAG', 'embedding_cache_mb', fallback=8),
+            "rerank_cache_mb": config.getfloat('RAG', 'rerank_cache_mb', fallback=2),
+            "vector_storage": config.get('RAG', 'vector_storage', fallback='float32'),
+            "rescore_factor": config.getint('RAG', 'rescore_factor', fallback=4),
+            "compact_threshold": config.getfloat('RAG', 'compact_threshold', fallback=0.25),
+            "dedup_threshold": config.getfloat('RAG', 'dedup_threshold', fallback=0.0),
+            "dedup_mode": config.get('RAG', 'dedup_mode', fallback='merge'),
+            "dedup_kinds": config.get('RAG', 'dedup_kinds', fallback='tool,text'),
+            "embed_batch_size": config.getint('RAG', 'embed_batch_size', fallback=256),
+            "memory_write_delay": config.getfloat('RAG', 'memory_write_delay', fallback=0.25),
+            "memory_write_batch": config.getint('RAG', 'memory_write_batch', fallback=64),
+            "parallel_hybrid": config.getboolean('RAG', 'parallel_hybrid', fallback=True),
+            "log_query_timings": config.getboolean('RAG', 'log_query_timings', fallback=False),
+            "reranker_backend": config.get('RAG', 'reranker_backend', fallback='cross_encoder'),
+            "reranker_model": config.get('RAG', 'reranker_model', fallback='BAAI/bge-reranker-base'),
+            "reranker_max_length": config.getint('RAG', 'reranker_max_length', fallback=256),
+            "rerank_candidates": config.getint('RAG', 'rerank_candidates', fallback=0),
+            "rerank_skip_margin": config.getfloat('RAG', 'rerank_skip_margin', fallback=0.0),
+            "embedding_backend": config.get('RAG', 'embedding_backend', fallback='sentence_transformers'),
+            "embedding_model": config.get('RAG', 'embedding_model', fallback='sentence-transformers/all-MiniLM-L6-v2'),
+            "embedding_threads": config.getint('RAG', 'embedding_threads', fallback=0),
+            "embedding_warmup": config.getboolean('RAG', 'embedding_warmup', fallback=True),
+            "embedding_base_url": config.get('RAG', 'embedding_base_url', fallback=''),
+            "embedding_max_batch_chars": config.getint('RAG', 'embedding_max_batch_chars', fallback=32000),
+            "embedding_concurrency": config.getint('RAG', 'embedding_concurrency', fallback=4),
+            "embedding_timeout": config.getfloat('RAG', 'embedding_timeout', fallback=30.0),
         },
         "HOME_ASSISTANT": {
             "enabled": config['HOME_ASSISTANT']['enabled'],
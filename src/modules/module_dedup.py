@@ -0,0 +1,147 @@
+"""
+module_dedup.py
+
+Near-duplicate detection for TARS-AI HyperDB inserts.
+
+Repeated tool notes ("processing..."), wake-word replies and greetings are stored
+as near-identical memories that inflate the index and crowd top-k results.
+SimHashIndex signs each embedding against random hyperplanes (random-hyperplane
+LSH, i.e. SimHash over embeddings): vectors at a small angle agree on most bits.
+Signatures are split into bands, and rows sharing any band value become candidate
+duplicates, which are then confirmed with exact cosine similarity. A batch of new
+vectors is signed with one matrix product and checked against the stored rows
+with one gathered dot product, then against itself in a single greedy pass.
+"""
+
+# === Standard Libraries ===
+from collections import defaultdict
+
+import numpy as np
+
+# Document field holding the suppressed-duplicate counter of a surviving memory
+DEDUP_KEY = "dedup"
+
+class SimHashIndex:
+    """
+    Banded random-hyperplane LSH over stored rows.
+
+    With `bits` hyperplanes split into `bands` bands, two vectors at angle theta
+    share a given band with probability (1 - theta / pi) ** (bits / bands). With the
+    default 128 bits in 8 bands, pairs at cosine 0.98 share a band ~97% of the time
+    (0.99: ~99.5%), while unrelated vectors collide with probability ~1e-4, so
+    candidate lists stay short even for large imports.
+    """
+    def __init__(self, dim: int, bits: int = 128, bands: int = 8, seed: int = 0):
+        if bits % bands or bits // bands > 64:
+            raise ValueError("bits must split into bands of at most 64 bits")
+        self.dim = dim
+        self.bits = bits
+        self.bands = bands
+        self.band_bits = bits // bands
+        self.planes = np.random.default_rng(seed).standard_normal((dim, bits)).astype(np.float32)
+        self._weights = (1 << np.arange(self.band_bits, dtype=np.uint64)).astype(np.uint64)
+        # Indexed rows and their band keys (first _size entries; capacity grows by doubling)
+        self._size = 0
+        self._rows = np.empty(64, dtype=np.int64)
+        self._keys = np.empty((64, bands), dtype=np.uint64)
+        self._buckets = [defaultdict(list) for _ in range(bands)]
+
+    def __len__(self):
+        return self._size
+
+    def band_keys(self, vectors, block: int = 65536) -> np.ndarray:
+        """(M, bands) uint64 band values of the signatures of an (M, d) matrix."""
+        vectors = np.asarray(vectors)
+        keys = np.empty((vectors.shape[0], self.bands), dtype=np.uint64)
+        for start in range(0, vectors.shape[0], block):
+            signs = np.asarray(vectors[start:start + block], dtype=np.float32) @ self.planes > 0
+            signs = signs.reshape(-1, self.bands, self.band_bits).astype(np.uint64)
+            keys[start:start + block] = (signs * self._weights).sum(axis=2, dtype=np.uint64)
+        return keys
+
+    def add(self, rows, keys):
+        """Index rows with their band keys (from band_keys)."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if not rows.size:
+            return
+        stop = self._size + rows.shape[0]
+        if stop > self._rows.shape[0]:
+            capacity = max(stop, self._rows.shape[0] * 2)
+            grown_rows = np.empty(capacity, dtype=np.int64)
+            grown_keys = np.empty((capacity, self.bands), dtype=np.uint64)
+            grown_rows[:self._size] = self._rows[:self._size]
+            grown_keys[:self._size] = self._keys[:self._size]
+            self._rows, self._keys = grown_rows, grown_keys
+        self._rows[self._size:stop] = rows
+        self._keys[self._size:stop] = keys
+        self._size = stop
+        self._index(rows, keys)
+
+    def _index(self, rows, keys):
+        for band, buckets in enumerate(self._buckets):
+            for row, key in zip(rows.tolist(), keys[:, band].tolist()):
+                buckets[key].append(row)
+
+    def candidates(self, keys) -> list:
+        """Indexed rows sharing at least one band with each signature, as one int64 array per signature."""
+        found = []
+        for signature in keys.tolist():
+            rows = set()
+            for buckets, key in zip(self._buckets, signature):
+                rows.update(buckets.get(key, ()))
+            found.append(np.fromiter(rows, dtype=np.int64, count=len(rows)))
+        return found
+
+    def batch_duplicates(self, keys, units, threshold: float, resolved=None) -> np.ndarray:
+        """
+        Match a batch against itself, in batch order, as if it were inserted one by one.
+
+        Each entry is checked only against earlier entries that were kept, so many
+        copies of one memory cost one comparison each rather than one per pair.
+
+        Parameters:
+        - keys (np.ndarray): (M, bands) band keys of the batch (from band_keys).
+        - units (np.ndarray): (M, d) unit-normalized vectors of the batch.
+        - threshold (float): Cosine similarity at or above which an entry is a duplicate.
+        - resolved (np.ndarray, optional): Boolean mask of entries already known to be
+          duplicates (e.g. of stored rows); they are neither checked nor matched against.
+
+        Returns:
+        - np.ndarray: Batch position of the kept entry each entry duplicates, or -1.
+        """
+        matches = np.full(keys.shape[0], -1, dtype=np.int64)
+        buckets = [{} for _ in range(self.bands)]
+        for item, signature in enumerate(keys.tolist()):
+            if resolved is not None and resolved[item]:
+                continue
+            found = set()
+            for band, key in zip(buckets, signature):
+                found.update(band.get(key, ()))
+            if found:
+                earlier = np.fromiter(found, dtype=np.int64, count=len(found))
+                similarities = units[earlier] @ units[item]
+                best = int(np.argmax(similarities))
+                if similarities[best] >= threshold:
+                    matches[item] = earlier[best]
+                    continue
+            for band, key in zip(buckets, signature):
+                band.setdefault(key, []).append(item)
+        return matches
+
+    def compact(self, keep):
+        """
+        Follow a storage compaction: drop rows where `keep` is False and renumber the rest.
+
+        Parameters:
+        - keep (np.ndarray): Boolean mask over the rows before compaction.
+        """
+        keep = np.asarray(keep, dtype=bool)
+        rows = self._rows[:self._size]
+        alive = rows < keep.shape[0]
+        alive[alive] = keep[rows[alive]]
+        kept = int(np.count_nonzero(alive))
+        self._rows[:kept] = (np.cumsum(keep) - 1)[rows[alive]]
+        self._keys[:kept] = self._keys[:self._size][alive]
+        self._size = kept
+        self._buckets = [defaultdict(list) for _ in range(self.bands)]
+        self._index(self._rows[:kept], self._keys[:kept])
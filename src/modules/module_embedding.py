@@ -0,0 +1,313 @@
+"""
+module_embedding.py
+
+Embedding providers for TARS-AI HyperDB.
+
+The sentence encoder used for memory vectors is loaded on first use rather than
+when HyperDB is imported, and can run either in PyTorch through
+sentence-transformers or as an int8-quantized ONNX export with ONNX Runtime
+(faster on CPU-only devices such as a Raspberry Pi, with a configurable thread
+count), or remotely through an OpenAI-compatible /v1/embeddings endpoint. One
+process-wide provider is shared by every HyperDB; configure it with
+configure_provider() before the first embedding is computed.
+"""
+
+# === Standard Libraries ===
+import os
+import base64
+import threading
+import concurrent.futures
+
+import numpy as np
+
+from modules.module_messageQue import queue_message
+from modules.module_reranker import find_onnx_model
+
+EMBEDDING_BACKENDS = ("sentence_transformers", "onnx", "remote")
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+class EmbeddingProvider:
+    """
+    Lazily loaded sentence encoder.
+
+    Subclasses implement _load() and _encode(texts); the model is loaded, once and
+    thread-safely, by the first encode() or warmup() call.
+    """
+    backend = None
+
+    def __init__(self, model: str = DEFAULT_EMBEDDING_MODEL, threads: int = 0, batch_size: int = 32):
+        self.model = model
+        self.threads = threads
+        self.batch_size = max(1, batch_size)
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if not self._loaded:
+                self._load()
+                self._loaded = True
+
+    def _load(self):
+        raise NotImplementedError
+
+    def _encode(self, texts) -> np.ndarray:
+        raise NotImplementedError
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def encode(self, texts) -> np.ndarray:
+        """
+        Embed texts.
+
+        Parameters:
+        - texts (str or list[str]): Text(s) to embed.
+
+        Returns:
+        - np.ndarray: (len(texts), d) float32 embeddings, or (d,) for a single string.
+        """
+        self._ensure_loaded()
+        single = isinstance(texts, str)
+        vectors = np.asarray(self._encode([texts] if single else list(texts)), dtype=np.float32)
+        return vectors[0] if single else vectors
+
+    def warmup(self):
+        """Load the model and run one short encode so the first real query pays no setup cost."""
+        self.encode(["warmup"])
+
+class SentenceTransformerProvider(EmbeddingProvider):
+    """sentence-transformers encoder running in PyTorch (float32) on the CPU."""
+    backend = "sentence_transformers"
+
+    def _load(self):
+        from sentence_transformers import SentenceTransformer
+        if self.threads:
+            import torch
+            torch.set_num_threads(self.threads)
+        self._model = SentenceTransformer(self.model, device='cpu')
+        queue_message(f"LOAD: Embedding model {self.model} loaded")
+
+    def _encode(self, texts) -> np.ndarray:
+        return self._model.encode(texts, batch_size=self.batch_size, show_progress_bar=False)
+
+class OnnxEmbeddingProvider(EmbeddingProvider):
+    """
+    Sentence-transformers model exported to ONNX, run with ONNX Runtime on int8 weights.
+
+    `model` is a local directory with an ONNX export plus tokenizer files, or a
+    HuggingFace repo id that ships one under `onnx/` (as sentence-transformers/all-MiniLM-L6-v2
+    does). Token embeddings are mean-pooled over the attention mask and
+    L2-normalized, matching the sentence-transformers pipeline of MiniLM-style models.
+    If onnxruntime or the export is unavailable, the same model is run with
+    sentence-transformers instead.
+    """
+    backend = "onnx"
+
+    def __init__(self, model: str = DEFAULT_EMBEDDING_MODEL, threads: int = 0, batch_size: int = 32, max_length: int = 256, normalize: bool = True):
+        super().__init__(model, threads, batch_size)
+        self.max_length = max_length
+        self.normalize = normalize
+
+    def _load(self):
+        self._fallback = None
+        try:
+            self._load_onnx()
+        except Exception as e:
+            queue_message(f"WARNING: Failed to load ONNX embedding model {self.model}: {e}. Falling back to sentence-transformers.")
+            self._fallback = SentenceTransformerProvider(self.model, self.threads, self.batch_size)
+            self._fallback._load()
+
+    def _load_onnx(self):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_dir = self.model
+        if not os.path.isdir(model_dir):
+            from huggingface_hub import snapshot_download
+            model_dir = snapshot_download(self.model, allow_patterns=["*.json", "*.txt", "*.model", "onnx/*"])
+
+        self.model_path = find_onnx_model(model_dir)
+        self._tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        options = ort.SessionOptions()
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+            options.inter_op_num_threads = 1
+        self._session = ort.InferenceSession(self.model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self._input_names = [model_input.name for model_input in self._session.get_inputs()]
+        queue_message(f"LOAD: ONNX int8 embedding model loaded from {self.model_path}")
+
+    def _encode(self, texts) -> np.ndarray:
+        if self._fallback is not None:
+            return self._fallback._encode(texts)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        # Batch texts of similar length together to minimize padding
+        order = np.argsort([len(text) for text in texts], kind="stable")
+        vectors = [None] * len(texts)
+        for offset in range(0, len(texts), self.batch_size):
+            batch = order[offset:offset + self.batch_size]
+            encoded = self._tokenizer(
+                [texts[i] for i in batch], padding=True, truncation=True,
+                max_length=self.max_length, return_tensors="np",
+            )
+            feeds = {name: encoded[name].astype(np.int64) for name in self._input_names if name in encoded}
+            token_embeddings = self._session.run(None, feeds)[0]
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            if self.normalize:
+                pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+            for i, vector in zip(batch, pooled):
+                vectors[i] = vector
+        return np.stack(vectors)
+
+def decode_embedding(value) -> np.ndarray:
+    """Embedding from an /v1/embeddings response item: base64 little-endian float32, or a list of floats."""
+    if isinstance(value, str):
+        return np.frombuffer(base64.b64decode(value), dtype="<f4").astype(np.float32, copy=False)
+    return np.asarray(value, dtype=np.float32)
+
+class RemoteEmbeddingProvider(EmbeddingProvider):
+    """
+    Client for an OpenAI-compatible /v1/embeddings endpoint (OpenAI, DeepInfra, ooba, llama.cpp, ...).
+
+    Texts are split into requests of at most `batch_size` inputs and `max_batch_chars`
+    characters, sent concurrently (up to `concurrency` in flight) over one keep-alive
+    session, and decoded straight into float32. Embeddings are requested base64
+    encoded, which is smaller to send and cheaper to parse than JSON floats;
+    servers that reject that format are asked for plain floats instead.
+    """
+    backend = "remote"
+
+    def __init__(
+        self,
+        model: str,
+        base_url: str,
+        api_key: str = "",
+        batch_size: int = 64,
+        max_batch_chars: int = 32000,
+        concurrency: int = 4,
+        timeout: float = 30.0,
+        encoding_format: str = "base64",
+        threads: int = 0,
+    ):
+        super().__init__(model, threads, batch_size)
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.max_batch_chars = max(1, max_batch_chars)
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.encoding_format = encoding_format
+        self.requests = 0
+
+    def _load(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(total=2, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=None)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency, max_retries=retry)
+        self._session = requests.Session()
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._session.headers["Content-Type"] = "application/json"
+        if self.api_key:
+            self._session.headers["Authorization"] = f"Bearer {self.api_key}"
+        self._url = f"{self.base_url}/v1/embeddings"
+        self._pool = None
+        if self.concurrency > 1:
+            self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="RemoteEmbedding")
+
+    def _spans(self, texts):
+        """(start, stop) ranges of texts per request, bounded by batch_size and max_batch_chars."""
+        start = chars = 0
+        for i, text in enumerate(texts):
+            if i > start and (i - start >= self.batch_size or chars + len(text) > self.max_batch_chars):
+                yield start, i
+                start, chars = i, 0
+            chars += len(text)
+        if start < len(texts):
+            yield start, len(texts)
+
+    def _request(self, texts) -> np.ndarray:
+        import requests
+
+        encoding_format = self.encoding_format
+        payload = {"model": self.model, "input": texts, "encoding_format": encoding_format}
+        response = self._session.post(self._url, json=payload, timeout=self.timeout)
+        self.requests += 1
+        if response.status_code in (400, 422) and encoding_format == "base64":
+            if self.encoding_format == "base64":
+                queue_message("INFO: Embedding server rejected base64 encoding; requesting float embeddings")
+                self.encoding_format = "float"
+            return self._request(texts)
+        response.raise_for_status()
+
+        data = response.json().get("data")
+        if not data or len(data) != len(texts):
+            raise requests.exceptions.RequestException(
+                f"embedding response has {len(data or [])} embeddings for {len(texts)} inputs"
+            )
+        data = sorted(data, key=lambda item: item.get("index", 0))
+        return np.stack([decode_embedding(item["embedding"]) for item in data])
+
+    def _encode(self, texts) -> np.ndarray:
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        spans = list(self._spans(texts))
+        if self._pool is None or len(spans) == 1:
+            return np.concatenate([self._request(texts[start:stop]) for start, stop in spans])
+        return np.concatenate(list(self._pool.map(lambda span: self._request(texts[span[0]:span[1]]), spans)))
+
+def load_embedding_provider(backend: str = "sentence_transformers", model: str = DEFAULT_EMBEDDING_MODEL, threads: int = 0, batch_size: int = 32, **options) -> EmbeddingProvider:
+    """
+    Create an (unloaded) embedding provider.
+
+    Parameters:
+    - backend (str): 'sentence_transformers', 'onnx' or 'remote'.
+    - model (str): Model name or local path (the server's model name for 'remote').
+    - threads (int): CPU threads for inference (0 = library default).
+    - batch_size (int): Texts per inference call or request.
+    - options: RemoteEmbeddingProvider settings (base_url, api_key, max_batch_chars,
+      concurrency, timeout) for the 'remote' backend.
+
+    Returns:
+    - EmbeddingProvider: Loads its model on first use.
+    """
+    backend = (backend or "sentence_transformers").lower()
+    if backend == "onnx":
+        return OnnxEmbeddingProvider(model, threads=threads, batch_size=batch_size)
+    if backend == "remote":
+        return RemoteEmbeddingProvider(model, threads=threads, batch_size=batch_size, **options)
+    if backend != "sentence_transformers":
+        queue_message(f"WARNING: Unknown embedding backend '{backend}', using sentence_transformers")
+    return SentenceTransformerProvider(model, threads=threads, batch_size=batch_size)
+
+_provider = None
+_provider_lock = threading.Lock()
+
+def configure_provider(backend: str = "sentence_transformers", model: str = DEFAULT_EMBEDDING_MODEL, threads: int = 0, batch_size: int = 32, **options) -> EmbeddingProvider:
+    """
+    Set the process-wide embedding provider (see load_embedding_provider).
+
+    Memories must be embedded with a single model, so changing the model of a
+    provider that has already produced embeddings is refused with a warning.
+    """
+    global _provider
+    with _provider_lock:
+        if _provider is not None and _provider.loaded and _provider.model != model:
+            queue_message(f"WARNING: Embedding model {_provider.model} is already in use; ignoring {model}")
+            return _provider
+        _provider = load_embedding_provider(backend, model, threads, batch_size, **options)
+        return _provider
+
+def get_provider() -> EmbeddingProvider:
+    """The process-wide embedding provider (sentence-transformers all-MiniLM-L6-v2 unless configured)."""
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            _provider = load_embedding_provider()
+        return _provider
@@ -0,0 +1,136 @@
+"""
+module_embedserver.py
+
+Local stand-in for an OpenAI-compatible embeddings server.
+
+Serves POST /v1/embeddings with deterministic pseudo-random unit vectors (seeded
+by a hash of each input), in float or base64 encoding, so RemoteEmbeddingProvider
+and the memory pipeline can be exercised and benchmarked without a real backend.
+Can also be run directly:
+
+    python -m modules.module_embedserver --port 8089 --latency 0.02
+"""
+
+# === Standard Libraries ===
+import json
+import time
+import zlib
+import base64
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+def stand_in_embedding(text: str, dim: int = 384) -> np.ndarray:
+    """Deterministic unit vector for a text."""
+    rng = np.random.default_rng(zlib.crc32(text.encode("utf-8")))
+    vector = rng.standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+class StandInEmbeddingServer:
+    """
+    Threaded HTTP server implementing POST /v1/embeddings.
+
+    Use as a context manager, or call start() / stop(). `latency` adds a fixed
+    delay per request; `max_inputs` rejects larger requests with 413; with
+    `support_base64=False` base64 requests are rejected with 400, like servers that
+    only return floats.
+    """
+    def __init__(self, dim: int = 384, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 max_inputs: int = None, support_base64: bool = True):
+        self.dim = dim
+        self.latency = latency
+        self.max_inputs = max_inputs
+        self.support_base64 = support_base64
+        self.requests = 0
+        self.inputs = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status: int, body: dict):
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path.rstrip("/") != "/v1/embeddings":
+                    return self._reply(404, {"error": "not found"})
+                inputs = request.get("input", [])
+                inputs = [inputs] if isinstance(inputs, str) else inputs
+                encoding = request.get("encoding_format", "float")
+                if server.max_inputs and len(inputs) > server.max_inputs:
+                    return self._reply(413, {"error": f"at most {server.max_inputs} inputs per request"})
+                if encoding == "base64" and not server.support_base64:
+                    return self._reply(400, {"error": "encoding_format base64 is not supported"})
+
+                with server._lock:
+                    server.requests += 1
+                    server.inputs += len(inputs)
+                if server.latency:
+                    time.sleep(server.latency)
+
+                data = []
+                for index, text in enumerate(inputs):
+                    vector = stand_in_embedding(text, server.dim)
+                    embedding = (
+                        base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii")
+                        if encoding == "base64" else vector.tolist()
+                    )
+                    data.append({"object": "embedding", "index": index, "embedding": embedding})
+                self._reply(200, {
+                    "object": "list",
+                    "data": data,
+                    "model": request.get("model", "stand-in"),
+                    "usage": {"prompt_tokens": sum(len(text.split()) for text in inputs), "total_tokens": 0},
+                })
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="StandInEmbeddingServer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+# === Main Application Logic ===
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stand-in OpenAI-compatible embeddings server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    args = parser.parse_args()
+
+    server = StandInEmbeddingServer(dim=args.dim, host=args.host, port=args.port, latency=args.latency)
+    print(f"Serving stand-in embeddings on {server.url}/v1/embeddings")
+    server._server.serve_forever()
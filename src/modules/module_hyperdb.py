@@ -19,72 +19,60 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
+import os
+import time
 import gzip
+import bisect
 import pickle
+import threading
+import functools
+import concurrent.futures
+from contextlib import contextmanager
+from itertools import islice
 import numpy as np
 import random
 import requests
 from typing import List, Union
 import bm25s
 import Stemmer
-from sentence_transformers import CrossEncoder
 import configparser
-import torch
 
 from modules.module_config import get_api_key
+from modules.module_bm25 import IncrementalBM25
+from modules.module_ann import IVFFlatIndex
+from modules.module_memstore import WriteAheadLog, atomic_write, save_mmap_snapshot, load_mmap_snapshot
+from modules.module_cache import LRUCache, normalize_query
+from modules.module_reranker import load_reranker
+from modules.module_metadata import MetadataColumns, document_kind
+from modules.module_dedup import SimHashIndex, DEDUP_KEY
+from modules.module_embedding import get_provider, RemoteEmbeddingProvider, DEFAULT_EMBEDDING_MODEL
 from modules.module_messageQue import queue_message
 
 config = configparser.ConfigParser()
 config.read('config.ini')
 
-def get_embedding_new(documents):
-    base_url = config.getboolean('LLM', 'base_url')  # Replace with your API base URL
-    api_key = get_api_key(config['LLM']['llm_backend'])
-    encoding_format = "text/plain"
-    
-    url = f"{base_url}/v1/embeddings"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}"
-    }
+_remote_embeddings = None
 
+def get_embedding_new(documents):
+    """
+    Embed documents with the LLM backend's OpenAI-compatible /v1/embeddings endpoint.
+
+    Returns:
+    - np.ndarray: (len(documents), d) float32 embeddings.
+    """
+    global _remote_embeddings
+    if _remote_embeddings is None:
+        _remote_embeddings = RemoteEmbeddingProvider(
+            model=config.get('RAG', 'embedding_model', fallback=DEFAULT_EMBEDDING_MODEL),
+            base_url=config.get('LLM', 'base_url'),
+            api_key=get_api_key(config['LLM']['llm_backend']),
+        )
     if isinstance(documents, str):
         documents = [documents]
-
-    data = {
-        "input": documents,
-        "encoding_format": encoding_format
-    }
-
-    response = requests.post(url, headers=headers, json=data)
-
-    if response.status_code == 200:
-        try:
-            # Assuming the API response contains a list of embeddings under 'data'
-            embeddings_list = response.json().get("data", [])
-            if embeddings_list:
-                embeddings = [embedding["embedding"] for embedding in embeddings_list]
-
-                # Format embeddings in scientific notation
-                formatted_embeddings = [[f"{val:0.8e}" for val in embedding] for embedding in embeddings]
-
-                #queue_message("Embeddings:", formatted_embeddings)
-                return formatted_embeddings
-            else:
-                queue_message("Error: 'data' key not found in API response.")
-                return None
-        except KeyError:
-            queue_message("Error: 'data' key not found in API response.")
-            return None
-    else:
-        queue_message("Error:", response.status_code, response.text)
-        return None
-
-from sentence_transformers import SentenceTransformer
-EMBEDDING_MODEL = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2', device='cpu')
+    return _remote_embeddings.encode(documents)
 
 def get_embedding(documents, key=None):
-    """Default embedding function that uses OpenAI Embeddings."""
+    """Default embedding function; encodes with the shared embedding provider (loaded on first use)."""
     if isinstance(documents, list):
         if isinstance(documents[0], dict):
             texts = []
@@ -99,14 +87,37 @@ def get_embedding(documents, key=None):
                     texts.append(doc.replace("\n", " "))
             elif key is None:
                 for doc in documents:
-                    text = ", ".join([f"{key}: {value}" for key, value in doc.items()])
+                    # Scalar fields only, so bookkeeping such as cached token counts is not embedded
+                    text = ", ".join([f"{key}: {value}" for key, value in doc.items() if isinstance(value, (str, int, float))])
                     texts.append(text)
         elif isinstance(documents[0], str):
             texts = documents
 
-    embeddings = EMBEDDING_MODEL.encode(texts)
+    embeddings = get_provider().encode(texts)
     return embeddings
 
+def get_document_text(doc) -> str:
+    """
+    Text used for BM25 indexing and reranking of a stored document.
+
+    Parameters:
+    - doc: A memory document (dict with user_input/bot_response, or anything str()-able).
+
+    Returns:
+    - str: The document text.
+    """
+    if isinstance(doc, dict):
+        text = ""
+        if "user_input" in doc:
+            text += doc["user_input"] + " "
+        if "bot_response" in doc:
+            text += doc["bot_response"]
+        if not text:  # If no specific fields found, use all text fields
+            text = " ".join(str(v) for v in doc.values() if isinstance(v, (str, int, float)))
+    else:
+        text = str(doc)
+    return text.strip()
+
 def get_norm_vector(vector):
     if len(vector.shape) == 1:
         return vector / np.linalg.norm(vector)
@@ -145,12 +156,465 @@ def adams_similarity(vectors, query_vector):
     adams_similarities = np.vectorize(adams_change)(similarities)
     return adams_similarities
 
+def top_k_indices(similarities, top_k):
+    """
+    Indices of the top_k largest similarities, best first.
+
+    Uses np.argpartition (O(N)) and only sorts the selected top_k entries.
+    """
+    similarities = similarities.reshape(-1)
+    top_k = min(top_k, similarities.shape[0])
+    if top_k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if top_k < similarities.shape[0]:
+        top_indices = np.argpartition(similarities, -top_k)[-top_k:]
+    else:
+        top_indices = np.arange(similarities.shape[0])
+    return top_indices[np.argsort(similarities[top_indices], kind="stable")[::-1]]
+
 def hyper_SVM_ranking_algorithm_sort(vectors, query_vector, top_k=5, metric=cosine_similarity):
     """HyperSVMRanking (Such Vector, Much Ranking) algorithm proposed by Andrej Karpathy (2023) https://arxiv.org/abs/2303.18231"""
-    similarities = metric(vectors, query_vector)
-    top_indices = np.argsort(similarities, axis=0)[-top_k:][::-1]
-    return top_indices.flatten(), similarities[top_indices].flatten()
-  
+    similarities = metric(vectors, query_vector).reshape(-1)
+    top_indices = top_k_indices(similarities, top_k)
+    return top_indices, similarities[top_indices]
+
+def normalize_rows(vectors, block: int = 65536):
+    """
+    Unit-normalize the rows of a matrix into a new float32 VectorArena.
+
+    Works in blocks so normalizing a memory-mapped matrix never materializes a
+    second full-size temporary.
+    """
+    vectors = np.asarray(vectors)
+    arena = VectorArena(vectors.shape[1], capacity=max(64, vectors.shape[0]))
+    for start in range(0, vectors.shape[0], block):
+        chunk = np.asarray(vectors[start:start + block], dtype=np.float32)
+        norms = np.linalg.norm(chunk, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        arena.extend(chunk / norms)
+    return arena
+
+class VectorArena:
+    """
+    Growable float32 matrix backing HyperDB.vectors.
+
+    Rows are written into a preallocated buffer whose capacity doubles when full,
+    so appending a vector costs amortized O(d) instead of re-stacking the whole
+    matrix. `view` exposes the live rows as a read-only array without copying.
+
+    An arena built with wrap() keeps the wrapped (e.g. memory-mapped) matrix as a
+    read-only base and appends after it in the buffer, so new rows never copy the
+    base into RAM. dot() and take() read base and buffer separately; `view` and
+    delete() need one contiguous matrix and consolidate both into RAM first.
+    """
+    def __init__(self, dim: int, capacity: int = 64, dtype=np.float32):
+        self.dim = dim
+        self._base = None   # read-only rows ahead of the buffer (see wrap)
+        self._buffer = np.empty((max(capacity, 1), dim), dtype=dtype)
+        self._size = 0      # rows used in the buffer
+
+    @classmethod
+    def wrap(cls, array):
+        """
+        Build an arena over an existing (N, d) array without copying it.
+
+        Used for read-only np.memmap snapshots: the mapped rows stay mapped when
+        rows are appended (see the class docstring).
+
+        Parameters:
+        - array (np.ndarray): Matrix to expose as the arena's first rows.
+        """
+        arena = cls(array.shape[1], dtype=array.dtype)
+        arena._base = array
+        return arena
+
+    @classmethod
+    def from_array(cls, array, dtype=np.float32):
+        """
+        Build an arena holding a copy of an existing (N, d) matrix.
+
+        Parameters:
+        - array: Matrix (or anything np.asarray accepts) to copy into the arena.
+        - dtype: Storage dtype of the arena.
+        """
+        array = np.asarray(array, dtype=dtype)
+        if array.ndim == 1:
+            array = array.reshape(1, -1) if array.size else array.reshape(0, 0)
+        arena = cls(array.shape[1], capacity=max(64, array.shape[0]), dtype=dtype)
+        arena.extend(array)
+        return arena
+
+    def __len__(self):
+        return self.base_rows + self._size
+
+    @property
+    def base_rows(self) -> int:
+        """Rows in the read-only base (0 unless built with wrap() and not consolidated)."""
+        return 0 if self._base is None else self._base.shape[0]
+
+    @property
+    def capacity(self) -> int:
+        return self.base_rows + self._buffer.shape[0]
+
+    @staticmethod
+    def _read_only(array) -> np.ndarray:
+        array = array.view(np.ndarray)
+        array.flags.writeable = False
+        return array
+
+    def blocks(self) -> list:
+        """The live rows as read-only (base, buffer) matrices, skipping empty ones; never copies."""
+        blocks = [self._buffer[:self._size]] if self._size else []
+        if self.base_rows:
+            blocks.insert(0, self._base)
+        return [self._read_only(block) for block in blocks]
+
+    @property
+    def view(self) -> np.ndarray:
+        """
+        Read-only view over the live rows; invalidated by the next append or delete.
+
+        If rows were appended after a wrapped base, the base is first copied into RAM
+        (see consolidate); prefer dot() and take() on hot paths.
+        """
+        if self._base is not None and self._size:
+            self.consolidate()
+        if self._base is not None:
+            return self._read_only(self._base)
+        return self._read_only(self._buffer[:self._size])
+
+    def consolidate(self):
+        """Copy the read-only base and the appended rows into one private buffer (costs the base's size in RAM)."""
+        if self._base is None:
+            return
+        buffer = np.empty((max(len(self) * 2, 64), self.dim), dtype=self._buffer.dtype)
+        buffer[:self.base_rows] = self._base
+        buffer[self.base_rows:len(self)] = self._buffer[:self._size]
+        self._size = len(self)
+        self._buffer = buffer
+        self._base = None
+
+    def dot(self, queries) -> np.ndarray:
+        """Inner products of every row with one query (d,) or several (d, Q), base and buffer scored separately."""
+        blocks = self.blocks()
+        if len(blocks) == 1:
+            return blocks[0] @ queries
+        if not blocks:
+            return np.empty((0,) + np.shape(queries)[1:], dtype=np.float32)
+        return np.concatenate([block @ queries for block in blocks])
+
+    def take(self, rows) -> np.ndarray:
+        """
+        Rows by index array or slice, gathered from the base and the buffer without consolidating.
+
+        A slice inside one part is returned as a read-only view; anything else is a copy.
+        """
+        if isinstance(rows, slice):
+            start, stop, step = rows.indices(len(self))
+            if step == 1 and (stop <= self.base_rows or start >= self.base_rows):
+                if stop <= self.base_rows:
+                    return self._read_only(self._base[start:stop])
+                return self._read_only(self._buffer[start - self.base_rows:stop - self.base_rows])
+            rows = np.arange(start, stop, step)
+        rows = np.asarray(rows, dtype=np.int64)
+        rows = np.where(rows < 0, rows + len(self), rows)
+        if self._base is None:
+            return self._buffer[:self._size][rows]
+        out = np.empty(rows.shape + (self.dim,), dtype=self._buffer.dtype)
+        in_base = rows < self.base_rows
+        out[in_base] = self._base[rows[in_base]]
+        out[~in_base] = self._buffer[:self._size][rows[~in_base] - self.base_rows]
+        return out
+
+    def _reserve(self, rows: int):
+        """Grow the buffer (by doubling) so that it can hold at least `rows` rows after the base."""
+        rows -= self.base_rows
+        if rows <= self._buffer.shape[0]:
+            return
+        buffer = np.empty((max(rows, self._buffer.shape[0] * 2), self.dim), dtype=self._buffer.dtype)
+        buffer[:self._size] = self._buffer[:self._size]
+        self._buffer = buffer
+
+    def append(self, vector):
+        """Append a single vector of length `dim`."""
+        vector = np.asarray(vector, dtype=self._buffer.dtype).reshape(-1)
+        if vector.shape[0] != self.dim:
+            raise ValueError("All vectors must have the same length.")
+        self._reserve(len(self) + 1)
+        self._buffer[self._size] = vector
+        self._size += 1
+
+    def extend(self, vectors):
+        """Append an (M, dim) block of vectors in one copy."""
+        vectors = np.asarray(vectors, dtype=self._buffer.dtype)
+        if vectors.size == 0:
+            return
+        vectors = vectors.reshape(-1, self.dim) if vectors.ndim == 1 else vectors
+        if vectors.shape[1] != self.dim:
+            raise ValueError("All vectors must have the same length.")
+        self._reserve(len(self) + vectors.shape[0])
+        self._buffer[self._size:self._size + vectors.shape[0]] = vectors
+        self._size += vectors.shape[0]
+
+    def delete(self, index):
+        """Remove one row (or an array of rows), shifting later rows up in place (consolidates a wrapped base)."""
+        self.consolidate()
+        keep = np.ones(self._size, dtype=bool)
+        keep[index] = False
+        remaining = int(keep.sum())
+        self._buffer[:remaining] = self._buffer[:self._size][keep]
+        self._size = remaining
+
+class QuantizedArena:
+    """
+    Compact copy of the search vectors for a first-pass scan.
+
+    Rows are stored either as float16 or as scalar-quantized int8 codes with one
+    float32 scale per row (row ~= codes * scale). Scores computed from the codes
+    are approximate; HyperDB rescores the best candidates against the float32
+    vectors.
+    """
+    STORAGE_TYPES = {"float16": np.float16, "int8": np.int8}
+
+    def __init__(self, dim: int, storage: str = "int8", capacity: int = 64):
+        if storage not in self.STORAGE_TYPES:
+            raise ValueError("Quantized storage must be 'float16' or 'int8'.")
+        self.dim = dim
+        self.storage = storage
+        self._codes = VectorArena(dim, capacity=capacity, dtype=self.STORAGE_TYPES[storage])
+        self._scales = VectorArena(1, capacity=capacity) if storage == "int8" else None
+
+    @classmethod
+    def from_array(cls, vectors, storage: str = "int8", normalize: bool = False, block: int = 65536):
+        """
+        Quantize an (N, d) matrix, in blocks so a memory-mapped input is never fully materialized.
+
+        Parameters:
+        - vectors: Matrix to quantize.
+        - storage (str): 'float16' or 'int8'.
+        - normalize (bool): Unit-normalize rows before quantizing (cosine similarity).
+        """
+        vectors = np.asarray(vectors)
+        arena = cls(vectors.shape[1], storage, capacity=max(64, vectors.shape[0]))
+        for start in range(0, vectors.shape[0], block):
+            chunk = np.asarray(vectors[start:start + block], dtype=np.float32)
+            if normalize:
+                norms = np.linalg.norm(chunk, axis=1, keepdims=True)
+                norms[norms == 0] = 1.0
+                chunk = chunk / norms
+            arena.extend(chunk)
+        return arena
+
+    @classmethod
+    def wrap(cls, storage: str, codes, scales=None):
+        """Build an arena over existing (e.g. memory-mapped) codes and scales without copying."""
+        arena = cls(codes.shape[1], storage, capacity=1)
+        arena._codes = VectorArena.wrap(codes)
+        if storage == "int8":
+            arena._scales = VectorArena.wrap(np.asarray(scales).reshape(-1, 1))
+        return arena
+
+    def __len__(self):
+        return len(self._codes)
+
+    @property
+    def codes(self) -> np.ndarray:
+        return self._codes.view
+
+    @property
+    def scales(self):
+        """Per-row int8 scales as an (N,) view, or None for float16 storage."""
+        return None if self._scales is None else self._scales.view.reshape(-1)
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes used by the live rows."""
+        return self.codes.nbytes + (0 if self._scales is None else self.scales.nbytes)
+
+    def extend(self, vectors):
+        """Quantize and append an (M, dim) block of float32 rows."""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        if self.storage == "float16":
+            self._codes.extend(vectors)
+            return
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        self._codes.extend(np.clip(np.rint(vectors / scales[:, None]), -127, 127))
+        self._scales.extend(scales.reshape(-1, 1))
+
+    def append(self, vector):
+        """Quantize and append a single row."""
+        self.extend(vector)
+
+    def delete(self, index):
+        """Remove one row (or an array of rows), shifting later rows up in place."""
+        self._codes.delete(index)
+        if self._scales is not None:
+            self._scales.delete(index)
+
+    def scores(self, queries, block: int = 2048, rows=None) -> np.ndarray:
+        """
+        Approximate inner products of every row (or only `rows`, an index array or
+        slice) with one query (d,) or several (d, Q).
+
+        Codes are upcast to float32 one block at a time, so the float32 temporary
+        stays at `block` rows regardless of corpus size. Memory-mapped codes are read
+        in place, also after rows were appended (see VectorArena.take).
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        if rows is None:
+            rows = slice(0, len(self))
+        if isinstance(rows, slice):
+            first, stop, _ = rows.indices(len(self))
+            count = max(0, stop - first)
+            chunk_rows = lambda start: slice(first + start, first + min(start + block, count))
+        else:
+            count = rows.shape[0]
+            chunk_rows = lambda start: rows[start:start + block]
+        out = np.empty((count,) + queries.shape[1:], dtype=np.float32)
+        for start in range(0, count, block):
+            selected = chunk_rows(start)
+            out[start:start + block] = self._codes.take(selected).astype(np.float32) @ queries
+            if self._scales is not None:
+                out[start:start + block] *= self._scales.take(selected).reshape((-1,) + (1,) * (queries.ndim - 1))
+        return out
+
+    def blocks(self) -> tuple:
+        """(code blocks, scale blocks or None) of the live rows, as in VectorArena.blocks."""
+        scales = None if self._scales is None else [block.reshape(-1) for block in self._scales.blocks()]
+        return self._codes.blocks(), scales
+
+class StageTimings:
+    """
+    Thread-safe latency counters per query stage (embed, vector, bm25, fuse, rerank, total).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}  # stage -> [count, total seconds, max seconds, last seconds]
+
+    @contextmanager
+    def time(self, stage: str):
+        """Context manager that records the wall time of its block under `stage`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            entry = self._stages.setdefault(stage, [0, 0.0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+            entry[3] = seconds
+
+    def stats(self) -> dict:
+        """Per stage: number of calls and average / max / last latency in milliseconds."""
+        with self._lock:
+            return {
+                stage: {"count": count, "avg_ms": 1000 * total / count, "max_ms": 1000 * longest, "last_ms": 1000 * last}
+                for stage, (count, total, longest, last) in self._stages.items()
+            }
+
+    def summary(self) -> str:
+        """One-line summary of the latest latency of each stage."""
+        return " | ".join(f"{stage} {entry['last_ms']:.1f} ms" for stage, entry in self.stats().items())
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+class DocumentView:
+    """
+    Read-only view over the live (non-deleted) documents of a HyperDB.
+
+    Nothing is materialized: indexing and iteration (forwards or reversed) read
+    HyperDB.documents on demand, slicing returns another view, and vector()
+    returns a row of HyperDB.vectors without copying. Positions count live
+    documents only. A view covers the rows that existed when it was created and
+    is invalidated by compaction, so it is meant to be used right away, holding
+    HyperDB.lock while another thread may write.
+    """
+    def __init__(self, db, rows=None):
+        self._db = db
+        self._rows = range(len(db.documents)) if rows is None else rows
+
+    def _iter_rows(self, reverse: bool = False):
+        """Live rows of the view, lazily, in order (or reversed)."""
+        deleted = self._db._tombstone_mask()
+        rows = reversed(self._rows) if reverse else self._rows
+        if deleted is None:
+            return iter(rows)
+        return (row for row in rows if not deleted[row])
+
+    def _live_rows(self):
+        """Live rows of the view as a range (nothing deleted) or an array."""
+        deleted = self._db._tombstone_mask()
+        if deleted is None:
+            return self._rows
+        if isinstance(self._rows, range) and self._rows.step == 1:
+            return np.flatnonzero(~deleted[self._rows.start:self._rows.stop]) + self._rows.start
+        rows = np.asarray(self._rows, dtype=np.int64)
+        return rows[~deleted[rows]]
+
+    def __len__(self):
+        deleted = self._db._tombstone_mask()
+        if deleted is None:
+            return len(self._rows)
+        if isinstance(self._rows, range) and self._rows.step == 1:
+            return len(self._rows) - int(np.count_nonzero(deleted[self._rows.start:self._rows.stop]))
+        return len(self._live_rows())
+
+    def __iter__(self):
+        documents = self._db.documents
+        return (documents[row] for row in self._iter_rows())
+
+    def __reversed__(self):
+        documents = self._db.documents
+        return (documents[row] for row in self._iter_rows(reverse=True))
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            if self._db._tombstone_mask() is None:
+                return DocumentView(self._db, self._rows[key])
+            if key.start is not None and key.start < 0 and key.stop is None and key.step in (None, 1):
+                # Tail of the view: walk back from the end instead of mapping every row
+                return DocumentView(self._db, list(islice(self._iter_rows(reverse=True), -key.start))[::-1])
+            return DocumentView(self._db, self._live_rows()[key])
+        return self._db.documents[self.row(key)]
+
+    def row(self, index: int) -> int:
+        """Row in HyperDB (for get_window or vector access) of the document at a view position."""
+        if self._db._tombstone_mask() is None:
+            return self._rows[index]
+        rows = self._iter_rows(reverse=index < 0)
+        row = next(islice(rows, index if index >= 0 else -index - 1, None), None)
+        if row is None:
+            raise IndexError("document view index out of range")
+        return row
+
+    def rows(self, reverse: bool = False):
+        """Iterate over the HyperDB rows of the view's documents (newest first if reverse)."""
+        return self._iter_rows(reverse=reverse)
+
+    def items(self):
+        """Iterate over (row, document) pairs."""
+        documents = self._db.documents
+        return ((row, documents[row]) for row in self._iter_rows())
+
+    def vector(self, index: int) -> np.ndarray:
+        """Read-only vector of the document at a view position (a row of HyperDB.vectors, not a copy)."""
+        return self._db.vectors[self.row(index)]
+
+def synchronized(method):
+    """Run a HyperDB method while holding the database lock (see HyperDB.lock)."""
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return locked
+
 class HyperDB:
     def __init__(
         self,
@@ -160,6 +624,32 @@ class HyperDB:
         embedding_function=None,
         similarity_metric="cosine",
         rag_strategy="naive",
+        bm25_mode="incremental",
+        bm25_rebuild_threshold=0.25,
+        wal_fsync_every=8,
+        wal_compact_every=256,
+        index_type="exact",
+        ann_nlist=0,
+        ann_nprobe=8,
+        ann_exact_threshold=10000,
+        embedding_cache_mb=8,
+        rerank_cache_mb=2,
+        vector_storage="float32",
+        rescore_factor=4,
+        compact_threshold=0.25,
+        embed_batch_size=256,
+        parallel_hybrid=True,
+        log_query_timings=False,
+        reranker_backend="cross_encoder",
+        reranker_model="BAAI/bge-reranker-base",
+        reranker_max_length=256,
+        rerank_candidates=0,
+        rerank_skip_margin=0.0,
+        dedup_threshold=0.0,
+        dedup_mode="merge",
+        dedup_kinds=("tool", "text"),
+        dedup_bits=128,
+        dedup_bands=8,
     ):
         """
             Initialize HyperDB with configurable RAG strategy.
@@ -171,33 +661,116 @@ class HyperDB:
             - embedding_function: Function to compute embeddings
             - similarity_metric: Metric for vector similarity
             - rag_strategy: 'naive' for vector-only or 'hybrid' for vector+BM25
+            - bm25_mode: 'incremental' to append postings per insert, or 'rebuild' to re-index bm25s per insert
+            - bm25_rebuild_threshold: Fraction of removed documents after which the incremental index is compacted
+            - wal_fsync_every: Write-ahead log records per fsync batch
+            - wal_compact_every: Write-ahead log records after which persist() compacts into a new snapshot
+            - index_type: 'exact' for brute-force vector search or 'ivf' for the approximate IVF-flat index
+            - ann_nlist: Number of IVF cells (0 = about sqrt(N))
+            - ann_nprobe: IVF cells scored per query (higher = better recall, slower)
+            - ann_exact_threshold: Corpus size below which the IVF index falls back to exact search
+            - embedding_cache_mb: Size of the LRU cache of query embeddings (0 disables it)
+            - rerank_cache_mb: Size of the LRU cache of reranker scores (0 disables it)
+            - vector_storage: 'float32', or 'float16' / 'int8' to run the first search pass on a
+              compact copy of the vectors (cosine / dot similarity only)
+            - rescore_factor: With compact storage, top_k * rescore_factor candidates are rescored in float32
+            - compact_threshold: Fraction of tombstoned (deleted) rows after which storage is compacted,
+              synchronously, by the remove_documents call that crosses it
+            - embed_batch_size: Documents per embedding call in add_documents
+            - parallel_hybrid: Run the vector and BM25 branches of hybrid queries on separate threads
+            - log_query_timings: Log the per-stage latency of every query
+            - reranker_backend: 'cross_encoder', 'onnx' (int8 ONNX Runtime) or 'none' (see module_reranker)
+            - reranker_model: Cross-encoder model name or local path
+            - reranker_max_length: Maximum tokens per (query, document) pair fed to the reranker
+            - rerank_candidates: Fused candidates passed to the reranker (0 = top_k * 2); queries
+              still return top_k results when it is smaller
+            - rerank_skip_margin: Skip reranking when the best RRF score leads the runner-up by
+              at least this fraction of the best score (0 = always rerank)
+            - dedup_threshold: Cosine similarity at or above which a new memory is a near-duplicate
+              of a stored one and is not inserted (0 disables duplicate suppression)
+            - dedup_mode: 'merge' to record the hit count and last-seen time on the surviving memory,
+              or 'skip' to record the hit count only
+            - dedup_kinds: Document kinds checked for duplicates (see module_metadata.document_kind)
+            - dedup_bits / dedup_bands: SimHash signature size and LSH bands (see module_dedup)
         """
         self.documents = documents or []
         self.documents = []
-        self.vectors = None
+        self._arena = None
+        self._unit_arena = None  # unit-normalized copy of the vectors, kept for cosine search
+        self._quantized = None   # compact copy of the search vectors, replaces _unit_arena when enabled
         self.embedding_function = embedding_function or (
             #lambda docs: get_embedding(docs, key=key)
             lambda docs: get_embedding(docs)
         )
+        self.embed_batch_size = max(1, embed_batch_size)
         self.rag_strategy = rag_strategy
-
+        self.bm25_mode = bm25_mode
+        self.bm25_rebuild_threshold = bm25_rebuild_threshold
+
+        # Write-ahead log state; opened by save()/load() for the storage file
+        self.wal_fsync_every = wal_fsync_every
+        self.wal_compact_every = wal_compact_every
+        self._wal = None
+        self._journal = []
+        self._log_seq = 0
+        # One lock for every read and write of rows, vectors and indexes: the memory
+        # writer thread inserts while queries run. Documents and queries are embedded
+        # before it is taken; search, fusion and reranking run under it.
+        self.lock = threading.RLock()
+
+        # Query embedding and reranker score caches. Reranker scores are keyed by a
+        # stable per-document id so they survive row shifts and can be invalidated.
+        self.embedding_cache = LRUCache(embedding_cache_mb)
+        self.rerank_cache = LRUCache(rerank_cache_mb)
+        self._doc_ids = []
+        self._next_doc_id = 0
+
+        # Deleted rows are tombstoned and masked out of queries until compact() drops them
+        self.compact_threshold = compact_threshold
+        self._tombstones = np.zeros(64, dtype=bool)
+        self._deleted_count = 0
+
+        # Timestamp / kind / source columns for filtered queries, built on first use
+        self._metadata = None
+
+        # Near-duplicate suppression; the LSH index covers the first _dedup_rows rows and is built on first insert
+        self.dedup_threshold = dedup_threshold
+        self.dedup_mode = dedup_mode
+        self.dedup_kinds = tuple(dedup_kinds)
+        self.dedup_bits = dedup_bits
+        self.dedup_bands = dedup_bands
+        self.dedup_suppressed = 0
+        self._dedup = None
+        self._dedup_rows = 0
+
+        # Per-stage query latency; the BM25 branch of hybrid queries runs on its own thread
+        self.timings = StageTimings()
+        self.log_query_timings = log_query_timings
+        self.parallel_hybrid = parallel_hybrid
+        self._query_pool = None
+
+        self.rerank_candidates = max(0, rerank_candidates)
+        self.rerank_skip_margin = rerank_skip_margin
+        self.rerank_skipped = 0  # queries answered from RRF order because fusion was decisive
         if rag_strategy == "hybrid":
             try:
-                self.reranker = CrossEncoder(
-                    'BAAI/bge-reranker-base',
-                    device='cuda' if torch.cuda.is_available() else 'cpu', 
-                    max_length=256,
+                self.reranker = load_reranker(
+                    reranker_backend,
+                    reranker_model,
+                    max_length=reranker_max_length,
                 )
-                queue_message("INFO: BGE reranker model loaded successfully")
             except Exception as e:
-                queue_message(f"WARNING: Failed to load BGE reranker model: {e}")
+                queue_message(f"WARNING: Failed to load reranker model {reranker_model}: {e}")
                 self.reranker = None
 
         # Initialize BM25 components
         queue_message(f"INFO: Initializing HyperDB with {rag_strategy} RAG strategy")
         if self.rag_strategy == "hybrid":
             self.stemmer = Stemmer.Stemmer("english")
-            self.bm25_retriever = bm25s.BM25(method="lucene")
+            if self.bm25_mode == "incremental":
+                self.bm25_retriever = IncrementalBM25(rebuild_threshold=bm25_rebuild_threshold)
+            else:
+                self.bm25_retriever = bm25s.BM25(method="lucene")
             self.corpus_tokens = None
             self.corpus_texts = []
         else:
@@ -206,14 +779,6 @@ class HyperDB:
             self.corpus_tokens = None
             self.corpus_texts = None
 
-        if vectors is not None:
-            self.vectors = vectors
-            self.documents = documents
-            if self.rag_strategy == "hybrid" and documents:
-                self._init_bm25_index()
-        else:
-            self.add_documents(documents)
-
         if similarity_metric.__contains__("dot"):
             self.similarity_metric = dot_product
         elif similarity_metric.__contains__("cosine"):
@@ -229,39 +794,335 @@ class HyperDB:
                 "Similarity metric not supported. Please use either 'dot', 'cosine', 'euclidean', 'adams', or 'derrida'."
             )
 
+        # Approximate nearest-neighbour index (only meaningful for cosine / dot similarity)
+        self.ann_index = None
+        if index_type == "ivf":
+            if self.similarity_metric in (cosine_similarity, dot_product):
+                self.ann_index = IVFFlatIndex(
+                    metric="dot" if self.similarity_metric is dot_product else "cosine",
+                    nlist=ann_nlist,
+                    nprobe=ann_nprobe,
+                    exact_threshold=ann_exact_threshold,
+                )
+            else:
+                queue_message("WARNING: IVF index needs cosine or dot similarity; using exact search")
+
+        self.vector_storage = vector_storage
+        self.rescore_factor = max(1, rescore_factor)
+        if vector_storage != "float32" and self.similarity_metric not in (cosine_similarity, dot_product):
+            queue_message(f"WARNING: {vector_storage} vector storage needs cosine or dot similarity; using float32")
+            self.vector_storage = "float32"
+
+        if vectors is not None:
+            self.vectors = vectors
+            self.documents = documents
+            self._reset_rows()
+            if self.rag_strategy == "hybrid" and documents:
+                self._init_bm25_index()
+        else:
+            self.add_documents(documents)
+
+    @property
+    def vectors(self):
+        """Read-only (N, d) float32 view of the stored vectors, or None if nothing is stored."""
+        if self._arena is None:
+            return None
+        return self._arena.view
+
+    @vectors.setter
+    @synchronized
+    def vectors(self, value):
+        self._arena = None if value is None else VectorArena.from_array(value)
+        self._rebuild_vector_indexes()
+
+    @property
+    def unit_vectors(self):
+        """Read-only unit-normalized view of the vectors (cosine similarity only), or None."""
+        if self._unit_arena is None:
+            return None
+        return self._unit_arena.view
+
+    def _rebuild_vector_indexes(self, unit_vectors=None, quantized=None):
+        """
+        Rebuild indexes derived from the vectors after they were replaced wholesale.
+
+        Parameters:
+        - unit_vectors: Precomputed unit-normalized rows (e.g. from a memory-mapped snapshot).
+        - quantized: Precomputed (storage, codes, scales) of the search rows (e.g. from a
+          memory-mapped snapshot).
+        """
+        self._unit_arena = None
+        self._quantized = None
+        self._dedup = None
+        if self._arena is not None and self.vector_storage != "float32":
+            if (
+                quantized is not None and quantized[0] == self.vector_storage
+                and quantized[1].shape == (len(self._arena), self._arena.dim)
+            ):
+                self._quantized = QuantizedArena.wrap(*quantized)
+            else:
+                self._quantized = QuantizedArena.from_array(
+                    self.vectors, self.vector_storage, normalize=self.similarity_metric is cosine_similarity
+                )
+        elif self._arena is not None and self.similarity_metric is cosine_similarity:
+            if unit_vectors is not None and unit_vectors.shape == (len(self._arena), self._arena.dim):
+                self._unit_arena = VectorArena.wrap(unit_vectors)
+            else:
+                self._unit_arena = normalize_rows(self.vectors)
+        if self.ann_index is not None:
+            self.ann_index.build(self._search_vectors)
+
+    @property
+    def quantized(self):
+        """The compact QuantizedArena searched first when vector_storage is 'float16' or 'int8', else None."""
+        return self._quantized
+
+    @property
+    def _search_vectors(self):
+        """Matrix the vector search runs on: unit rows for cosine, raw vectors otherwise."""
+        if self._unit_arena is not None:
+            return self._unit_arena.view
+        return self.vectors
+
+    def _append_vector(self, vector):
+        """Append one vector to the arena, creating it on first use."""
+        self._append_vectors(np.asarray(vector, dtype=np.float32).reshape(1, -1))
+
+    def _append_vectors(self, vectors):
+        """Append an (M, d) block of vectors to the arena and vector indexes in one operation."""
+        dim = vectors.shape[1]
+        if self._arena is None or (len(self._arena) == 0 and self._arena.dim != dim):
+            self._arena = VectorArena(dim)
+            self._unit_arena = None
+            self._quantized = None
+            if self.vector_storage != "float32":
+                self._quantized = QuantizedArena(dim, self.vector_storage)
+            elif self.similarity_metric is cosine_similarity:
+                self._unit_arena = VectorArena(dim)
+        elif dim != self._arena.dim:
+            raise ValueError("All vectors must have the same length.")
+        self._arena.extend(vectors)
+        if self._unit_arena is not None or self._quantized is not None:
+            if self.similarity_metric is cosine_similarity:
+                norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+                norms[norms == 0] = 1.0
+                vectors = vectors / norms
+            (self._unit_arena if self._unit_arena is not None else self._quantized).extend(vectors)
+        if self.ann_index is not None:
+            self.ann_index.add_many(vectors, self._search_vectors)
+
+    def _vector_search(self, query_vector, top_k: int, rows=None):
+        """
+        Top-k rows for a query vector, through the ANN index when one is configured.
+
+        Parameters:
+        - rows (np.ndarray, optional): Restrict the search to these live rows (see
+          filter_rows); only they are scored, without the ANN index.
+
+        Returns:
+        - tuple: (row indices, similarities), best first.
+        """
+        if rows is not None:
+            return self._vector_search_rows(query_vector, top_k, rows)
+        if self.ann_index is not None:
+            result = self.ann_index.search(self._search_vectors, query_vector, top_k, exclude=self._tombstone_mask())
+            if result is not None:
+                return result
+        if self._quantized is not None:
+            query_vector = self._prepare_query(query_vector)
+            candidates, _ = self._live_top_k(self._quantized.scores(query_vector), top_k * self.rescore_factor)
+            return self._rescore(candidates, query_vector, top_k)
+        if self._unit_arena is not None:
+            # Cosine on cached unit rows: one matrix-vector product, no per-query O(N*d) temporaries
+            query_vector = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+            norm = np.linalg.norm(query_vector)
+            similarities = self._unit_arena.dot(query_vector / norm if norm else query_vector)
+            return self._live_top_k(similarities, top_k)
+        if self._deleted_count:
+            similarities = np.array(self.similarity_metric(self.vectors, query_vector), dtype=np.float32).reshape(-1)
+            return self._live_top_k(similarities, top_k)
+        return hyper_SVM_ranking_algorithm_sort(
+            self.vectors, query_vector, top_k=top_k, metric=self.similarity_metric
+        )
+
+    def _vector_search_rows(self, query_vector, top_k: int, rows):
+        """
+        Top-k among the given (ascending) rows.
+
+        A contiguous run of rows, e.g. a time window, is scored through a slice of the
+        vectors without copying; a small scattered selection is gathered and scored;
+        a large scattered one is cheaper to score in full and then select from.
+
+        Returns:
+        - tuple: (row indices, similarities), best first.
+        """
+        if not rows.size:
+            return rows, np.empty(0, dtype=np.float32)
+        if rows[-1] - rows[0] + 1 == rows.shape[0]:
+            selector = slice(int(rows[0]), int(rows[-1]) + 1)
+        elif rows.shape[0] * 4 > len(self.documents):
+            selector = None
+        else:
+            selector = rows
+
+        if self._quantized is not None:
+            query_vector = self._prepare_query(query_vector)
+            if selector is None:
+                approximate = self._quantized.scores(query_vector)[rows]
+            else:
+                approximate = self._quantized.scores(query_vector, rows=selector)
+            return self._rescore(rows[top_k_indices(approximate, top_k * self.rescore_factor)], query_vector, top_k)
+        if self._unit_arena is not None:
+            arena, query_vector = self._unit_arena, self._prepare_query(query_vector)
+            similarities = arena.dot(query_vector) if selector is None else arena.take(selector) @ query_vector
+        else:
+            vectors = self.vectors if selector is None else self._arena.take(selector)
+            similarities = np.array(self.similarity_metric(vectors, query_vector), dtype=np.float32).reshape(-1)
+        if selector is None:
+            similarities = similarities[rows]
+        top = top_k_indices(similarities, top_k)
+        return rows[top], similarities[top]
+
+    def _vector_search_many(self, query_vectors, top_k: int, rows=None):
+        """
+        Top-k rows for several query vectors.
+
+        With cached unit rows (cosine) all queries are scored by one matrix-matrix
+        product; otherwise each query goes through _vector_search.
+
+        Returns:
+        - list: One (row indices, similarities) tuple per query.
+        """
+        query_vectors = np.asarray(query_vectors, dtype=np.float32)
+        if rows is not None:
+            return [self._vector_search_rows(query_vector, top_k, rows) for query_vector in query_vectors]
+        if self.ann_index is None and self._quantized is not None:
+            query_vectors = np.stack([self._prepare_query(query_vector) for query_vector in query_vectors])
+            approximate = self._quantized.scores(query_vectors.T)
+            return [
+                self._rescore(self._live_top_k(approximate[:, column], top_k * self.rescore_factor)[0], query_vector, top_k)
+                for column, query_vector in enumerate(query_vectors)
+            ]
+        if self.ann_index is not None or self._unit_arena is None:
+            return [self._vector_search(query_vector, top_k) for query_vector in query_vectors]
+
+        norms = np.linalg.norm(query_vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        similarities = self._unit_arena.dot((query_vectors / norms).T)
+        return [self._live_top_k(similarities[:, column], top_k) for column in range(similarities.shape[1])]
+
+    def _prepare_query(self, query_vector):
+        """Query as float32, unit-normalized for cosine similarity."""
+        query_vector = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+        if self.similarity_metric is cosine_similarity:
+            norm = np.linalg.norm(query_vector)
+            return query_vector / norm if norm else query_vector
+        return query_vector
+
+    def _rescore(self, candidates, query_vector, top_k: int):
+        """
+        Exact float32 similarities for candidate rows from the quantized first pass.
+
+        Only the candidate rows of the float32 vectors are read, so a memory-mapped
+        snapshot faults in just those pages.
+
+        Returns:
+        - tuple: (row indices, similarities), best first.
+        """
+        candidates = np.sort(candidates)
+        rows = np.asarray(self._arena.take(candidates), dtype=np.float32)
+        if self.similarity_metric is cosine_similarity:
+            norms = np.linalg.norm(rows, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            rows = rows / norms
+        similarities = rows @ query_vector
+        top = top_k_indices(similarities, top_k)
+        return candidates[top], similarities[top]
+
     def _init_bm25_index(self):
         """Initialize BM25 index with current documents"""
         if self.rag_strategy != "hybrid":
             return
 
-        self.corpus_texts = []
-        for doc in self.documents:
-            if isinstance(doc, dict):
-                text = ""
-                if "user_input" in doc:
-                    text += doc["user_input"] + " "
-                if "bot_response" in doc:
-                    text += doc["bot_response"]
-                if not text:  # If no specific fields found, use all text fields
-                    text = " ".join(str(v) for v in doc.values() if isinstance(v, (str, int, float)))
-            else:
-                text = str(doc)
-            self.corpus_texts.append(text.strip())
-            
+        self.corpus_texts = [get_document_text(doc) for doc in self.documents]
+
+        if self.bm25_mode == "incremental":
+            self.bm25_retriever = IncrementalBM25(rebuild_threshold=self.bm25_rebuild_threshold)
+            self.bm25_retriever.add_many(self._bm25_tokenize(self.corpus_texts))
+            mask = self._tombstone_mask()
+            if mask is not None:
+                self.bm25_retriever.delete(np.flatnonzero(mask).tolist())
+            return
+
         self.corpus_tokens = bm25s.tokenize(self.corpus_texts, stopwords="en", stemmer=self.stemmer)
         self.bm25_retriever.index(self.corpus_tokens)
 
+    def _bm25_tokenize(self, texts):
+        """Tokenize texts into stemmed token strings for the incremental BM25 index."""
+        return bm25s.tokenize(texts, stopwords="en", stemmer=self.stemmer, return_ids=False, show_progress=False)
+
+    def _bm25_add(self, documents):
+        """Index newly appended documents for BM25 search (bm25s is re-indexed once per call)."""
+        if self.bm25_mode != "incremental":
+            self._init_bm25_index()
+            return
+        texts = [get_document_text(document) for document in documents]
+        self.corpus_texts.extend(texts)
+        self.bm25_retriever.add_many(self._bm25_tokenize(texts))
+
+    def _bm25_retrieve(self, query_text: str, k: int, rows=None):
+        """Top-k BM25 rows and scores for a query, as (1, k) arrays."""
+        return self._bm25_retrieve_many([query_text], k, rows)
+
+    def _bm25_retrieve_many(self, query_texts, k: int, rows=None):
+        """
+        Top-k BM25 rows and scores for several queries in one call, as (len(query_texts), k) arrays.
+
+        With `rows` (see filter_rows), other rows are weighted out of the results.
+        """
+        with self.timings.time("bm25"):
+            return self._bm25_search(query_texts, k, rows)
+
+    def _bm25_search(self, query_texts, k: int, rows=None):
+        weight_mask = None
+        if rows is not None:
+            weight_mask = np.zeros(len(self.documents), dtype=np.float32)
+            weight_mask[rows] = 1.0
+        if self.bm25_mode == "incremental":
+            return self.bm25_retriever.retrieve(self._bm25_tokenize(query_texts), k=k, weight_mask=weight_mask)
+        query_tokens = bm25s.tokenize(query_texts, stopwords="en", stemmer=self.stemmer, show_progress=False)
+        mask = self._tombstone_mask()
+        if mask is not None and weight_mask is None:
+            # Deleted rows stay in the bm25s index until compaction; zero their scores
+            weight_mask = (~mask).astype(np.float32)
+        if weight_mask is None:
+            return self.bm25_retriever.retrieve(query_tokens, k=k, show_progress=False)
+        return self.bm25_retriever.retrieve(query_tokens, k=k, show_progress=False, weight_mask=weight_mask)
+
+    def view(self) -> DocumentView:
+        """
+        Zero-copy view over the live documents (see DocumentView).
+
+        Prefer this to dict() on hot paths: e.g. `reversed(db.view())` walks only
+        as far back as the caller reads, and `db.view()[-n:]` touches n rows.
+        """
+        return DocumentView(self)
+
+    @synchronized
     def dict(self, vectors=False):
+        mask = self._tombstone_mask()
         if vectors:
             return [
                 {"document": document, "vector": vector.tolist(), "index": index}
                 for index, (document, vector) in enumerate(
                     zip(self.documents, self.vectors)
                 )
+                if mask is None or not mask[index]
             ]
         return [
             {"document": document, "index": index}
             for index, document in enumerate(self.documents)
+            if mask is None or not mask[index]
         ]
 
     def add(self, documents, vectors=None):
@@ -269,6 +1130,7 @@ class HyperDB:
             return self.add_document(documents, vectors)
         self.add_documents(documents, vectors)
 
+    @synchronized
     def add_document_new(self, document: dict, vector=None):
         # These changes were for an old version
         # here I also changed the line:
@@ -288,16 +1150,13 @@ class HyperDB:
             queue_message("Error: Unable to get embeddings for the document.")
             return
 
-        if self.vectors is None:
-            self.vectors = np.empty((0, len(vector)), dtype=np.float32)
-        elif len(vector) != self.vectors.shape[1]:
-            raise ValueError("All vectors must have the same length.")
-
-        self.vectors = np.vstack([self.vectors, vector]).astype(np.float32)
+        self._append_vector(vector)
         self.documents.append(document)
 
     def add_document(self, document: dict, vector=None):
 
+        if vector is not None and np.ndim(vector) == 1:
+            vector = [vector]  # a single precomputed vector
         vector = vector if vector is not None else self.embedding_function([document])
         if vector is not None and len(vector) > 0:
             vector = vector[0]
@@ -306,61 +1165,619 @@ class HyperDB:
             queue_message("Error: Unable to get embeddings for the document.")
             return
 
-        if self.vectors is None:
-            self.vectors = np.empty((0, len(vector)), dtype=np.float32)
-        elif len(vector) != self.vectors.shape[1]:
-            raise ValueError("All vectors must have the same length.")
-        self.vectors = np.vstack([self.vectors, vector]).astype(np.float32)
-        self.documents.append(document)
+        self._insert_documents([document], vector)
+
+    @synchronized
+    def _insert_documents(self, documents, vectors, journal: bool = True):
+        """
+        Append already-embedded documents to storage and indexes in one operation, and journal them.
+
+        Returns:
+        - int: Number of documents inserted (near-duplicates are suppressed when dedup_threshold is set).
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(documents), -1)
+        dedup_keys = None
+        if self.dedup_threshold > 0 and documents:
+            documents, vectors, dedup_keys = self._suppress_duplicates(list(documents), vectors)
+            if not documents:
+                return 0
+        start = len(self.documents)
+        self._append_vectors(vectors)
+        self.documents.extend(documents)
+        self._doc_ids.extend(self._new_doc_id() for _ in documents)
+        if self._metadata is not None:
+            self._metadata.extend(documents)
 
         # Update BM25 index if using hybrid strategy
         if self.rag_strategy == "hybrid":
-            self._init_bm25_index()
+            self._bm25_add(documents)
+
+        if dedup_keys is not None:
+            positions, keys = dedup_keys
+            self._dedup.add(start + positions, keys)
+            self._dedup_rows = len(self.documents)
+
+        if journal:
+            if len(documents) == 1:
+                self._journal_record("add", documents[0], vectors[0].copy())
+            else:
+                self._journal_record("add_many", list(documents), vectors.copy())
+        return len(documents)
+
+    def _dedup_eligible(self, documents) -> np.ndarray:
+        """Boolean mask of the documents whose kind is checked for duplicates."""
+        return np.array(
+            [isinstance(document, dict) and document_kind(document) in self.dedup_kinds for document in documents],
+            dtype=bool,
+        )
+
+    def _dedup_index(self, dim: int) -> SimHashIndex:
+        """The LSH index of stored rows, (re)built or brought up to date with rows added without it (e.g. by log replay)."""
+        if self._dedup is None or self._dedup.dim != dim or self._dedup_rows > len(self.documents):
+            self._dedup = SimHashIndex(dim, bits=self.dedup_bits, bands=self.dedup_bands)
+            self._dedup_rows = 0
+        if self._dedup_rows < len(self.documents) and self._arena is not None:
+            rows = self._dedup_rows + np.flatnonzero(self._dedup_eligible(self.documents[self._dedup_rows:]))
+            if rows.size:
+                self._dedup.add(rows, self._dedup.band_keys(self._arena.take(rows)))
+        self._dedup_rows = len(self.documents)
+        return self._dedup
+
+    def _suppress_duplicates(self, documents: list, vectors: np.ndarray, block: int = 16384):
+        """
+        Drop near-duplicates of stored memories, and of earlier memories in the same batch.
+
+        Candidates come from the SimHash LSH index (stored rows) and from band collisions
+        within the batch, and are confirmed with exact cosine similarity, so a whole batch
+        costs one signature product plus the candidate dot products. A memory is only ever
+        a duplicate of a kept memory, never of another duplicate. The survivor's
+        DEDUP_KEY field counts the suppressed hits; updates to stored rows are journaled.
+
+        Returns:
+        - tuple: (kept documents, their vectors, (batch positions, band keys) of the kept
+          documents to add to the index once they are stored).
+        """
+        eligible = np.flatnonzero(self._dedup_eligible(documents))
+        if not eligible.size:
+            return documents, vectors, None
+        index = self._dedup_index(vectors.shape[1])
+        units = vectors[eligible]
+        keys = index.band_keys(units)
+        norms = np.linalg.norm(units, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        units /= norms
+
+        # Duplicates of stored rows: the most similar live candidate at or above the threshold
+        stored = np.full(eligible.shape[0], -1, dtype=np.int64)
+        found = index.candidates(keys)
+        items = np.repeat(np.arange(eligible.shape[0]), [rows.shape[0] for rows in found])
+        if items.size:
+            rows = np.concatenate(found)
+            deleted = self._tombstone_mask()
+            if deleted is not None:
+                live = ~deleted[rows]
+                items, rows = items[live], rows[live]
+            similarities = np.empty(rows.shape[0], dtype=np.float32)
+            for offset in range(0, rows.shape[0], block):
+                candidates = np.asarray(self._arena.take(rows[offset:offset + block]), dtype=np.float32)
+                candidate_norms = np.linalg.norm(candidates, axis=1)
+                candidate_norms[candidate_norms == 0] = 1.0
+                similarities[offset:offset + block] = np.einsum(
+                    "ij,ij->i", candidates, units[items[offset:offset + block]]
+                ) / candidate_norms
+            hits = similarities >= self.dedup_threshold
+            order = np.lexsort((-similarities[hits], items[hits]))
+            items, rows = items[hits][order], rows[hits][order]
+            first = np.flatnonzero(np.r_[True, items[1:] != items[:-1]]) if items.size else items
+            stored[items[first]] = rows[first]
+
+        # Duplicates within the batch, of earlier memories that are kept
+        pending = index.batch_duplicates(keys, units, self.dedup_threshold, resolved=stored >= 0)
+
+        duplicate = (stored >= 0) | (pending >= 0)
+        if not duplicate.any():
+            return documents, vectors, (eligible, keys)
+        updated = {}
+        for item in np.flatnonzero(duplicate).tolist():
+            document = documents[eligible[item]]
+            if stored[item] >= 0:
+                row = int(stored[item])
+                updated[row] = self._record_duplicate(self.documents[row], document)
+            else:
+                self._record_duplicate(documents[eligible[pending[item]]], document)
+        for row, info in updated.items():
+            self._journal_record("dedup", row, info)
+        self.dedup_suppressed += int(duplicate.sum())
+
+        keep = np.ones(len(documents), dtype=bool)
+        keep[eligible[duplicate]] = False
+        positions = (np.cumsum(keep) - 1)[eligible[~duplicate]]
+        documents = [document for document, kept in zip(documents, keep) if kept]
+        return documents, vectors[keep], (positions, keys[~duplicate])
+
+    def _record_duplicate(self, survivor: dict, duplicate: dict) -> dict:
+        """Count a suppressed duplicate on the surviving document; returns its new DEDUP_KEY value."""
+        info = dict(survivor.get(DEDUP_KEY) or {})
+        info["hits"] = info.get("hits", 0) + 1
+        if self.dedup_mode == "merge":
+            info["last_seen"] = duplicate.get("timestamp") or time.strftime("%Y-%m-%d %H:%M:%S")
+        # A new dict each time: journaled records keep the value they were written with
+        survivor[DEDUP_KEY] = info
+        return info
+
+    def _journal_record(self, op, *payload):
+        """Queue a mutation for the write-ahead log, if one is open."""
+        if self._wal is None:
+            return
+        with self.lock:
+            self._log_seq += 1
+            self._journal.append((self._log_seq, op) + payload)
+
+    def _apply_record(self, record):
+        """Re-apply a write-ahead log record to vectors and documents (indexes are rebuilt afterwards)."""
+        op = record[1]
+        if op == "add":
+            self._append_vector(record[3])
+            self.documents.append(record[2])
+            self._doc_ids.append(self._new_doc_id())
+        elif op == "add_many":
+            self._append_vectors(record[3])
+            self.documents.extend(record[2])
+            self._doc_ids.extend(self._new_doc_id() for _ in record[2])
+        elif op == "delete":
+            self._tombstone_rows(record[2], update_bm25=False)
+        elif op == "compact":
+            self._compact_rows()
+        elif op == "dedup":
+            self.documents[record[2]][DEDUP_KEY] = record[3]
+        elif op == "field":
+            self.documents[record[2]][record[3]] = record[4]
+        elif op == "remove":
+            # Written before tombstone deletion: remove one row immediately
+            self._tombstone_rows([record[2]], update_bm25=False)
+            self._compact_rows()
+        else:
+            raise ValueError(f"Unknown memory log record: {op}")
+
+    def _new_doc_id(self) -> int:
+        doc_id = self._next_doc_id
+        self._next_doc_id += 1
+        return doc_id
+
+    def _reset_rows(self):
+        """Assign fresh ids and clear tombstones after the documents were replaced wholesale."""
+        self._doc_ids = [self._new_doc_id() for _ in self.documents or []]
+        self._tombstones[:] = False
+        self._deleted_count = 0
+        self._metadata = None
+        self._dedup = None
+        self.rerank_cache.clear()
+
+    @synchronized
+    def doc_id(self, index) -> int:
+        """Stable in-process id of the document at row `index` (unchanged when earlier rows are removed)."""
+        if len(self._doc_ids) != len(self.documents):
+            self._reset_rows()
+        return self._doc_ids[index]
+
+    @synchronized
+    def row_of(self, doc_id: int):
+        """Current row of the document with stable id `doc_id` (see doc_id), or None if it was removed."""
+        if len(self._doc_ids) != len(self.documents):
+            self._reset_rows()
+        # Ids are assigned in row order and compaction keeps that order
+        row = bisect.bisect_left(self._doc_ids, doc_id)
+        if row == len(self._doc_ids) or self._doc_ids[row] != doc_id or self.is_deleted(row):
+            return None
+        return row
+
+    @property
+    def live_count(self) -> int:
+        """Number of documents that are not deleted."""
+        return len(self.documents) - self._deleted_count
+
+    @property
+    def deleted_fraction(self) -> float:
+        """Fraction of rows that are tombstoned and waiting for compaction."""
+        return self._deleted_count / len(self.documents) if self.documents else 0.0
+
+    def _tombstone_mask(self):
+        """Boolean mask over the rows, True for deleted rows, or None if nothing is deleted."""
+        if not self._deleted_count:
+            return None
+        return self._tombstone_buffer()
+
+    def _tombstone_buffer(self):
+        """Writable tombstone mask over the rows, grown (by doubling) to the current row count."""
+        rows = len(self.documents)
+        if self._tombstones.shape[0] < rows:
+            grown = np.zeros(max(rows, self._tombstones.shape[0] * 2), dtype=bool)
+            grown[:self._tombstones.shape[0]] = self._tombstones
+            self._tombstones = grown
+        return self._tombstones[:rows]
+
+    def is_deleted(self, index) -> bool:
+        """True if the row at `index` is tombstoned."""
+        mask = self._tombstone_mask()
+        return mask is not None and bool(mask[index])
+
+    def _tombstone_rows(self, rows, update_bm25: bool = True):
+        """
+        Mark rows deleted. Vectors, documents and row numbers are left in place.
+
+        Returns:
+        - np.ndarray: The rows that were newly deleted.
+        """
+        rows = np.asarray(rows, dtype=np.int64).reshape(-1)
+        rows = np.where(rows < 0, rows + len(self.documents), rows)
+        if rows.size and (rows.min() < 0 or rows.max() >= len(self.documents)):
+            raise IndexError("document index out of range")
+        mask = self._tombstone_buffer()
+        rows = np.unique(rows[~mask[rows]])
+        mask[rows] = True
+        self._deleted_count += rows.shape[0]
+
+        removed_ids = {self.doc_id(row) for row in rows.tolist()}
+        if removed_ids:
+            self.rerank_cache.invalidate(lambda key: key[1] in removed_ids)
+        if update_bm25 and self.rag_strategy == "hybrid" and self.bm25_mode == "incremental" and rows.size:
+            self.bm25_retriever.delete(rows.tolist())
+        return rows
+
+    def _compact_rows(self):
+        """Drop tombstoned rows from the vectors, documents and vector indexes in one pass."""
+        mask = self._tombstone_mask()
+        if mask is None:
+            return 0
+        keep = ~mask
+        dead = np.flatnonzero(mask)
+        if self._arena is not None:
+            self._arena.delete(dead)
+        if self._unit_arena is not None:
+            self._unit_arena.delete(dead)
+        if self._quantized is not None:
+            self._quantized.delete(dead)
+        if self.ann_index is not None:
+            self.ann_index.compact(keep)
+        if self._metadata is not None:
+            self._metadata.compact(keep)
+        if self._dedup is not None:
+            self._dedup.compact(keep)
+            self._dedup_rows = int(keep[:self._dedup_rows].sum())
+        self.documents = [doc for doc, alive in zip(self.documents, keep) if alive]
+        self._doc_ids = [doc_id for doc_id, alive in zip(self._doc_ids, keep) if alive]
+        self._tombstones[:] = False
+        self._deleted_count = 0
+        return dead.shape[0]
+
+    def _live_top_k(self, similarities, top_k: int):
+        """Top-k (rows, similarities) of a fresh similarity vector, skipping deleted rows."""
+        mask = self._tombstone_mask()
+        if mask is not None:
+            similarities[mask] = -np.inf
+            top_k = min(top_k, self.live_count)
+        top_indices = top_k_indices(similarities, top_k)
+        return top_indices, similarities[top_indices]
+
+    @property
+    def metadata(self) -> MetadataColumns:
+        """Timestamp, kind and source columns parallel to the rows (built from the documents on first use)."""
+        if self._metadata is None or len(self._metadata) != len(self.documents):
+            self._metadata = MetadataColumns(self.documents)
+        return self._metadata
+
+    @synchronized
+    def filter_rows(self, filters: dict = None):
+        """
+        Live rows matching metadata filters, in ascending order.
+
+        Parameters:
+        - filters (dict, optional): Predicates on timestamp, kind and source (see
+          module_metadata), e.g. {"since": "2025-03-01 00:00:00", "kind": "dialog"}.
+
+        Returns:
+        - np.ndarray or None: Matching rows, or None when there are no filters.
+        """
+        if not filters:
+            return None
+        with self.timings.time("filter"):
+            return self.metadata.select(filters, exclude=self._tombstone_mask())
+
+    def cache_stats(self) -> dict:
+        """Hit/miss counters and sizes of the query embedding and reranker caches."""
+        return {"embedding": self.embedding_cache.stats(), "rerank": self.rerank_cache.stats()}
+
+    def timing_stats(self) -> dict:
+        """Per-stage query latency (see StageTimings.stats)."""
+        return self.timings.stats()
+
+    def _candidate_count(self, top_k: int, rows=None) -> int:
+        """Vector / BM25 hits fetched per branch of a hybrid query."""
+        return min(max(top_k * 2, self.rerank_candidates), self.live_count if rows is None else rows.shape[0])
+
+    def _query_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        if self._query_pool is None:
+            self._query_pool = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="HybridQuery")
+        return self._query_pool
+
+    def _run_branches(self, vector_branch, bm25_branch):
+        """
+        Run the vector and BM25 branches of a hybrid query, concurrently if parallel_hybrid.
+
+        Both branches spend most of their time in NumPy, torch and the BM25 tokenizer,
+        which release the GIL, so a thread is enough to overlap them.
+        """
+        if not self.parallel_hybrid:
+            return vector_branch(), bm25_branch()
+        bm25_future = self._query_executor().submit(bm25_branch)
+        try:
+            vector_result = vector_branch()
+        finally:
+            bm25_result = bm25_future.result()
+        return vector_result, bm25_result
+
+    def _embed_queries(self, query_texts):
+        """
+        Embed query texts, reusing cached embeddings of previously seen queries.
 
-    def add_documents(self, documents, vectors=None):
+        Only cache misses are sent to the embedding function, in one batch.
+
+        Returns:
+        - np.ndarray: (len(query_texts), d) float32 query vectors.
+        """
+        keys = [normalize_query(text) for text in query_texts]
+        vectors = [self.embedding_cache.get(key) for key in keys]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            with self.timings.time("embed"):
+                embedded = np.asarray(self.embedding_function([query_texts[i] for i in missing]), dtype=np.float32)
+            for i, vector in zip(missing, embedded):
+                vectors[i] = vector
+                self.embedding_cache.put(keys[i], vector)
+        return np.stack(vectors)
+
+    def embed_query(self, query_text: str) -> np.ndarray:
+        """
+        Embedding of a query text, cached like those of query(). Takes no lock, so
+        callers holding HyperDB.lock across several calls can embed before taking it.
+
+        Returns:
+        - np.ndarray: (d,) float32 query vector.
+        """
+        return self._embed_queries([query_text])[0]
+
+    def _open_wal(self, storage_file: str, records: int = 0, reset: bool = False):
+        """Open the write-ahead log that sits next to `storage_file`."""
+        path = f"{storage_file}.wal"
+        if self._wal is not None and self._wal.path != path:
+            self._wal.close()
+            self._wal = None
+        if self._wal is None:
+            self._wal = WriteAheadLog(path, fsync_every=self.wal_fsync_every, records=records)
+        if reset:
+            self._wal.reset()
+        self._journal = []
+
+    def add_documents(self, documents, vectors=None, batch_size: int = None, show_progress: bool = False, journal: bool = True):
+        """
+        Bulk-add documents.
+
+        Documents are embedded in mini-batches of `batch_size` (default `embed_batch_size`),
+        then all vectors are appended in one operation and the BM25 / vector indexes
+        are updated once, so ingesting N documents costs O(N) rather than O(N^2).
+
+        Parameters:
+        - documents (list): Documents to add.
+        - vectors (optional): Precomputed (N, d) vectors; skips embedding.
+        - batch_size (int, optional): Documents per embedding call.
+        - show_progress (bool): Report embedding progress and throughput via queue_message.
+        - journal (bool): Record the batch for the write-ahead log. Pass False only when a
+          full save() follows, e.g. for a bulk import.
+        """
         if not documents:
             return
-        vectors = vectors or np.array(self.embedding_function(documents)).astype(
-            np.float32
-        )
-        for vector, document in zip(vectors, documents):
-            self.add_document(document, vector)
+        documents = list(documents)
+        start = time.perf_counter()
+        if vectors is None:
+            batch_size = batch_size or self.embed_batch_size
+            vectors = np.empty((len(documents), 0), dtype=np.float32)
+            next_report = 0.1
+            for offset in range(0, len(documents), batch_size):
+                batch = self.embedding_function(documents[offset:offset + batch_size])
+                if batch is None or len(batch) == 0:
+                    queue_message("Error: Unable to get embeddings for the documents.")
+                    return
+                batch = np.asarray(batch, dtype=np.float32)
+                if not offset:
+                    vectors = np.empty((len(documents), batch.shape[1]), dtype=np.float32)
+                vectors[offset:offset + batch.shape[0]] = batch
+                done = offset + batch.shape[0]
+                if show_progress and (done / len(documents) >= next_report or done == len(documents)):
+                    rate = done / max(time.perf_counter() - start, 1e-9)
+                    queue_message(f"INFO: Embedded {done}/{len(documents)} documents ({rate:.0f} docs/s)")
+                    next_report = done / len(documents) + 0.1
+
+        inserted = self._insert_documents(documents, vectors, journal=journal)
+        if show_progress:
+            elapsed = time.perf_counter() - start
+            suppressed = f", {len(documents) - inserted} near-duplicates suppressed" if inserted < len(documents) else ""
+            queue_message(
+                f"INFO: Added {inserted} documents in {elapsed:.1f}s "
+                f"({len(documents) / max(elapsed, 1e-9):.0f} docs/s{suppressed})"
+            )
 
     def remove_document(self, index):
-        """Remove a document by its index"""
-        self.vectors = np.delete(self.vectors, index, axis=0)
-        self.documents.pop(index)
-        if self.rag_strategy == "hybrid":
-            self.corpus_texts.pop(index)
-            self._init_bm25_index()
+        """
+        Remove a document by its index.
+
+        The row is tombstoned: queries skip it at once, while vectors, documents and
+        the row numbers of other documents stay in place until compaction, which
+        runs once more than `compact_threshold` of the rows are deleted (see compact).
+        """
+        self.remove_documents([index])
+
+    @synchronized
+    def remove_documents(self, indices):
+        """
+        Remove several documents by index in one step (see remove_document).
+
+        Parameters:
+        - indices (iterable[int]): Row indices of the documents to remove.
+        """
+        rows = self._tombstone_rows(list(indices))
+        if not rows.size:
+            return
+        self._journal_record("delete", rows.tolist())
+        if self.deleted_fraction > self.compact_threshold:
+            self.compact()
+
+    @synchronized
+    def set_document_field(self, doc_ids, key: str, values):
+        """
+        Set a bookkeeping field (not used for search) on stored documents, journaled
+        so it survives a replay of the write-ahead log.
+
+        Parameters:
+        - doc_ids (list[int]): Stable ids of the documents (see doc_id); removed ones are skipped.
+        - key (str): Field name.
+        - values (list): New value per document.
+        """
+        for doc_id, value in zip(doc_ids, values):
+            row = self.row_of(doc_id)
+            if row is None:
+                continue
+            self.documents[row][key] = value
+            self._journal_record("field", row, key, value)
+
+    def compact(self):
+        """
+        Drop tombstoned rows from storage and indexes; later rows shift up.
+
+        Compaction is synchronous: it runs in the caller's thread under the lock, as
+        one O(N) pass over vectors, documents and indexes, so queries wait for it.
+        remove_documents calls it when its delete pushes the deleted fraction past
+        `compact_threshold`, and save calls it before writing a snapshot. Query
+        results are the same before and after; only the incremental BM25 postings
+        rebuild it may trigger can run in the background.
+
+        Returns:
+        - int: Number of rows dropped.
+        """
+        with self.lock:
+            removed = self._compact_rows()
+            if not removed:
+                return 0
+            self._journal_record("compact")
+            if self.rag_strategy == "hybrid":
+                if self.bm25_mode == "incremental":
+                    self.corpus_texts = [get_document_text(doc) for doc in self.documents]
+                    self.bm25_retriever.compact()
+                else:
+                    self._init_bm25_index()
+            queue_message(f"INFO: Compacted {removed} deleted memories")
+            return removed
 
     def save(self, storage_file: str):
         """
         Save the database state - only save essential data (vectors and documents).
         The RAG strategy is a runtime configuration and should not be persisted.
+
+        The snapshot is written atomically and compacts the write-ahead log:
+        the log next to `storage_file` is truncated afterwards. Deleted rows are
+        compacted away first. A `.memdb` path
+        selects the memory-mapped format (see module_memstore); the vectors are then
+        written block by block and re-mapped from the new snapshot, so rows appended
+        since the last load or save leave RAM again.
         """
-        data = {
-            "vectors": self.vectors,
-            "documents": self.documents
-        }
-        
-        try:
+        def write_snapshot(path):
             if storage_file.endswith(".gz"):
-                with gzip.open(storage_file, "wb") as f:
+                with gzip.open(path, "wb") as f:
                     pickle.dump(data, f)
             else:
-                with open(storage_file, "wb") as f:
+                with open(path, "wb") as f:
                     pickle.dump(data, f)
+
+        try:
+            with self.lock:
+                # Snapshots hold live rows only, so row numbers in later log records match
+                self.compact()
+                data = {
+                    "vectors": None if storage_file.endswith(".memdb") else self.vectors,
+                    "documents": self.documents,
+                    "log_seq": self._log_seq,
+                }
+                if storage_file.endswith(".memdb"):
+                    quantized = None
+                    if self._quantized is not None and len(self._quantized):
+                        quantized = (self._quantized.storage,) + self._quantized.blocks()
+                    save_mmap_snapshot(
+                        storage_file, self._snapshot_matrix(self._arena), data["documents"], data["log_seq"],
+                        unit_vectors=self._snapshot_matrix(self._unit_arena), quantized=quantized,
+                    )
+                    self._map_snapshot(load_mmap_snapshot(storage_file, documents=False))
+                else:
+                    atomic_write(storage_file, write_snapshot)
+                self._open_wal(storage_file, reset=True)
         except Exception as e:
             queue_message(f"ERROR: Failed to save database: {e}")
 
-    def load(self, storage_file: str) -> bool:
+    @staticmethod
+    def _snapshot_matrix(arena):
+        """An arena's rows for save_mmap_snapshot: its blocks, so a mapped base is not copied into RAM."""
+        if arena is None:
+            return None
+        return arena.blocks() or arena.view
+
+    def _map_snapshot(self, data: dict):
+        """Point the vector arenas at a just-written `.memdb` snapshot holding the same rows."""
+        vectors = data.get("vectors")
+        if vectors is None or self._arena is None or vectors.shape != (len(self._arena), self._arena.dim):
+            return
+        self._arena = VectorArena.wrap(vectors)
+        if self._unit_arena is not None and data.get("unit_vectors") is not None:
+            self._unit_arena = VectorArena.wrap(data["unit_vectors"])
+        if self._quantized is not None and data.get("quantized") is not None:
+            self._quantized = QuantizedArena.wrap(*data["quantized"])
+
+    def persist(self, storage_file: str):
+        """
+        Persist changes made since the last save/persist in O(1) of the corpus size.
+
+        Pending records are appended to the write-ahead log next to `storage_file`
+        (fsync'd in batches of `wal_fsync_every`), and the log is compacted into a new
+        snapshot once it holds `wal_compact_every` records. Falls back to a full save
+        when no log is open for `storage_file` yet.
+        """
+        with self.lock:
+            if self._wal is None or self._wal.path != f"{storage_file}.wal":
+                self.save(storage_file)
+                return
+            try:
+                records, self._journal = self._journal, []
+                self._wal.append(records)
+                self._wal.commit()
+            except Exception as e:
+                queue_message(f"ERROR: Failed to append to memory log: {e}")
+                return
+            if self._wal.records >= self.wal_compact_every:
+                self.save(storage_file)
+
+    @synchronized
+    def load(self, storage_file: str, journal: bool = True) -> bool:
         """
         Load the database state.
         The RAG strategy remains as configured during initialization.
+
+        Loads the snapshot, then replays the tail of the write-ahead log next to it.
+        With journal=False (read-only snapshots such as sealed memory segments) the
+        log is neither replayed nor opened.
         """
         try:
-            if storage_file.endswith(".gz"):
+            if storage_file.endswith(".memdb"):
+                data = load_mmap_snapshot(storage_file)
+            elif not os.path.exists(storage_file):
+                data = {}
+            elif storage_file.endswith(".gz"):
                 with gzip.open(storage_file, "rb") as f:
                     data = pickle.load(f)
             else:
@@ -368,12 +1785,28 @@ class HyperDB:
                     data = pickle.load(f)
 
             # Load only vectors and documents
-            if "vectors" in data and data["vectors"] is not None:
-                self.vectors = data["vectors"].astype(np.float32)
+            if isinstance(data.get("vectors"), np.memmap):
+                # Zero-copy: rows fault in lazily and are only copied on the first write
+                self._arena = VectorArena.wrap(data["vectors"])
+                self._rebuild_vector_indexes(unit_vectors=data.get("unit_vectors"), quantized=data.get("quantized"))
+            elif "vectors" in data and data["vectors"] is not None:
+                self.vectors = data["vectors"]
             else:
                 self.vectors = None
 
             self.documents = data.get("documents", [])
+            self._reset_rows()
+
+            # Replay log records written after the snapshot
+            self._log_seq = data.get("log_seq", 0)
+            if journal:
+                records = 0
+                for record in WriteAheadLog.replay(f"{storage_file}.wal"):
+                    records += 1
+                    if record[0] > self._log_seq:
+                        self._apply_record(record)
+                        self._log_seq = record[0]
+                self._open_wal(storage_file, records=records)
             
             # Re-initialize BM25 if we're in hybrid mode
             if self.rag_strategy == "hybrid" and self.documents:
@@ -387,7 +1820,17 @@ class HyperDB:
             traceback.print_exc()
             return False
 
-    def query(self, query_text: str, top_k: int = 5, return_similarities: bool = True):
+    def close(self):
+        """fsync and close the write-ahead log, if one is open."""
+        with self.lock:
+            if self._wal is not None:
+                self._wal.close()
+                self._wal = None
+
+    def query(
+        self, query_text: str, top_k: int = 5, return_similarities: bool = True, return_rows: bool = False,
+        filters: dict = None, query_vector=None
+    ):
         """
         Query the database using the configured RAG strategy.
         For backward compatibility, this uses either vector-only search or hybrid search
@@ -397,16 +1840,29 @@ class HyperDB:
             query_text (str): The text to search for
             top_k (int): Number of results to return
             return_similarities (bool): Whether to return similarity scores
+            return_rows (bool): Whether to append each result's row (for get_window) to its tuple
+            filters (dict): Metadata predicates (see filter_rows); only matching documents
+                are scored
+            query_vector (np.ndarray): Embedding of query_text from embed_query, if already computed
             
         Returns:
-            List of documents or (document, score) tuples if return_similarities is True
+            List of documents or (document, score) tuples if return_similarities is True;
+            with return_rows, (document, score, row) or (document, row) tuples
         """
         if self.rag_strategy == "naive":
-            return self._vector_query(query_text, top_k, return_similarities)
+            return self._vector_query(
+                query_text, top_k, return_similarities, return_rows, filters=filters, query_vector=query_vector
+            )
         else:  # hybrid
-            return self.hybrid_query(query_text, top_k, return_similarities=return_similarities)
+            return self.hybrid_query(
+                query_text, top_k, return_similarities=return_similarities, return_rows=return_rows, filters=filters,
+                query_vector=query_vector,
+            )
 
-    def _vector_query(self, query_text: str, top_k: int = 5, return_similarities: bool = True):
+    def _vector_query(
+        self, query_text: str, top_k: int = 5, return_similarities: bool = True, return_rows: bool = False,
+        filters: dict = None, rows=None, query_vector=None
+    ):
         """
         Perform vector-only search.
         
@@ -414,185 +1870,416 @@ class HyperDB:
             query_text (str): The text to search for
             top_k (int): Number of results to return
             return_similarities (bool): Whether to return similarity scores
+            return_rows (bool): Whether to append each result's row to its tuple
+            filters (dict): Metadata predicates (see filter_rows)
+            rows (np.ndarray): Rows already selected by filter_rows (instead of filters)
+            query_vector (np.ndarray): Embedding of query_text, if already computed
             
         Returns:
             List of documents or (document, score) tuples if return_similarities is True
         """
-        query_vector = self.embedding_function([query_text])[0]
-        ranked_results, similarities = hyper_SVM_ranking_algorithm_sort(
-            self.vectors, query_vector, top_k=top_k, metric=self.similarity_metric
+        with self.timings.time("total"):
+            if query_vector is None:
+                query_vector = self.embed_query(query_text)
+            with self.lock:
+                if rows is None:
+                    rows = self.filter_rows(filters)
+                if rows is not None and not rows.size:
+                    return []
+                with self.timings.time("vector"):
+                    ranked_results, similarities = self._vector_search(query_vector, top_k, rows)
+                results = self._format_results(ranked_results, similarities, return_similarities, return_rows)
+        if self.log_query_timings:
+            queue_message(f"INFO: Query timings: {self.timings.summary()}")
+        return results
+
+    def query_many(self, query_texts, top_k: int = 5, return_similarities: bool = True, return_rows: bool = False, filters: dict = None):
+        """
+        Query the database with several texts at once.
+
+        All queries are embedded in one embedding batch, scored against the vectors
+        with a single matrix-matrix product, and (in hybrid mode) run through BM25
+        retrieval in one call before per-query fusion and reranking.
+
+        Parameters:
+            query_texts (list[str]): The texts to search for
+            top_k (int): Number of results to return per query
+            return_similarities (bool): Whether to return similarity scores
+            return_rows (bool): Whether to append each result's row to its tuple
+            filters (dict): Metadata predicates applied to every query (see filter_rows)
+
+        Returns:
+            One result list per query, each shaped like the output of query()
+        """
+        query_texts = list(query_texts)
+        if not query_texts:
+            return []
+        query_vectors = self._embed_queries(query_texts)
+        with self.lock:
+            return self._query_many(query_texts, query_vectors, top_k, return_similarities, return_rows, filters)
+
+    def _query_many(self, query_texts, query_vectors, top_k: int, return_similarities: bool, return_rows: bool, filters: dict = None):
+        """query_many once the queries are embedded (called under the lock)."""
+        if not self.live_count or self._arena is None or not len(self._arena):
+            queue_message("WARNING: Empty database, returning empty results")
+            return [[] for _ in query_texts]
+        rows = self.filter_rows(filters)
+        if rows is not None and not rows.size:
+            return [[] for _ in query_texts]
+
+        if self.rag_strategy != "hybrid":
+            with self.timings.time("vector"):
+                hits = self._vector_search_many(query_vectors, top_k, rows)
+            return [
+                self._format_results(rows, similarities, return_similarities, return_rows)
+                for rows, similarities in hits
+            ]
+
+        candidates = self._candidate_count(top_k, rows)
+
+        def vector_branch():
+            with self.timings.time("vector"):
+                return self._vector_search_many(query_vectors, candidates, rows)
+
+        vector_hits, (bm25_results, bm25_scores) = self._run_branches(
+            vector_branch, lambda: self._bm25_retrieve_many(query_texts, k=candidates, rows=rows)
         )
+
+        results = []
+        for i, query_text in enumerate(query_texts):
+            try:
+                results.append(self._fuse_results(
+                    query_text, vector_hits[i][0], bm25_results[i:i + 1], bm25_scores[i:i + 1],
+                    top_k, return_similarities, return_rows=return_rows, rows=rows, query_vector=query_vectors[i],
+                ))
+            except Exception as e:
+                queue_message(f"WARNING: Hybrid query failed: {e}")
+                results.append(self._format_results(
+                    vector_hits[i][0][:top_k], vector_hits[i][1][:top_k], return_similarities, return_rows
+                ))
+        return results
+
+    def _format_results(self, ranked_results, similarities, return_similarities: bool, return_rows: bool = False):
+        """
+        Turn result rows into documents, (document, score) tuples, or, with return_rows,
+        (document, score, row) / (document, row) tuples.
+        """
+        documents = [self.documents[index] for index in ranked_results]
+        if return_rows:
+            rows = [int(index) for index in ranked_results]
+            if return_similarities:
+                return list(zip(documents, similarities, rows))
+            return list(zip(documents, rows))
         if return_similarities:
-            return list(
-                zip([self.documents[index] for index in ranked_results], similarities)
-            )
-        return [self.documents[index] for index in ranked_results]
+            return list(zip(documents, similarities))
+        return documents
+
+    @synchronized
+    def get_window(self, row: int, before: int = 1, after: int = 1) -> list:
+        """
+        Documents around a row, for context expansion around a query hit.
+
+        Deleted rows are skipped, so up to `before` documents before and `after`
+        documents after the row are returned, in order, with the row's own document
+        in between. Costs O(before + after), independent of the corpus size.
 
-    def _rerank_results(self, query: str, candidate_docs: list) -> list:
+        Parameters:
+        - row (int): Row of the centre document (e.g. from query(..., return_rows=True)).
+        - before (int): Number of preceding documents.
+        - after (int): Number of following documents.
+
+        Returns:
+        - list: The documents of the window.
+        """
+        if not 0 <= row < len(self.documents):
+            raise IndexError("document index out of range")
+        deleted = self._tombstone_mask()
+
+        def neighbours(step, count):
+            found, current = [], row + step
+            while len(found) < count and 0 <= current < len(self.documents):
+                if deleted is None or not deleted[current]:
+                    found.append(current)
+                current += step
+            return found
+
+        rows = neighbours(-1, before)[::-1] + [row] + neighbours(1, after)
+        return [self.documents[index] for index in rows]
+
+    def _rerank_results(self, query: str, candidate_docs: list, candidate_ids: list = None) -> list:
         """
         Rerank candidate documents using the BGE reranker model.
         
         Parameters:
         - query: The search query
         - candidate_docs: List of candidate documents to rerank
+        - candidate_ids: Stable document ids (see doc_id) of the candidates; when given,
+          scores are looked up in and stored to the reranker cache
         
         Returns:
         - List of (doc, score) tuples after reranking
         """
-        if not hasattr(self, 'reranker') or not self.reranker or not candidate_docs:
+        rerank_scores = self._rerank_scores(query, candidate_docs, candidate_ids)
+        if rerank_scores is None:
             return candidate_docs
 
+        # Sort documents by reranking scores
+        reranked_results = list(zip(candidate_docs, rerank_scores))
+        reranked_results.sort(key=lambda x: x[1], reverse=True)
+        return reranked_results
+
+    def _rerank_scores(self, query: str, candidate_docs: list, candidate_ids: list = None):
+        """
+        BGE reranker scores of the candidates, in candidate order (see _rerank_results).
+
+        Returns:
+        - list[float] or None: None when no reranker is loaded or reranking failed.
+        """
+        if not hasattr(self, 'reranker') or not self.reranker or not candidate_docs:
+            return None
+
         try:
-            # Prepare pairs for reranking
-            pairs = []
-            for doc in candidate_docs:
-                # Extract text from document based on its type
-                if isinstance(doc, dict):
-                    text = ""
-                    if "user_input" in doc:
-                        text += doc["user_input"] + " "
-                    if "bot_response" in doc:
-                        text += doc["bot_response"]
-                    if not text:  # If no specific fields found, use all text fields
-                        text = " ".join(str(v) for v in doc.values() if isinstance(v, (str, int, float)))
+            query_hash = hash(normalize_query(query))
+            if candidate_ids is not None:
+                rerank_scores = [self.rerank_cache.get((query_hash, doc_id)) for doc_id in candidate_ids]
+            else:
+                rerank_scores = [None] * len(candidate_docs)
+            missing = [i for i, score in enumerate(rerank_scores) if score is None]
+
+            if missing:
+                # Prepare pairs for reranking
+                pairs = []
+                for i in missing:
+                    # Format pairs for CrossEncoder
+                    pairs.append([query, get_document_text(candidate_docs[i])])
+
+                scores = self.reranker.predict(pairs)
+
+                # Ensure scores are in the right format
+                if isinstance(scores, (list, np.ndarray)):
+                    scores = [float(score) for score in scores]
                 else:
-                    text = str(doc)
-                # Format pairs for CrossEncoder
-                pairs.append([query, text])
+                    scores = [float(scores)]
 
-            scores = self.reranker.predict(pairs)
-            
-            # Ensure scores are in the right format
-            if isinstance(scores, (list, np.ndarray)):
-                rerank_scores = [float(score) for score in scores]
-            else:
-                rerank_scores = [float(scores)]
+                # Safety check for scores
+                if len(scores) != len(missing):
+                    queue_message(f"WARNING: Mismatch between scores ({len(scores)}) and docs ({len(missing)})")
+                    return None
 
-            # Safety check for scores
-            if len(rerank_scores) != len(candidate_docs):
-                queue_message(f"WARNING: Mismatch between scores ({len(rerank_scores)}) and docs ({len(candidate_docs)})")
-                return candidate_docs
-            
-            # Sort documents by reranking scores
-            reranked_results = list(zip(candidate_docs, rerank_scores))
-            reranked_results.sort(key=lambda x: x[1], reverse=True)
-            
-            return reranked_results
+                for i, score in zip(missing, scores):
+                    rerank_scores[i] = score
+                    if candidate_ids is not None:
+                        self.rerank_cache.put((query_hash, candidate_ids[i]), score)
+
+            return rerank_scores
             
         except Exception as e:
             queue_message(f"WARNING: Reranking failed: {e}. Returning original order.")
             import traceback
             traceback.print_exc()
-            return candidate_docs
+            return None
 
     def hybrid_query(
         self, 
         query_text: str, 
         top_k: int = 5, 
         return_similarities: bool = True,
-        rrf_k: int = 60
+        rrf_k: int = 60,
+        return_rows: bool = False,
+        filters: dict = None,
+        rerank: bool = True,
+        query_vector=None
     ):
         """
         Hybrid search using RRF fusion and BGE reranker.
-        The pipeline: vector search -> BM25 -> RRF fusion -> BGE reranking.
+        The pipeline: embedding -> (vector search || BM25) -> RRF fusion -> BGE reranking,
+        where vector search and BM25 retrieval run concurrently. The query is embedded
+        (unless query_vector is given) before the database lock is taken.
+        With `filters` (see filter_rows), both branches only consider matching documents.
+        With rerank=False, results stay in RRF order (e.g. to rerank candidates merged
+        from several databases once).
         """
-        if not self.documents or not self.vectors.size:
+        if query_vector is None:
+            query_vector = self.embed_query(query_text)
+        with self.lock:
+            return self._hybrid_query(query_text, query_vector, top_k, return_similarities, rrf_k, return_rows, filters, rerank)
+
+    def _hybrid_query(
+        self, query_text: str, query_vector, top_k: int, return_similarities: bool, rrf_k: int, return_rows: bool,
+        filters: dict = None, rerank: bool = True
+    ):
+        """hybrid_query once the query is embedded (called under the lock)."""
+        if not self.live_count or self._arena is None or not len(self._arena):
             queue_message("WARNING: Empty database, returning empty results")
             return [] if not return_similarities else []
 
         if self.rag_strategy != "hybrid":
             queue_message("WARNING: Hybrid query called but RAG strategy is 'naive'. Falling back to vector search.")
-            return self._vector_query(query_text, top_k, return_similarities)
-
-        try:
-            # Vector Search
-            query_vector = self.embedding_function([query_text])[0]
-            vector_results, vector_scores = hyper_SVM_ranking_algorithm_sort(
-                self.vectors, query_vector, top_k=min(top_k * 2, len(self.documents)), 
-                metric=self.similarity_metric
+            return self._vector_query(
+                query_text, top_k, return_similarities, return_rows, filters=filters, query_vector=query_vector
             )
-            
-            # BM25 Search
-            query_tokens = bm25s.tokenize([query_text], stopwords="en", stemmer=self.stemmer)
-            bm25_results, bm25_scores = self.bm25_retriever.retrieve(query_tokens, k=min(top_k * 2, len(self.documents)))
-            
-            # Validate BM25 results
-            if not isinstance(bm25_results, (list, np.ndarray)) or not isinstance(bm25_scores, (list, np.ndarray)):
-                queue_message("WARNING: Invalid BM25 results format, falling back to vector search")
-                return self._vector_query(query_text, top_k, return_similarities)
 
-            try:
-                bm25_results = bm25_results[0]
-                bm25_scores = bm25_scores[0]
-            except (IndexError, TypeError) as e:
-                queue_message(f"WARNING: Error processing BM25 results: {e}")
-                return self._vector_query(query_text, top_k, return_similarities)
-
-            # RRF Fusion
-            vector_ranks = {doc_id: rank + 1 for rank, doc_id in enumerate(vector_results) 
-                        if isinstance(doc_id, (int, np.integer)) and doc_id < len(self.documents)}
-            bm25_ranks = {doc_id: rank + 1 for rank, doc_id in enumerate(bm25_results) 
-                        if isinstance(doc_id, (int, np.integer)) and doc_id < len(self.documents)}
-
-            if not vector_ranks and not bm25_ranks:
-                queue_message("WARNING: No valid ranks found")
-                return self._vector_query(query_text, top_k, return_similarities)
-
-            # Calculate RRF scores
-            rrf_scores = {}
-            all_doc_ids = set(vector_ranks.keys()) | set(bm25_ranks.keys())
-            
-            for doc_id in all_doc_ids:
-                if not isinstance(doc_id, (int, np.integer)) or doc_id >= len(self.documents):
-                    continue
-                vector_rank = vector_ranks.get(doc_id, len(self.documents) + 1)
-                bm25_rank = bm25_ranks.get(doc_id, len(self.documents) + 1)
-                rrf_score = (1 / (rrf_k + vector_rank)) + (1 / (rrf_k + bm25_rank))
-                rrf_scores[doc_id] = rrf_score
-
-            # Reranking
-            rrf_ranked = sorted(rrf_scores.items(), key=lambda x: x[1], reverse=True)
-            rrf_ranked = rrf_ranked[:min(top_k * 2, len(rrf_ranked))]
-            
-            # Create candidate docs
-            candidate_docs = []
-            valid_indices = []
-            for idx, score in rrf_ranked:
-                if isinstance(idx, (int, np.integer)) and idx < len(self.documents):
-                    candidate_docs.append(self.documents[idx])
-                    valid_indices.append(idx)
-
-            if not candidate_docs:
-                queue_message("WARNING: No valid candidates for reranking")
-                return self._vector_query(query_text, top_k, return_similarities)
-
-            # Apply reranking
-            reranked_results = self._rerank_results(query_text, candidate_docs)
-            
-            # Process results
-            try:
-                if reranked_results and isinstance(reranked_results[0], tuple):
-                    final_results = reranked_results[:min(top_k, len(reranked_results))]
+        rows = self.filter_rows(filters)
+        if rows is not None and not rows.size:
+            return []
+        candidates = self._candidate_count(top_k, rows)
 
-                    if return_similarities:
-                        return final_results
-                    return [doc for doc, _ in final_results]
-                else:
-                    queue_message("WARNING: Reranking failed, using RRF results")
-                    candidate_docs = candidate_docs[:min(top_k, len(candidate_docs))]
-                    if return_similarities:
-                        return [(doc, rrf_scores[idx]) for doc, idx in zip(candidate_docs, valid_indices[:len(candidate_docs)])]
-                    return candidate_docs
-
-            except (IndexError, TypeError) as e:
-                queue_message(f"WARNING: Error processing results: {e}")
-                candidate_docs = candidate_docs[:min(top_k, len(candidate_docs))]
-                if return_similarities:
-                    return [(doc, rrf_scores[idx]) for doc, idx in zip(candidate_docs, valid_indices[:len(candidate_docs)])]
-                return candidate_docs
+        def vector_branch():
+            with self.timings.time("vector"):
+                return self._vector_search(query_vector, top_k=candidates, rows=rows)
+
+        try:
+            with self.timings.time("total"):
+                (vector_results, vector_scores), (bm25_results, bm25_scores) = self._run_branches(
+                    vector_branch, lambda: self._bm25_retrieve(query_text, k=candidates, rows=rows)
+                )
+                results = self._fuse_results(
+                    query_text, vector_results, bm25_results, bm25_scores, top_k, return_similarities, rrf_k, return_rows,
+                    rows=rows, rerank=rerank, query_vector=query_vector,
+                )
+            if self.log_query_timings:
+                queue_message(f"INFO: Hybrid query timings: {self.timings.summary()}")
+            return results
 
         except Exception as e:
             queue_message(f"WARNING: Hybrid query failed: {e}")
             import traceback
             traceback.print_exc()
-            return self._vector_query(query_text, top_k, return_similarities)
\ No newline at end of file
+            return self._vector_query(query_text, top_k, return_similarities, return_rows, rows=rows, query_vector=query_vector)
+
+    def _fuse_results(
+        self,
+        query_text: str,
+        vector_results,
+        bm25_results,
+        bm25_scores,
+        top_k: int = 5,
+        return_similarities: bool = True,
+        rrf_k: int = 60,
+        return_rows: bool = False,
+        rows=None,
+        rerank: bool = True,
+        query_vector=None
+    ):
+        """
+        RRF fusion of vector and BM25 hits for one query, followed by BGE reranking.
+
+        bm25_results / bm25_scores are the (1, k) arrays returned by BM25 retrieval;
+        `rows` are the rows allowed by the query's filters, if any; `query_vector`
+        is reused if fusion falls back to vector search.
+        """
+        # Validate BM25 results
+        if not isinstance(bm25_results, (list, np.ndarray)) or not isinstance(bm25_scores, (list, np.ndarray)):
+            queue_message("WARNING: Invalid BM25 results format, falling back to vector search")
+            return self._vector_query(query_text, top_k, return_similarities, return_rows, rows=rows, query_vector=query_vector)
+
+        try:
+            bm25_results = bm25_results[0]
+            bm25_scores = bm25_scores[0]
+        except (IndexError, TypeError) as e:
+            queue_message(f"WARNING: Error processing BM25 results: {e}")
+            return self._vector_query(query_text, top_k, return_similarities, return_rows, rows=rows, query_vector=query_vector)
+
+        # RRF Fusion (deleted or filtered-out rows can still appear with a zero BM25 score)
+        fuse_start = time.perf_counter()
+        deleted = self._tombstone_mask()
+        if rows is not None:
+            deleted = np.ones(len(self.documents), dtype=bool)
+            deleted[rows] = False
+        vector_ranks = {doc_id: rank + 1 for rank, doc_id in enumerate(vector_results) 
+                    if isinstance(doc_id, (int, np.integer)) and doc_id < len(self.documents)}
+        bm25_ranks = {doc_id: rank + 1 for rank, doc_id in enumerate(bm25_results) 
+                    if isinstance(doc_id, (int, np.integer)) and doc_id < len(self.documents)
+                    and (deleted is None or not deleted[doc_id])}
+
+        if not vector_ranks and not bm25_ranks:
+            queue_message("WARNING: No valid ranks found")
+            return self._vector_query(query_text, top_k, return_similarities, return_rows, rows=rows, query_vector=query_vector)
+
+        # Calculate RRF scores (a hit missing from one branch ranks after every live
+        # document, so tombstoned rows awaiting compaction do not change the scores)
+        rrf_scores = {}
+        all_doc_ids = set(vector_ranks.keys()) | set(bm25_ranks.keys())
+        missing_rank = self.live_count + 1
+        
+        for doc_id in all_doc_ids:
+            if not isinstance(doc_id, (int, np.integer)) or doc_id >= len(self.documents):
+                continue
+            vector_rank = vector_ranks.get(doc_id, missing_rank)
+            bm25_rank = bm25_ranks.get(doc_id, missing_rank)
+            rrf_score = (1 / (rrf_k + vector_rank)) + (1 / (rrf_k + bm25_rank))
+            rrf_scores[doc_id] = rrf_score
+
+        # Reranking (ties in row order, which compaction preserves). Only the first
+        # rerank_count candidates go to the cross-encoder, but at least top_k are kept
+        rrf_ranked = sorted(rrf_scores.items(), key=lambda x: (-x[1], x[0]))
+        rerank_count = self.rerank_candidates or top_k * 2
+        rrf_ranked = rrf_ranked[:max(top_k, rerank_count)]
+        
+        # Create candidate docs
+        candidate_docs = []
+        valid_indices = []
+        for idx, score in rrf_ranked:
+            if isinstance(idx, (int, np.integer)) and idx < len(self.documents):
+                candidate_docs.append(self.documents[idx])
+                valid_indices.append(idx)
+
+        if not candidate_docs:
+            queue_message("WARNING: No valid candidates for reranking")
+            return self._vector_query(query_text, top_k, return_similarities, return_rows, rows=rows, query_vector=query_vector)
+
+        self.timings.record("fuse", time.perf_counter() - fuse_start)
+
+        # Skip the cross-encoder when there is none, it cannot change the answer, or fusion is already decisive
+        if not rerank or not getattr(self, 'reranker', None):
+            rows = valid_indices[:top_k]
+            return self._format_results(rows, [rrf_scores[idx] for idx in rows], return_similarities, return_rows)
+        if len(valid_indices) == 1 or (
+            self.rerank_skip_margin > 0
+            and (rrf_ranked[0][1] - rrf_ranked[1][1]) >= self.rerank_skip_margin * rrf_ranked[0][1]
+        ):
+            self.rerank_skipped += 1
+            rows = valid_indices[:top_k]
+            return self._format_results(rows, [rrf_scores[idx] for idx in rows], return_similarities, return_rows)
+
+        # Apply reranking
+        with self.timings.time("rerank"):
+            rerank_scores = self._rerank_scores(
+                query_text, candidate_docs[:rerank_count], [self.doc_id(idx) for idx in valid_indices[:rerank_count]]
+            )
+        
+        # Process results (candidates past rerank_count follow in RRF order with their RRF scores)
+        if rerank_scores is not None:
+            order = sorted(range(len(rerank_scores)), key=lambda i: rerank_scores[i], reverse=True)
+            rows = ([valid_indices[i] for i in order] + valid_indices[len(order):])[:top_k]
+            scores = ([rerank_scores[i] for i in order] + [rrf_scores[idx] for idx in valid_indices[len(order):]])[:top_k]
+        else:
+            queue_message("WARNING: Reranking failed, using RRF results")
+            rows = valid_indices[:top_k]
+            scores = [rrf_scores[idx] for idx in rows]
+        return self._format_results(rows, scores, return_similarities, return_rows)
+
+def convert_pickle_to_mmap(pickle_file: str, memdb_dir: str) -> bool:
+    """
+    Convert a `.pickle.gz` memory file (plus its write-ahead log) to the memory-mapped format.
+
+    The source files are left untouched.
+
+    Parameters:
+    - pickle_file (str): Existing pickle snapshot.
+    - memdb_dir (str): Destination `.memdb` directory.
+
+    Returns:
+    - bool: True if the conversion succeeded.
+    """
+    source = HyperDB(rag_strategy="naive")
+    if not source.load(pickle_file):
+        return False
+    source.close()
+    try:
+        save_mmap_snapshot(memdb_dir, source.vectors, source.documents, unit_vectors=source.unit_vectors)
+    except Exception as e:
+        queue_message(f"ERROR: Failed to convert memory to mmap format: {e}")
+        return False
+    queue_message(f"INFO: Converted {os.path.basename(pickle_file)} to {os.path.basename(memdb_dir)} ({len(source.documents)} memories)")
+    return True
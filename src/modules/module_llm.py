@@ -183,7 +183,8 @@ def llm_process(user_input, bot_response):
     - str: The processed bot response.
     """
     if memory_manager:
-        threading.Thread(target=memory_manager.write_longterm_memory, args=(user_input, bot_response)).start()
+        # Queued for the memory writer thread; returns immediately
+        memory_manager.write_longterm_memory(user_input, bot_response)
     
     if CONFIG['EMOTION']['enabled']:
         emotionvalue = threading.Thread(target=detect_emotion, args=(bot_response,)).start()
@@ -9,18 +9,134 @@ Ensures contextual and historical knowledge during interactions.
 # === Standard Libraries ===
 import os
 import json
+import time
+import bisect
 import requests
+import threading
+import concurrent.futures
 from typing import List
 from datetime import datetime
-from hyperdb import HyperDB
 import numpy as np
 
 # === Custom Modules ===
 from modules.module_hyperdb import *
-from modules.module_config import load_config
+from modules.module_memstore import MemoryWriter
+from modules.module_segments import SegmentedHyperDB
+from modules.module_dedup import DEDUP_KEY
+from modules.module_cache import LRUCache
+from modules.module_embedding import configure_provider
 from modules.module_messageQue import queue_message
 
-CONFIG = load_config()
+def iter_json_records(path: str, chunk_size: int = 1 << 16):
+    """
+    Stream records from a JSON array file or a JSON Lines file without loading it whole.
+
+    Parameters:
+    - path (str): File to read. A file whose first non-blank character is '[' is parsed
+      as one JSON array; anything else as one JSON value per line.
+    - chunk_size (int): Characters read per step.
+
+    Yields:
+    - tuple: (record, characters consumed so far), the latter for progress reporting.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = f.read(chunk_size).lstrip("\ufeff")
+        while not buffer.strip():
+            more = f.read(chunk_size)
+            if not more:
+                return
+            buffer = (buffer + more).lstrip("\ufeff")
+        offset = 0  # characters dropped from the front of buffer
+        stripped = buffer.lstrip()
+
+        if not stripped.startswith("["):
+            f.seek(0)
+            consumed = 0
+            for line in iter(f.readline, ""):
+                consumed += len(line)
+                line = line.strip().lstrip("\ufeff")
+                if line:
+                    yield json.loads(line), consumed
+            return
+
+        pos = len(buffer) - len(stripped) + 1
+        eof = False
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buffer) - 1 and not eof:
+                more = f.read(chunk_size)
+                eof = not more
+                offset += pos
+                buffer, pos = buffer[pos:] + more, 0
+                continue
+            if pos >= len(buffer):
+                raise ValueError(f"Unterminated JSON array in {os.path.basename(path)}")
+            if buffer[pos] == "]":
+                return
+            try:
+                record, end = decoder.raw_decode(buffer, pos)
+                if not eof and (end == len(buffer) or buffer[end] not in " \t\r\n,]"):
+                    raise json.JSONDecodeError("value may continue in the next chunk", buffer, end)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                more = f.read(chunk_size)
+                eof = not more
+                offset += pos
+                buffer, pos = buffer[pos:] + more, 0
+                continue
+            pos = end
+            yield record, offset + pos
+
+TOKEN_COUNTS_KEY = "token_counts"
+
+def without_bookkeeping(document):
+    """A memory document without the cached token counts and duplicate hits stored in it."""
+    if not isinstance(document, dict):
+        return document
+    return {key: value for key, value in document.items() if key not in (TOKEN_COUNTS_KEY, DEDUP_KEY)}
+
+def turn_text(document: dict, user_name: str = "{user}", char_name: str = "{char}") -> str:
+    """Text a conversation turn adds to the prompt's recent conversation ('' if not a full turn)."""
+    user_input = document.get('user_input', "")
+    bot_response = document.get('bot_response', "")
+    if not user_input or not bot_response:
+        return ""
+    return f"{user_name}: {user_input}\n{char_name}: {bot_response}"
+
+class TurnTokenIndex:
+    """
+    Prefix sums of per-turn token counts over the conversation turns in HyperDB.
+
+    Built for one tokenizer and pair of names; new turns are appended incrementally
+    and the index is rebuilt from the documents' cached counts if a memory was
+    deleted. Each turn also pays for the newline that joins it to the next one.
+    """
+    def __init__(self, tokenizer_key: str, separator_tokens: int = 0):
+        self.tokenizer_key = tokenizer_key
+        self.separator_tokens = separator_tokens
+        self.documents = []     # full conversation turns, oldest first
+        self.prefix = [0]       # prefix[i] = tokens in documents[:i]
+        self.last_doc_id = -1   # newest HyperDB doc id covered
+        self.live_count = 0     # HyperDB live documents covered (turns or not)
+
+    def append(self, document: dict, tokens: int):
+        self.documents.append(document)
+        self.prefix.append(self.prefix[-1] + tokens + self.separator_tokens)
+
+    def newest_within(self, token_limit: int) -> list:
+        """Longest run of most recent turns whose newline-joined token total fits in token_limit."""
+        total = self.prefix[-1]
+        start = bisect.bisect_left(self.prefix, total - token_limit - self.separator_tokens)
+        return self.documents[start:]
+
+    def length(self, turns: int) -> int:
+        """Token total of the newest `turns` turns joined by newlines."""
+        if not turns:
+            return 0
+        return self.prefix[-1] - self.prefix[len(self.documents) - turns] - self.separator_tokens
 
 class MemoryManager:
     """
@@ -30,28 +146,147 @@ class MemoryManager:
         self.config = config
         self.char_name = char_name
         self.char_greeting = char_greeting
-        self.memory_db_path = os.path.abspath(os.path.join(os.path.join("..", "memory"), f"{self.char_name}.pickle.gz"))
         
         # Load RAG configuration from dictionary
         rag_config = self.config.get('RAG', {})  # Get RAG section or empty dict if not exists
+        self.storage_format = rag_config.get('storage_format', 'pickle')
+        pickle_db_path = os.path.abspath(os.path.join(os.path.join("..", "memory"), f"{self.char_name}.pickle.gz"))
+        if self.storage_format == "mmap":
+            self.memory_db_path = os.path.abspath(os.path.join(os.path.join("..", "memory"), f"{self.char_name}.memdb"))
+            if not os.path.exists(self.memory_db_path) and os.path.exists(pickle_db_path):
+                queue_message(f"LOAD: Converting {self.char_name}.pickle.gz to memory-mapped format")
+                convert_pickle_to_mmap(pickle_db_path, self.memory_db_path)
+        else:
+            self.memory_db_path = pickle_db_path
+        self.segments_dir = os.path.abspath(os.path.join(os.path.join("..", "memory"), f"{self.char_name}.segments"))
+
         self.rag_strategy = rag_config.get('strategy', 'naive')  # Default to 'naive' if not specified
         self.vector_weight = float(rag_config.get('vector_weight', 0.5))  # Default to 0.5 if not specified
         self.top_k = int(rag_config.get('top_k', 5))  # Default to 5 if not specified
+        self.bm25_mode = rag_config.get('bm25_mode', 'incremental')
+        self.bm25_rebuild_threshold = float(rag_config.get('bm25_rebuild_threshold', 0.25))
+        self.wal_fsync_every = int(rag_config.get('wal_fsync_every', 8))
+        self.wal_compact_every = int(rag_config.get('wal_compact_every', 256))
+        self.index_type = rag_config.get('index_type', 'exact')
+        self.ann_nlist = int(rag_config.get('ann_nlist', 0))
+        self.ann_nprobe = int(rag_config.get('ann_nprobe', 8))
+        self.ann_exact_threshold = int(rag_config.get('ann_exact_threshold', 10000))
+        self.embedding_cache_mb = float(rag_config.get('embedding_cache_mb', 8))
+        self.rerank_cache_mb = float(rag_config.get('rerank_cache_mb', 2))
+        self.vector_storage = rag_config.get('vector_storage', 'float32')
+        self.rescore_factor = int(rag_config.get('rescore_factor', 4))
+        self.compact_threshold = float(rag_config.get('compact_threshold', 0.25))
+        self.dedup_threshold = float(rag_config.get('dedup_threshold', 0.0))
+        self.dedup_mode = rag_config.get('dedup_mode', 'merge')
+        self.dedup_kinds = [kind.strip() for kind in rag_config.get('dedup_kinds', 'tool,text').split(",") if kind.strip()]
+        self.embed_batch_size = int(rag_config.get('embed_batch_size', 256))
+        self.segment_size = int(rag_config.get('segment_size', 0))
+        self.segment_storage = rag_config.get('segment_storage', 'int8')
+        self.memory_write_delay = float(rag_config.get('memory_write_delay', 0.25))
+        self.memory_write_batch = int(rag_config.get('memory_write_batch', 64))
+        self.parallel_hybrid = rag_config.get('parallel_hybrid', True)
+        self.log_query_timings = rag_config.get('log_query_timings', False)
+        self.reranker_backend = rag_config.get('reranker_backend', 'cross_encoder')
+        self.reranker_model = rag_config.get('reranker_model', 'BAAI/bge-reranker-base')
+        self.reranker_max_length = int(rag_config.get('reranker_max_length', 256))
+        self.rerank_candidates = int(rag_config.get('rerank_candidates', 0))
+        self.rerank_skip_margin = float(rag_config.get('rerank_skip_margin', 0.0))
+        self.embedding_backend = rag_config.get('embedding_backend', 'sentence_transformers')
+        self.embedding_model = rag_config.get('embedding_model', 'sentence-transformers/all-MiniLM-L6-v2')
+        self.embedding_threads = int(rag_config.get('embedding_threads', 0))
+        self.embedding_warmup = rag_config.get('embedding_warmup', True)
+        remote_options = {}
+        if self.embedding_backend == "remote":
+            remote_options = {
+                "base_url": rag_config.get('embedding_base_url') or self.config['LLM']['base_url'],
+                "api_key": self.config['LLM'].get('api_key', ""),
+                "max_batch_chars": int(rag_config.get('embedding_max_batch_chars', 32000)),
+                "concurrency": int(rag_config.get('embedding_concurrency', 4)),
+                "timeout": float(rag_config.get('embedding_timeout', 30)),
+            }
+
+        # The embedding model itself is only loaded on first use (or by the warmup below)
+        self.embedding_provider = configure_provider(
+            self.embedding_backend, self.embedding_model, threads=self.embedding_threads, **remote_options
+        )
+        if self.embedding_warmup:
+            threading.Thread(target=self._warmup_embeddings, name="EmbeddingWarmup", daemon=True).start()
         
-        # Initialize HyperDB with the RAG strategy
-        self.hyper_db = HyperDB(rag_strategy=self.rag_strategy)
+        # Initialize HyperDB with the RAG strategy; it is the hot segment when older memories are sealed
+        db_options = dict(
+            rag_strategy=self.rag_strategy,
+            bm25_mode=self.bm25_mode,
+            bm25_rebuild_threshold=self.bm25_rebuild_threshold,
+            wal_fsync_every=self.wal_fsync_every,
+            wal_compact_every=self.wal_compact_every,
+            index_type=self.index_type,
+            ann_nlist=self.ann_nlist,
+            ann_nprobe=self.ann_nprobe,
+            ann_exact_threshold=self.ann_exact_threshold,
+            embedding_cache_mb=self.embedding_cache_mb,
+            rerank_cache_mb=self.rerank_cache_mb,
+            rescore_factor=self.rescore_factor,
+            compact_threshold=self.compact_threshold,
+            dedup_threshold=self.dedup_threshold,
+            dedup_mode=self.dedup_mode,
+            dedup_kinds=self.dedup_kinds,
+            embed_batch_size=self.embed_batch_size,
+            parallel_hybrid=self.parallel_hybrid,
+            log_query_timings=self.log_query_timings,
+            rerank_candidates=self.rerank_candidates,
+            rerank_skip_margin=self.rerank_skip_margin,
+        )
+        self.hyper_db = HyperDB(
+            reranker_backend=self.reranker_backend,
+            reranker_model=self.reranker_model,
+            reranker_max_length=self.reranker_max_length,
+            vector_storage=self.vector_storage,
+            **db_options,
+        )
+        # Sealed segments share the hot segment's reranker instead of loading their own
+        self.segments = SegmentedHyperDB(
+            self.hyper_db,
+            self.segments_dir,
+            segment_size=self.segment_size,
+            segment_storage=self.segment_storage,
+            segment_factory=lambda: HyperDB(reranker_backend="none", vector_storage=self.segment_storage, **db_options),
+        )
         self.long_mem_use = True
+        self._turn_tokens = None
+        self._turn_tokens_lock = threading.Lock()  # prompt builders on several threads share the index
+        self._encoders = {}                   # tokenizer key -> tiktoken encoding
+        self._token_counts = LRUCache(1)      # (tokenizer key, text) -> token count
+        self._http = requests.Session()       # pooled connection to the token count endpoint
+        self._token_pool = None
+        self._local_tokenizer = None          # HF tokenizer for ooba/tabby (False if unavailable)
+        self._local_token_counts = 0
         self.initial_memory_path =  os.path.abspath(os.path.join(os.path.join("..", "memory", "initial_memory.json")))
         
         self.init_dynamic_memory()
+        self.segments.open(self.memory_db_path)
         self.load_initial_memory(self.initial_memory_path)
+        self.segments.maybe_seal(self.memory_db_path)
+
+        # From here on every insert goes through the single memory writer thread
+        self.memory_writer = MemoryWriter(
+            self._write_documents,
+            batch_delay=self.memory_write_delay,
+            max_batch=self.memory_write_batch,
+        )
+
+    def _warmup_embeddings(self):
+        """Load the embedding model ahead of the first memory query."""
+        try:
+            self.embedding_provider.warmup()
+        except Exception as e:
+            queue_message(f"ERROR: Failed to load embedding model {self.embedding_model}: {e}")
 
     def init_dynamic_memory(self):
         """
         Initialize dynamic memory from the database file.
         """
-        if os.path.exists(self.memory_db_path):
-            queue_message(f"LOAD: Found existing memory: {self.char_name}.pickle.gz")
+        if os.path.exists(self.memory_db_path) or os.path.exists(f"{self.memory_db_path}.wal"):
+            queue_message(f"LOAD: Found existing memory: {os.path.basename(self.memory_db_path)}")
             loaded_successfully = self.hyper_db.load(self.memory_db_path)
             if not loaded_successfully or self.hyper_db.vectors is None:
                 queue_message(f"LOAD: Memory load failed. Initializing new memory.")
@@ -65,7 +300,7 @@ class MemoryManager:
 
     def write_longterm_memory(self, user_input: str, bot_response: str):
         """
-        Save user input and bot response to long-term memory.
+        Queue user input and bot response for long-term memory (written by the memory writer).
 
         Parameters:
         - user_input (str): The user's input.
@@ -77,46 +312,75 @@ class MemoryManager:
             "user_input": user_input,
             "bot_response": bot_response,
         }
-        self.hyper_db.add_document(document)
-        self.hyper_db.save(self.memory_db_path)
+        self.memory_writer.submit(document)
 
-    def get_related_memories(self, query: str) -> str:
+    def _write_documents(self, documents: list):
         """
-        Retrieve memories related to a given query from the HyperDB.
+        Insert and persist a batch of memories (runs on the memory writer thread).
 
         Parameters:
-        - query (str): The input query.
+        - documents (list): Memory documents, oldest first.
+        """
+        # Counted once here and journaled with the document, so prompt assembly never re-tokenizes it
+        self.turn_token_counts(documents)
+        self.hyper_db.add_documents(documents)
+        self.hyper_db.persist(self.memory_db_path)
+        self.segments.maybe_seal(self.memory_db_path)
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Wait until every queued memory has been written.
+
+        Parameters:
+        - timeout (float, optional): Maximum seconds to wait.
 
         Returns:
-        - str: Relevant memories or a fallback message.
+        - bool: True if the queue drained within the timeout.
         """
-        try:
-            results = self.hyper_db.query(
-                query, 
-                top_k=self.top_k, 
-                return_similarities=False
+        return self.memory_writer.flush(timeout)
+
+    def close(self):
+        """Write any queued memories, stop the memory writer and close the memory log."""
+        self.memory_writer.close()
+        stats = self.memory_writer.stats()
+        if stats["batches"]:
+            queue_message(
+                f"INFO: Memory writer wrote {stats['written']} memories in {stats['batches']} batches "
+                f"(avg latency {stats['avg_latency_ms']:.0f} ms, max queue depth {stats['max_depth']})"
             )
-            
-            if results:
-                memory = results[0]
-                memory_list = self.hyper_db.dict()
+        self.segments.close()
+        self.hyper_db.close()
 
-                # Find the index of the memory for context retrieval
-                start_index = next((i for i, d in enumerate(memory_list) if d['document'] == memory), None)
+    def get_related_memories(self, query: str, filters: dict = None) -> str:
+        """
+        Retrieve memories related to a given query from the HyperDB.
 
-                if start_index is not None:
-                    prev_count = 1
-                    post_count = 1
+        Parameters:
+        - query (str): The input query.
+        - filters (dict, optional): Metadata predicates, e.g. {"since": yesterday, "kind": "dialog"}
+          (see HyperDB.filter_rows).
 
-                    # Calculate indices for surrounding context
-                    start = max(start_index - prev_count, 0)
-                    end = min(start_index + post_count + 1, len(memory_list))
+        Returns:
+        - str: Relevant memories or a fallback message.
+        """
+        try:
+            # Embedded first, so the memory writer only waits for the search itself
+            query_vector = self.hyper_db.embed_query(query)
+            # The query and its window see the same rows: the memory writer waits for both
+            with self.hyper_db.lock:
+                results = self.segments.query(
+                    query, 
+                    top_k=self.top_k, 
+                    return_similarities=False,
+                    return_rows=True,
+                    filters=filters,
+                    query_vector=query_vector
+                )
+                # Retrieve the surrounding context memories (which may span two segments)
+                window = self.segments.get_window(results[0][1], before=1, after=1) if results else None
 
-                    # Retrieve and format the context memories
-                    result = [memory_list[i]['document'] for i in range(start, end)]
-                    return result
-                else:
-                    return f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] WARN: Could not locate memory in the database. Memory: {memory}"
+            if results:
+                return [without_bookkeeping(entry) for entry in window]
             else:
                 return f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] WARN: No memories found for the query."
         except Exception as e:
@@ -153,47 +417,162 @@ class MemoryManager:
         Returns:
         - List[str]: List of recent memory documents.
         """
-        # Get the memory dictionary
-        memory_dict = self.hyper_db.dict()
-        return [entry['document'] for entry in memory_dict[-max_entries:]]  # Retrieve the most recent entries
+        # Retrieve the most recent entries without materializing the whole memory
+        with self.hyper_db.lock:
+            return [without_bookkeeping(document) for document in self.hyper_db.view()[-max_entries:]]
     
-    def get_shortterm_memories_tokenlimit(self, token_limit: int) -> str:
+    def get_shortterm_memories_tokenlimit(self, token_limit: int, return_length: bool = False):
         """
         Retrieve short-term memories constrained by a token limit.
 
         Parameters:
         - token_limit (int): Maximum token limit.
+        - return_length (bool): Also return the memories' token count once the {user}
+          and {char} names are filled in (from the cached per-turn counts plus the
+          joining newlines, so no tokenizer call is needed).
 
         Returns:
-        - str: Concatenated memories formatted for output.
+        - str: Concatenated memories formatted for output, or (str, int) if return_length.
         """
-        accumulated_documents = []
-        accumulated_length = 0
+        with self._turn_tokens_lock:
+            index = self._sync_turn_tokens()
+            documents = index.newest_within(token_limit)
+            length = index.length(len(documents))
+        formatted_output = '\n'.join(
+            f"{{user}}: {document['user_input']}\n{{char}}: {document['bot_response']}"
+            for document in documents
+        )
+        if return_length:
+            return formatted_output, length
+        return formatted_output
 
-        for entry in reversed(self.hyper_db.dict()):
-            user_input = entry['document'].get('user_input', "")
-            bot_response = entry['document'].get('bot_response', "")
+    def _tokenizer_key(self) -> str:
+        """Identity of the tokenizer token_count uses; cached counts are only reused for the same key."""
+        llm = self.config['LLM']
+        llm_backend = llm['llm_backend']
+        if llm_backend == "openai":
+            return f"openai:{llm.get('openai_model', '')}:{llm.get('override_encoding_model', 'cl100k_base')}"
+        if llm_backend == "deepinfra":
+            return f"deepinfra:{llm.get('override_encoding_model', 'cl100k_base')}"
+        return f"{llm_backend}:{llm.get('base_url', '')}"
+
+    def _turn_names(self) -> tuple:
+        """(user name, character name) that replace {user} and {char} in the prompt."""
+        return self.config['CHAR']['user_name'], self.char_name
+
+    def _turn_key(self, tokenizer_key: str = None) -> str:
+        """Key of cached per-turn counts: the tokenizer plus the names the turn is formatted with."""
+        user_name, char_name = self._turn_names()
+        return f"{tokenizer_key or self._tokenizer_key()}|{user_name}|{char_name}"
+
+    def turn_token_count(self, document: dict, tokenizer_key: str = None) -> int:
+        """
+        Token length of a conversation turn as formatted in the prompt, cached in the
+        document per tokenizer and names.
 
-            if not user_input or not bot_response:
-                continue
+        Parameters:
+        - document (dict): A memory document; its count is stored under "token_counts".
+        - tokenizer_key (str, optional): Precomputed _turn_key().
 
-            text_str = f"user_input: {user_input}\nbot_response: {bot_response}"
-            text_length = self.token_count(text_str)['length']
+        Returns:
+        - int: Token count (0 for documents that are not full turns).
+        """
+        return self.turn_token_counts([document], tokenizer_key)[0]
 
-            if accumulated_length + text_length > token_limit:
-                break
+    def turn_token_counts(self, documents: list, tokenizer_key: str = None, store: bool = True) -> List[int]:
+        """
+        Token lengths of several conversation turns; uncached ones are counted in one token_count_many call.
 
-            accumulated_documents.append((user_input, bot_response))
-            accumulated_length += text_length
+        Parameters:
+        - documents (list): Memory documents; counts are stored under "token_counts".
+        - tokenizer_key (str, optional): Precomputed _turn_key().
+        - store (bool): Store new counts in the documents. Pass False for documents
+          already in HyperDB, which must be updated through set_document_field.
 
-        formatted_output = '\n'.join(
-            [f"{{user}}: {ui}\n{{char}}: {br}" for ui, br in reversed(accumulated_documents)]
-        )
-        return formatted_output
+        Returns:
+        - List[int]: Token count per document (0 for documents that are not full turns).
+        """
+        tokenizer_key = tokenizer_key or self._turn_key()
+        user_name, char_name = self._turn_names()
+        lengths = [0] * len(documents)
+        missing = []
+        for i, document in enumerate(documents):
+            if not turn_text(document):
+                continue
+            counts = document.get(TOKEN_COUNTS_KEY)
+            if counts is not None and tokenizer_key in counts:
+                lengths[i] = counts[tokenizer_key]
+            else:
+                missing.append(i)
+
+        if missing:
+            fresh = self.token_count_many([turn_text(documents[i], user_name, char_name) for i in missing])
+            for i, length in zip(missing, fresh):
+                lengths[i] = length
+                if store and length:  # A zero means the tokenizer was unavailable; don't cache it
+                    counts = dict(documents[i].get(TOKEN_COUNTS_KEY) or {})
+                    counts[tokenizer_key] = length
+                    documents[i][TOKEN_COUNTS_KEY] = counts
+        return lengths
+
+    def _sync_turn_tokens(self) -> TurnTokenIndex:
+        """
+        Bring the turn token prefix sums up to date with HyperDB (appends only cost new
+        turns). The caller holds _turn_tokens_lock while it syncs and reads the index.
+        """
+        tokenizer_key = self._turn_key()
+        index = self._turn_tokens
+        if index is None or index.tokenizer_key != tokenizer_key:
+            index = TurnTokenIndex(tokenizer_key, self.token_count_many(["\n"])[0])
+
+        # Walk back from the newest memory to the last one already indexed (under the
+        # database lock, as the memory writer may be inserting; counting happens after)
+        newest = None
+        new_documents = []  # (doc id, document), newest first
+        with self.hyper_db.lock:
+            for row in self.hyper_db.view().rows(reverse=True):
+                doc_id = self.hyper_db.doc_id(row)
+                newest = doc_id if newest is None else newest
+                if doc_id <= index.last_doc_id:
+                    break
+                new_documents.append((doc_id, self.hyper_db.documents[row]))
+
+            live_count = self.hyper_db.live_count
+            if index.live_count + len(new_documents) != live_count:
+                # Memories were deleted or reloaded; rebuild from the counts cached in the documents
+                index = TurnTokenIndex(tokenizer_key, index.separator_tokens)
+                new_documents = [
+                    (self.hyper_db.doc_id(row), self.hyper_db.documents[row])
+                    for row in self.hyper_db.view().rows(reverse=True)
+                ]
+
+        new_turns = [(doc_id, document) for doc_id, document in reversed(new_documents) if turn_text(document)]
+        lengths = self.turn_token_counts([document for _, document in new_turns], tokenizer_key, store=False)
+        for (_, document), length in zip(new_turns, lengths):
+            index.append(document, length)
+
+        # Turns imported without a count were counted just now: cache the counts in
+        # HyperDB through journaled updates, under its lock like any other write
+        uncounted = [
+            (doc_id, length) for (doc_id, document), length in zip(new_turns, lengths)
+            if length and tokenizer_key not in (document.get(TOKEN_COUNTS_KEY) or {})
+        ]
+        if uncounted:
+            with self.hyper_db.lock:
+                counts = []
+                for doc_id, length in uncounted:
+                    row = self.hyper_db.row_of(doc_id)
+                    cached = self.hyper_db.documents[row].get(TOKEN_COUNTS_KEY) if row is not None else None
+                    counts.append({**(cached or {}), tokenizer_key: length})
+                self.hyper_db.set_document_field([doc_id for doc_id, _ in uncounted], TOKEN_COUNTS_KEY, counts)
+        index.last_doc_id = newest if newest is not None else -1
+        index.live_count = live_count
+        self._turn_tokens = index
+        return index
 
     def write_tool_used(self, toolused: str):
         """
-        Record the use of a tool in long-term memory.
+        Queue a record of the use of a tool for long-term memory.
 
         Parameters:
         - toolused (str): Description of the tool used.
@@ -203,28 +582,77 @@ class MemoryManager:
             "timestamp": current_time,
             "bot_response": toolused
         }
-        self.hyper_db.add_document(document)
-        self.hyper_db.save(self.memory_db_path)
+        self.memory_writer.submit(document)
 
     def load_initial_memory(self, json_file_path: str):
         """
-        Load memories from a JSON file and inject them into the memory database.
+        Load memories from a JSON file (or a JSON Lines file with the same name and a
+        .jsonl extension) and inject them into the memory database.
 
         Parameters:
         - json_file_path (str): Path to the JSON file.
         """
-        if os.path.exists(json_file_path):
-            queue_message(f"LOAD: Injecting memories from JSON.")
-            with open(json_file_path, 'r') as file:
-                memories = json.load(file)
+        for path in (json_file_path, os.path.splitext(json_file_path)[0] + ".jsonl"):
+            if os.path.exists(path):
+                queue_message(f"LOAD: Injecting memories from {os.path.basename(path)}.")
+                if self.import_memories(path):
+                    os.rename(path, os.path.splitext(path)[0] + ".loaded")
+
+    def import_memories(self, path: str, chunk_size: int = None) -> bool:
+        """
+        Bulk-import memories from a JSON array or JSON Lines file.
+
+        The file is parsed incrementally, memories are embedded in batches through
+        HyperDB.add_documents, and the database is saved once at the end. Each record's
+        "time" is kept as the memory timestamp.
 
-            for memory in memories:
-                time = memory.get("time", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-                user_input = memory.get("userinput", "")
-                bot_response = memory.get("botresponse", "")
-                self.write_longterm_memory(user_input, bot_response)
+        Parameters:
+        - path (str): File with records like {"time", "userinput", "botresponse"}.
+        - chunk_size (int, optional): Records held in memory per add_documents call.
 
-            os.rename(json_file_path, os.path.splitext(json_file_path)[0] + ".loaded")
+        Returns:
+        - bool: True if every record was imported.
+        """
+        chunk_size = chunk_size or self.embed_batch_size * 16
+        total_chars = max(os.path.getsize(path), 1)
+        start = time.perf_counter()
+        imported = 0
+        chunk = []
+        succeeded = False
+        try:
+            for record, position in iter_json_records(path):
+                chunk.append(self._memory_document(record))
+                if len(chunk) >= chunk_size:
+                    self.hyper_db.add_documents(chunk, journal=False)
+                    imported += len(chunk)
+                    chunk = []
+                    elapsed = time.perf_counter() - start
+                    queue_message(
+                        f"LOAD: Imported {imported} memories ({min(position / total_chars, 1.0):.0%}, "
+                        f"{imported / max(elapsed, 1e-9):.0f} docs/s)"
+                    )
+            if chunk:
+                self.hyper_db.add_documents(chunk, journal=False)
+                imported += len(chunk)
+            succeeded = True
+        except Exception as e:
+            queue_message(f"ERROR: Memory import from {os.path.basename(path)} stopped after {imported} memories: {e}")
+        finally:
+            # One snapshot for the whole import (the batches above were not journaled)
+            self.hyper_db.save(self.memory_db_path)
+
+        elapsed = time.perf_counter() - start
+        queue_message(f"LOAD: Imported {imported} memories in {elapsed:.1f}s ({imported / max(elapsed, 1e-9):.0f} docs/s)")
+        return succeeded
+
+    @staticmethod
+    def _memory_document(record: dict) -> dict:
+        """Convert an initial-memory record into the document format used by write_longterm_memory."""
+        return {
+            "timestamp": record.get("time") or record.get("timestamp") or datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "user_input": record.get("userinput", record.get("user_input", "")),
+            "bot_response": record.get("botresponse", record.get("bot_response", "")),
+        }
 
     def token_count(self, text: str) -> dict:
         """
@@ -236,39 +664,119 @@ class MemoryManager:
         Returns:
         - dict: Dictionary with token count.
         """
+        return {"length": self.token_count_many([text])[0]}
+
+    def token_count_many(self, texts: List[str]) -> List[int]:
+        """
+        Calculate the number of tokens in several texts with as few tokenizer round trips as possible.
+
+        tiktoken backends encode the batch in one encode_batch call. ooba/tabby use
+        the local tokenizer (LLM.local_tokenizer_path) if configured; otherwise they
+        count one text per request (their endpoints take a single string), so requests
+        are sent concurrently over a pooled session. Recently counted texts are served
+        from a small cache keyed by tokenizer.
+
+        Parameters:
+        - texts (List[str]): Input texts.
+
+        Returns:
+        - List[int]: Token count per text (0 if counting failed).
+        """
+        tokenizer_key = self._tokenizer_key()
+        lengths = [self._token_counts.get((tokenizer_key, text)) if text else 0 for text in texts]
+        missing = list(dict.fromkeys(text for text, length in zip(texts, lengths) if length is None))
+        if not missing:
+            return lengths
+
+        counted = dict(zip(missing, self._count_tokens(missing)))
+        for text, length in counted.items():
+            if length:
+                self._token_counts.put((tokenizer_key, text), length)
+        return [counted[text] if length is None else length for text, length in zip(texts, lengths)]
+
+    def _encoder(self):
+        """tiktoken encoding for the configured backend and model, resolved once and cached."""
+        tokenizer_key = self._tokenizer_key()
+        enc = self._encoders.get(tokenizer_key)
+        if enc is not None:
+            return enc
+
+        import tiktoken
+        llm_backend = self.config['LLM']['llm_backend']
+        override_encoding_model = self.config['LLM'].get('override_encoding_model', "cl100k_base")
+
+        # for deepinfra's models, we can directly use override_encoding_model
+        if llm_backend == "deepinfra":
+            enc = tiktoken.get_encoding(override_encoding_model)
+        else:
+            # for openai, try model-specific encoding first
+            openai_model = self.config['LLM'].get('openai_model', None)
+            try:
+                enc = tiktoken.encoding_for_model(openai_model)
+            except KeyError:
+                queue_message(f"INFO: Automatic mapping failed '{openai_model}'. Using '{override_encoding_model}'.")
+                enc = tiktoken.get_encoding(override_encoding_model)
+        self._encoders[tokenizer_key] = enc
+        return enc
+
+    def _request_token_count(self, url: str, headers: dict, text: str) -> int:
+        """Count tokens of one text with the ooba/tabby token endpoint."""
+        response = self._http.post(url, headers=headers, json={"text": text})
+        response.raise_for_status()
+        return response.json().get("length", 0)
+
+    def _token_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        if self._token_pool is None:
+            self._token_pool = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="TokenCount")
+        return self._token_pool
+
+    def _load_local_tokenizer(self):
+        """
+        HuggingFace tokenizer from LLM.local_tokenizer_path, loaded once.
+
+        Returns:
+        - tokenizers.Tokenizer or None: None if no path is configured or loading failed.
+        """
+        if self._local_tokenizer is None:
+            path = self.config['LLM'].get('local_tokenizer_path', '')
+            self._local_tokenizer = False
+            if path:
+                path = os.path.abspath(path)
+                if os.path.isdir(path):
+                    path = os.path.join(path, "tokenizer.json")
+                try:
+                    from tokenizers import Tokenizer
+                    self._local_tokenizer = Tokenizer.from_file(path)
+                    queue_message(f"LOAD: Counting tokens locally with {path}")
+                except Exception as e:
+                    queue_message(f"ERROR: Failed to load local tokenizer {path}: {e}. Using the token count API.")
+        return self._local_tokenizer or None
+
+    def _crosscheck_local_count(self, url: str, headers: dict, text: str, local_length: int):
+        """Compare a local token count with the server's and warn if the tokenizers disagree."""
+        try:
+            server_length = self._request_token_count(url, headers, text)
+        except requests.exceptions.RequestException:
+            return
+        if server_length and server_length != local_length:
+            queue_message(
+                f"WARNING: Local tokenizer counted {local_length} tokens, server counted {server_length}. "
+                f"Check that local_tokenizer_path matches the served model."
+            )
+
+    def _count_tokens(self, texts: List[str]) -> List[int]:
+        """Count tokens of texts with the configured backend (uncached)."""
         llm_backend = self.config['LLM']['llm_backend']
-        # Cache for already logged fallback warnings
-        if not hasattr(self, '_fallback_warning_logged'):
-            self._fallback_warning_logged = False
 
         # Support both openai and deepinfra using tiktoken
         if llm_backend in ["openai", "deepinfra"]:
             try:
-                import tiktoken
-                override_encoding_model = self.config['LLM'].get('override_encoding_model', "cl100k_base")
-
-                # for deepinfra's models, we can directly use override_encoding_model
-                if llm_backend == "deepinfra":
-                    enc = tiktoken.get_encoding(override_encoding_model)
-                else:
-                    # for openai, try model-specific encoding first
-                    openai_model = self.config['LLM'].get('openai_model', None)
-                    try:
-                        enc = tiktoken.encoding_for_model(openai_model)
-                    except KeyError:
-                        if not self._fallback_warning_logged:
-                            queue_message(f"INFO: Automatic mapping failed '{openai_model}'. Using '{override_encoding_model}'.")
-                            self._fallback_warning_logged = True
-                        enc = tiktoken.get_encoding(override_encoding_model)
-
-                length = {"length": len(enc.encode(text))}
-                return length
-
+                return [len(tokens) for tokens in self._encoder().encode_batch(texts)]
             except Exception as e:
                 if not hasattr(self, '_token_error_logged'):
                     queue_message(f"ERROR: Failed to calculate tokens using tiktoken: {e}")
                     self._token_error_logged = True
-                return {"length": 0}
+                return [0] * len(texts)
 
         elif llm_backend in ["ooba", "tabby"]:
             # Handle token counting for other backends via API
@@ -277,18 +785,26 @@ class MemoryManager:
                 "Content-Type": "application/json",
                 "Authorization": f"Bearer {self.config['LLM']['api_key']}"
             }
-            data = {
-                "text": text
-            }
+
+            # Count in-process with the served model's tokenizer.json when configured
+            tokenizer = self._load_local_tokenizer()
+            if tokenizer is not None:
+                lengths = [len(encoding.ids) for encoding in tokenizer.encode_batch(texts)]
+                crosscheck_every = int(self.config['LLM'].get('tokenizer_crosscheck_every', 0))
+                self._local_token_counts += 1
+                if crosscheck_every > 0 and self._local_token_counts % crosscheck_every == 0:
+                    # Verified in the background so prompt building never waits on the server
+                    self._token_executor().submit(self._crosscheck_local_count, url, headers, texts[0], lengths[0])
+                return lengths
 
             try:
-                response = requests.post(url, headers=headers, json=data)
-                response.raise_for_status()
-                return response.json()
+                if len(texts) == 1:
+                    return [self._request_token_count(url, headers, texts[0])]
+                return list(self._token_executor().map(lambda text: self._request_token_count(url, headers, text), texts))
             except requests.exceptions.RequestException as e:
                 queue_message(f"ERROR: Request to {llm_backend} token count API failed: {e}")
-                return {"length": 0}
+                return [0] * len(texts)
 
         else:
             queue_message(f"ERROR: Unsupported LLM backend: {llm_backend}")
-            return {"length": 0}
\ No newline at end of file
+            return [0] * len(texts)
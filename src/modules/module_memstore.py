@@ -0,0 +1,437 @@
+"""
+module_memstore.py
+
+Persistence helpers for TARS-AI HyperDB memory.
+
+Provides an append-only write-ahead log so a conversation turn only appends its
+own (document, vector) record to disk instead of rewriting the whole memory
+snapshot, plus an atomic file-replace helper used when the log is compacted
+into a new snapshot.
+
+Also implements the memory-mapped snapshot format (`<name>.memdb` directory):
+vectors are stored as a raw, 64-byte aligned `.npy` file that is opened with
+np.memmap, so loading is O(1) and pages fault in lazily; documents live in a
+separate pickle. Each snapshot writes new uniquely named files and then swaps
+`manifest.json`, so a snapshot that is still mapped is never overwritten.
+
+MemoryWriter is the single background writer that applies memory inserts in
+coalesced batches, so concurrent turns never race on the database or its files.
+"""
+
+# === Standard Libraries ===
+import os
+import json
+import time
+import uuid
+import zlib
+import queue
+import struct
+import pickle
+import atexit
+import threading
+
+import numpy as np
+
+from modules.module_messageQue import queue_message
+
+MMAP_MANIFEST = "manifest.json"
+
+# Each record is framed as <payload length><crc32 of payload><pickled payload>
+_RECORD_HEADER = struct.Struct("<II")
+
+# MemoryWriter queue markers
+_FLUSH = object()
+_STOP = object()
+
+def atomic_write(path: str, write_fn):
+    """
+    Write a file via a temporary sibling and os.replace, so readers never see a partial file.
+
+    Parameters:
+    - path (str): Destination file.
+    - write_fn (callable): Called with the temporary path; must create and close the file.
+    """
+    tmp_path = f"{path}.tmp"
+    write_fn(tmp_path)
+    with open(tmp_path, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+class WriteAheadLog:
+    """
+    Append-only record log with batched fsync.
+
+    Records are flushed to the OS on every commit (so a process crash loses
+    nothing) and fsync'd once `fsync_every` records or `fsync_interval` seconds
+    have accumulated (bounding what a power loss can drop). A torn record at the
+    tail, e.g. from a crash mid-write, is detected by its checksum and truncated
+    on the next replay.
+    """
+    def __init__(self, path: str, fsync_every: int = 8, fsync_interval: float = 2.0, records: int = 0):
+        """
+        Open (or create) a log for appending.
+
+        Parameters:
+        - path (str): Log file path.
+        - fsync_every (int): Records per fsync batch.
+        - fsync_interval (float): Maximum seconds between fsyncs while records are pending.
+        - records (int): Number of records already in the file (as counted by replay).
+        """
+        self.path = path
+        self.fsync_every = max(1, fsync_every)
+        self.fsync_interval = fsync_interval
+        self.records = records
+        self._lock = threading.Lock()
+        self._file = open(path, "ab")
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        atexit.register(self.close)
+
+    @staticmethod
+    def replay(path: str):
+        """
+        Yield every intact record in a log file, truncating a torn tail if found.
+
+        Parameters:
+        - path (str): Log file to read.
+        """
+        if not os.path.exists(path):
+            return
+        good_offset = 0
+        with open(path, "rb") as f:
+            while True:
+                header = f.read(_RECORD_HEADER.size)
+                if len(header) < _RECORD_HEADER.size:
+                    break
+                length, checksum = _RECORD_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != checksum:
+                    break
+                good_offset = f.tell()
+                yield pickle.loads(payload)
+
+        if os.path.getsize(path) > good_offset:
+            queue_message(f"WARNING: Truncating torn tail of memory log {os.path.basename(path)}")
+            with open(path, "r+b") as f:
+                f.truncate(good_offset)
+
+    def append(self, records):
+        """
+        Append records to the log (buffered; call commit to make them durable).
+
+        Parameters:
+        - records (list): Picklable records, in order.
+        """
+        with self._lock:
+            for record in records:
+                payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+                self._file.write(_RECORD_HEADER.pack(len(payload), zlib.crc32(payload)))
+                self._file.write(payload)
+            self.records += len(records)
+            self._unsynced += len(records)
+
+    def commit(self, force: bool = False):
+        """
+        Flush appended records to the OS and fsync if the batch is due.
+
+        Parameters:
+        - force (bool): fsync regardless of the batching thresholds.
+        """
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.flush()
+            due = (
+                self._unsynced >= self.fsync_every
+                or time.monotonic() - self._last_sync >= self.fsync_interval
+            )
+            if self._unsynced and (force or due):
+                os.fsync(self._file.fileno())
+                self._unsynced = 0
+                self._last_sync = time.monotonic()
+
+    def reset(self):
+        """Truncate the log after its records have been compacted into a snapshot."""
+        with self._lock:
+            self._file.flush()
+            self._file.truncate(0)
+            os.fsync(self._file.fileno())
+            self.records = 0
+            self._unsynced = 0
+            self._last_sync = time.monotonic()
+
+    def close(self):
+        """fsync any outstanding records and close the log file."""
+        if self._file.closed:
+            return
+        self.commit(force=True)
+        with self._lock:
+            self._file.close()
+
+class MemoryWriter:
+    """
+    Single worker thread that owns all writes to a memory database.
+
+    Callers submit() items and return at once. The worker waits up to `batch_delay`
+    seconds after the first pending item for more to arrive (at most `max_batch`),
+    then hands them to one `write_batch` call, which inserts and persists the whole
+    batch. Turns arriving together from voice, the chat UI and Discord therefore
+    cost one embedding call and one log append, and never race each other.
+    """
+    def __init__(self, write_batch, batch_delay: float = 0.25, max_batch: int = 64, name: str = "MemoryWriter"):
+        """
+        Start the writer thread.
+
+        Parameters:
+        - write_batch (callable): Called on the worker thread with a list of items, oldest first.
+        - batch_delay (float): Seconds to wait for more items before writing a batch.
+        - max_batch (int): Maximum items per write_batch call.
+        - name (str): Worker thread name.
+        """
+        self.write_batch = write_batch
+        self.batch_delay = max(0.0, batch_delay)
+        self.max_batch = max(1, max_batch)
+        self._queue = queue.Queue()
+        self._cond = threading.Condition()
+        self._submitted = 0
+        self._completed = 0
+        self._closed = False
+
+        # Back-pressure metrics
+        self.batches = 0
+        self.written = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.max_latency = 0.0
+        self.last_write_time = 0.0
+        self._latency_total = 0.0
+
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @property
+    def depth(self) -> int:
+        """Items submitted but not yet written (including the batch being written)."""
+        return self._submitted - self._completed
+
+    def submit(self, item):
+        """
+        Queue an item for the next batch.
+
+        Parameters:
+        - item: Passed to write_batch on the worker thread.
+        """
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("memory writer is closed")
+            self._submitted += 1
+            self.max_depth = max(self.max_depth, self.depth)
+            self._queue.put((time.monotonic(), item))
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            entry = self._queue.get()
+            if entry is _STOP:
+                break
+            if entry is _FLUSH:
+                continue
+
+            batch = [entry]
+            deadline = time.monotonic() + self.batch_delay
+            while len(batch) < self.max_batch:
+                try:
+                    entry = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if entry is _FLUSH:
+                    break
+                if entry is _STOP:
+                    stopping = True
+                    break
+                batch.append(entry)
+            self._write(batch)
+
+    def _write(self, batch):
+        start = time.monotonic()
+        succeeded = True
+        try:
+            self.write_batch([item for _, item in batch])
+        except Exception as e:
+            succeeded = False
+            queue_message(f"ERROR: Failed to write {len(batch)} memories: {e}")
+        end = time.monotonic()
+
+        with self._cond:
+            self.batches += 1
+            if succeeded:
+                self.written += len(batch)
+            else:
+                self.failed += len(batch)
+            self.last_write_time = end - start
+            for submitted_at, _ in batch:
+                self._latency_total += end - submitted_at
+                self.max_latency = max(self.max_latency, end - submitted_at)
+            self._completed += len(batch)
+            self._cond.notify_all()
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Block until every item submitted so far has been written.
+
+        Parameters:
+        - timeout (float, optional): Maximum seconds to wait.
+
+        Returns:
+        - bool: True if everything was written within the timeout.
+        """
+        with self._cond:
+            target = self._submitted
+            if self._completed >= target:
+                return True
+            if not self._thread.is_alive():
+                return False
+            self._queue.put(_FLUSH)  # Write the pending batch without waiting out batch_delay
+            return self._cond.wait_for(lambda: self._completed >= target, timeout)
+
+    def close(self, timeout: float = None):
+        """Write everything still queued and stop the worker thread."""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        """Queue depth, batch counters and latencies (submit to written) in milliseconds."""
+        with self._cond:
+            finished = self.written + self.failed
+            return {
+                "depth": self.depth,
+                "max_depth": self.max_depth,
+                "batches": self.batches,
+                "written": self.written,
+                "failed": self.failed,
+                "avg_batch": finished / self.batches if self.batches else 0.0,
+                "avg_latency_ms": 1000 * self._latency_total / finished if finished else 0.0,
+                "max_latency_ms": 1000 * self.max_latency,
+                "last_write_ms": 1000 * self.last_write_time,
+            }
+
+def save_mmap_snapshot(storage_dir: str, vectors, documents, log_seq: int = 0, unit_vectors=None, quantized=None):
+    """
+    Write a memory-mapped snapshot into a `.memdb` directory.
+
+    Parameters:
+    - storage_dir (str): Snapshot directory (created if missing).
+    - vectors (np.ndarray or None): (N, d) float32 vectors. Each matrix argument may also
+      be a list of row blocks (e.g. VectorArena.blocks()), written one after another.
+    - documents (list): Documents, one per vector row.
+    - log_seq (int): Last write-ahead log sequence number included in the snapshot.
+    - unit_vectors (np.ndarray, optional): Unit-normalized copy of the vectors, mapped
+      alongside them so cosine search needs no normalization pass at load.
+    - quantized (tuple, optional): (storage, codes, scales) of HyperDB's compact search
+      copy ('float16' or 'int8'; scales is None for float16), mapped at load instead
+      of being re-quantized.
+    """
+    os.makedirs(storage_dir, exist_ok=True)
+    snapshot_id = uuid.uuid4().hex[:12]
+    manifest = {"format": 1, "log_seq": log_seq, "count": len(documents), "vectors": None, "unit_vectors": None}
+    matrices = [("vectors", vectors, np.float32), ("unit_vectors", unit_vectors, np.float32)]
+    if quantized is not None:
+        storage, codes, scales = quantized
+        manifest["quantized"] = storage
+        code_dtype = codes[0].dtype if isinstance(codes, list) else codes.dtype
+        matrices += [("quantized_codes", codes, code_dtype), ("quantized_scales", scales, np.float32)]
+
+    for key, matrix, dtype in matrices:
+        if matrix is None:
+            continue
+        manifest[key] = f"{key}-{snapshot_id}.npy"
+        matrix_path = os.path.join(storage_dir, manifest[key])
+        # The .npy header is padded so the data starts on a 64-byte boundary
+        if isinstance(matrix, list):
+            rows = sum(block.shape[0] for block in matrix)
+            out = np.lib.format.open_memmap(matrix_path, mode="w+", dtype=dtype, shape=(rows,) + matrix[0].shape[1:])
+            offset = 0
+            for block in matrix:
+                out[offset:offset + block.shape[0]] = block
+                offset += block.shape[0]
+            out.flush()
+            del out
+        else:
+            np.save(matrix_path, np.ascontiguousarray(matrix, dtype=dtype), allow_pickle=False)
+        with open(matrix_path, "rb") as f:
+            os.fsync(f.fileno())
+
+    manifest["documents"] = f"documents-{snapshot_id}.pkl"
+    documents_path = os.path.join(storage_dir, manifest["documents"])
+    with open(documents_path, "wb") as f:
+        pickle.dump(documents, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+
+    def write_manifest(path):
+        with open(path, "w") as f:
+            json.dump(manifest, f)
+
+    atomic_write(os.path.join(storage_dir, MMAP_MANIFEST), write_manifest)
+
+    # Drop files from older snapshots; mappings that still use them stay valid on POSIX
+    current = {manifest[key] for key, _, _ in matrices if manifest.get(key)} | {manifest["documents"]}
+    for name in os.listdir(storage_dir):
+        if name != MMAP_MANIFEST and name not in current:
+            try:
+                os.remove(os.path.join(storage_dir, name))
+            except OSError:
+                pass
+
+def load_mmap_snapshot(storage_dir: str, documents: bool = True) -> dict:
+    """
+    Open a memory-mapped snapshot written by save_mmap_snapshot.
+
+    Parameters:
+    - storage_dir (str): Snapshot directory.
+    - documents (bool): Also unpickle the documents (False returns None for them, e.g.
+      when re-mapping a snapshot that was just written from memory).
+
+    Returns:
+    - dict: {"vectors": read-only np.memmap or None, "unit_vectors": np.memmap or None,
+      "quantized": (storage, codes, scales) or None, "documents": list, "log_seq": int},
+      or an empty dict if no snapshot exists.
+    """
+    manifest_path = os.path.join(storage_dir, MMAP_MANIFEST)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r") as f:
+        manifest = json.load(f)
+
+    matrices = {}
+    for key in ("vectors", "unit_vectors", "quantized_codes", "quantized_scales"):
+        matrices[key] = None
+        if manifest.get(key):
+            matrices[key] = np.load(os.path.join(storage_dir, manifest[key]), mmap_mode="r", allow_pickle=False)
+    if documents:
+        with open(os.path.join(storage_dir, manifest["documents"]), "rb") as f:
+            documents = pickle.load(f)
+    else:
+        documents = None
+
+    return {
+        "vectors": matrices["vectors"],
+        "unit_vectors": matrices["unit_vectors"],
+        "quantized": (
+            (manifest["quantized"], matrices["quantized_codes"], matrices["quantized_scales"])
+            if manifest.get("quantized") else None
+        ),
+        "documents": documents,
+        "log_seq": manifest.get("log_seq", 0),
+    }
@@ -0,0 +1,248 @@
+"""
+module_metadata.py
+
+Columnar document metadata for TARS-AI HyperDB filtered retrieval.
+
+Memories carry their metadata inside the document dict (e.g. a "timestamp"
+string), which would have to be parsed for every row on every filtered query.
+MetadataColumns keeps it as NumPy arrays parallel to the vector rows:
+- timestamp: seconds since the epoch (NaN when missing or unparseable), with a
+  row order sorted by time so a time range is two binary searches.
+- kind: "dialog" (user_input + bot_response), "tool" (a tool-use record with only
+  bot_response) or "text" (anything else), unless the document sets "kind".
+- source: the document's "source" field, or "" when it has none.
+
+Filters are dicts evaluated as vectorized masks:
+    {"since": "2025-01-01 00:00:00", "until": datetime.now(), "kind": "dialog",
+     "source": ["discord", ""], "where": lambda columns, rows: columns.timestamps[rows] > 0}
+"since" is inclusive and "until" exclusive; both take a datetime, a timestamp
+string or epoch seconds. "kind" and "source" take one value or a list. "where" is
+called with the columns and the candidate rows and returns a boolean mask over them.
+"""
+
+# === Standard Libraries ===
+import math
+from datetime import datetime, date
+
+import numpy as np
+
+TIMESTAMP_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%d/%m/%Y %H:%M:%S", "%m/%d/%Y %H:%M:%S")
+FILTER_KEYS = ("since", "until", "kind", "source", "where")
+
+def parse_timestamp(value) -> float:
+    """
+    Epoch seconds of a timestamp (naive times are local time), or NaN if it cannot be parsed.
+
+    Parameters:
+    - value: datetime, date, epoch seconds, or a timestamp string such as "2025-01-31 18:04:05".
+
+    Returns:
+    - float: Seconds since the epoch.
+    """
+    if value is None:
+        return math.nan
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day).timestamp()
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return float(value)
+    text = str(value).strip()
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        pass
+    for timestamp_format in TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(text, timestamp_format).timestamp()
+        except ValueError:
+            continue
+    return math.nan
+
+def document_kind(document) -> str:
+    """Kind of a stored document: its "kind" field, else "dialog", "tool" or "text"."""
+    if not isinstance(document, dict):
+        return "text"
+    if document.get("kind"):
+        return str(document["kind"])
+    if document.get("user_input"):
+        return "dialog"
+    if "bot_response" in document:
+        return "tool"
+    return "text"
+
+def document_source(document) -> str:
+    """Source of a stored document: its "source" field, or "" if it has none."""
+    if isinstance(document, dict) and document.get("source") is not None:
+        return str(document["source"])
+    return ""
+
+class MetadataColumns:
+    """
+    Timestamp, kind and source of every row, as arrays parallel to the vectors.
+
+    Kind and source are stored as small integer codes into per-column vocabularies.
+    Rows are appended with extend() and dropped with compact(), mirroring the vector
+    storage; the time-sorted row order is extended in place while rows arrive in
+    time order and re-sorted lazily otherwise.
+    """
+    def __init__(self, documents=()):
+        self._rows = 0
+        self._timestamps = np.empty(64, dtype=np.float64)
+        self._kinds = np.empty(64, dtype=np.int16)
+        self._sources = np.empty(64, dtype=np.int16)
+        self.kind_codes = {}
+        self.source_codes = {}
+        # Rows that have a timestamp, sorted by time, and their timestamps (first _dated entries)
+        self._order = np.empty(64, dtype=np.int64)
+        self._sorted_times = np.empty(64, dtype=np.float64)
+        self._dated = 0
+        self._sorted = True
+        self.extend(documents)
+
+    def __len__(self):
+        return self._rows
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        """Epoch seconds per row (NaN when unknown)."""
+        return self._timestamps[:self._rows]
+
+    @property
+    def kinds(self) -> np.ndarray:
+        """Kind code per row (see kind_codes)."""
+        return self._kinds[:self._rows]
+
+    @property
+    def sources(self) -> np.ndarray:
+        """Source code per row (see source_codes)."""
+        return self._sources[:self._rows]
+
+    @staticmethod
+    def _code(vocabulary: dict, value: str) -> int:
+        code = vocabulary.get(value)
+        if code is None:
+            code = vocabulary[value] = len(vocabulary)
+        return code
+
+    def _reserve(self, names, used: int, rows: int):
+        """Grow the named buffers (by doubling) to hold `rows` entries, keeping the first `used`."""
+        if getattr(self, names[0]).shape[0] >= rows:
+            return
+        capacity = max(rows, getattr(self, names[0]).shape[0] * 2)
+        for name in names:
+            old = getattr(self, name)
+            grown = np.empty(capacity, dtype=old.dtype)
+            grown[:used] = old[:used]
+            setattr(self, name, grown)
+
+    def extend(self, documents):
+        """Append the metadata of newly stored documents."""
+        documents = list(documents)
+        if not documents:
+            return
+        start, stop = self._rows, self._rows + len(documents)
+        self._reserve(("_timestamps", "_kinds", "_sources"), self._rows, stop)
+        timestamps = np.array(
+            [parse_timestamp(document.get("timestamp")) if isinstance(document, dict) else math.nan for document in documents],
+            dtype=np.float64,
+        )
+        self._timestamps[start:stop] = timestamps
+        self._kinds[start:stop] = [self._code(self.kind_codes, document_kind(document)) for document in documents]
+        self._sources[start:stop] = [self._code(self.source_codes, document_source(document)) for document in documents]
+        self._rows = stop
+
+        if not self._sorted:
+            return
+        dated = ~np.isnan(timestamps)
+        new_times = timestamps[dated]
+        last = self._sorted_times[self._dated - 1] if self._dated else -np.inf
+        if new_times.shape[0] and (new_times[0] < last or np.any(np.diff(new_times) < 0)):
+            self._sorted = False  # out-of-order insert; re-sorted on the next range query
+            return
+        count = self._dated + new_times.shape[0]
+        self._reserve(("_order", "_sorted_times"), self._dated, count)
+        self._order[self._dated:count] = start + np.flatnonzero(dated)
+        self._sorted_times[self._dated:count] = new_times
+        self._dated = count
+
+    def compact(self, keep):
+        """
+        Drop rows, keeping those where `keep` is True (later rows shift up, like the vectors).
+
+        Parameters:
+        - keep (np.ndarray): Boolean mask over the current rows.
+        """
+        keep = np.asarray(keep, dtype=bool)
+        rows = int(keep.sum())
+        for name in ("_timestamps", "_kinds", "_sources"):
+            column = getattr(self, name)
+            column[:rows] = column[:self._rows][keep]
+        if self._sorted:
+            order = self._order[:self._dated]
+            kept = keep[order]
+            count = int(kept.sum())
+            self._order[:count] = (np.cumsum(keep) - 1)[order[kept]]
+            self._sorted_times[:count] = self._sorted_times[:self._dated][kept]
+            self._dated = count
+        self._rows = rows
+
+    def _time_order(self):
+        """(rows, timestamps) of the dated rows in time order, re-sorting after out-of-order inserts."""
+        if not self._sorted:
+            timestamps = self.timestamps
+            dated = np.flatnonzero(~np.isnan(timestamps))
+            self._order = dated[np.argsort(timestamps[dated], kind="stable")]
+            self._sorted_times = timestamps[self._order]
+            self._dated = self._order.shape[0]
+            self._sorted = True
+        return self._order[:self._dated], self._sorted_times[:self._dated]
+
+    def time_range(self, since=None, until=None) -> np.ndarray:
+        """
+        Rows with since <= timestamp < until, in time order.
+
+        Costs two binary searches over the time-sorted rows plus the size of the
+        result. Rows without a timestamp never match.
+        """
+        order, times = self._time_order()
+        start = 0 if since is None else int(np.searchsorted(times, parse_timestamp(since), side="left"))
+        stop = order.shape[0] if until is None else int(np.searchsorted(times, parse_timestamp(until), side="left"))
+        return order[start:max(start, stop)]
+
+    def _match(self, column: np.ndarray, vocabulary: dict, values, rows) -> np.ndarray:
+        if isinstance(values, str):
+            values = [values]
+        codes = [vocabulary[value] for value in values if value in vocabulary]
+        return np.isin(column[rows], codes)
+
+    def select(self, filters: dict, exclude=None) -> np.ndarray:
+        """
+        Rows matching a filter dict (see the module docstring), in ascending order.
+
+        A time range narrows the candidates first through the sorted timestamps; the
+        other predicates are then evaluated as masks over the candidates only.
+
+        Parameters:
+        - filters (dict): Filter predicates.
+        - exclude (np.ndarray, optional): Boolean mask of rows to leave out (e.g. deleted rows).
+
+        Returns:
+        - np.ndarray: Matching rows (int64).
+        """
+        unknown = set(filters) - set(FILTER_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown memory filter(s): {', '.join(sorted(unknown))}")
+        if filters.get("since") is not None or filters.get("until") is not None:
+            rows = np.sort(self.time_range(filters.get("since"), filters.get("until")))
+        else:
+            rows = np.arange(self._rows, dtype=np.int64)
+        if exclude is not None and rows.size:
+            rows = rows[~exclude[rows]]
+        if filters.get("kind") is not None and rows.size:
+            rows = rows[self._match(self._kinds, self.kind_codes, filters["kind"], rows)]
+        if filters.get("source") is not None and rows.size:
+            rows = rows[self._match(self._sources, self.source_codes, filters["source"], rows)]
+        if filters.get("where") is not None and rows.size:
+            rows = rows[np.asarray(filters["where"](self, rows), dtype=bool)]
+        return rows
@@ -101,6 +101,7 @@ def append_memory_and_examples(base_prompt, user_prompt, memory_manager, config,
     total_base_prompt = "".join([
     base_prompt,
     f"### Memory:\n---\nLong-Term Context:\n{past_memory}\n---\n",
+    "Recent Conversation:\n\n---\n",
     f"### Interaction:\n{config['CHAR']['user_name']}: {user_prompt}\n\n",
     f"### Function Calling Tool:\nResult: {functioncall}\n"
     f"### Response:\n{character_manager.char_name}: "
@@ -109,23 +110,27 @@ def append_memory_and_examples(base_prompt, user_prompt, memory_manager, config,
     #queue_message(f"base prompt {memory_manager.token_count(base_prompt).get('length', 0)}")
 
     context_size = int(config['LLM']['contextsize'])
-    base_length = memory_manager.token_count(total_base_prompt).get('length', 0)
+    # One tokenizer round trip: the short-term memory length comes from cached per-turn
+    # counts of the turns as formatted below, plus the newlines joining them
+    example_block = (
+        f"### Example Dialog:\n{character_manager.example_dialogue}\n---\n"
+        if character_manager.example_dialogue else ""
+    )
+    base_length, example_length = memory_manager.token_count_many([total_base_prompt, example_block])
     available_tokens = max(0, context_size - base_length)
 
     #queue_message(f"context_size {context_size}: base_length{base_length}: available_tokens: {available_tokens} ")
 
     # Add short-term memory first
     if available_tokens > 0:
-        short_term_memory = memory_manager.get_shortterm_memories_tokenlimit(available_tokens)
-        memory_length = memory_manager.token_count(short_term_memory).get('length', 0)
+        short_term_memory, memory_length = memory_manager.get_shortterm_memories_tokenlimit(available_tokens, return_length=True)
         available_tokens -= memory_length
         #queue_message(f"Tokens after short term {available_tokens}")
 
     # Add example dialog only if there's space remaining
     if available_tokens > 0 and character_manager.example_dialogue:
-        example_length = memory_manager.token_count(character_manager.example_dialogue).get('length', 0)
         if example_length <= available_tokens:
-            example_dialog = f"### Example Dialog:\n{character_manager.example_dialogue}\n---\n"
+            example_dialog = example_block
 
     # Append memory and examples to the prompt
     return (
@@ -0,0 +1,139 @@
+"""
+module_reranker.py
+
+Reranker backends for TARS-AI HyperDB hybrid retrieval.
+
+The cross-encoder that reorders fused (vector + BM25) candidates is often the
+largest cost of a memory lookup on a CPU-only device such as a Raspberry Pi.
+Backends:
+- "cross_encoder": sentence-transformers CrossEncoder (PyTorch), any model.
+- "onnx": the same kind of model exported to ONNX and run with ONNX Runtime using
+  int8-quantized weights; typically several times faster on ARM/x86 CPUs.
+- "none": no reranking; fused RRF order is used as is.
+
+Smaller distilled cross-encoders (e.g. cross-encoder/ms-marco-MiniLM-L-6-v2 or
+cross-encoder/ms-marco-TinyBERT-L-2-v2) work with both model backends.
+"""
+
+# === Standard Libraries ===
+import os
+import platform
+
+import numpy as np
+
+from modules.module_messageQue import queue_message
+
+RERANKER_BACKENDS = ("cross_encoder", "onnx", "none")
+
+def find_onnx_model(model_dir: str) -> str:
+    """
+    Path of an int8 ONNX model in `model_dir` (or its onnx/ subfolder), quantizing model.onnx if needed.
+    """
+    arch = "arm64" if platform.machine().lower() in ("aarch64", "arm64") else "avx2"
+    folders = [model_dir, os.path.join(model_dir, "onnx")]
+    for folder in folders:
+        for name in ("model_int8.onnx", f"model_qint8_{arch}.onnx", f"model_quint8_{arch}.onnx"):
+            path = os.path.join(folder, name)
+            if os.path.exists(path):
+                return path
+
+    for folder in folders:
+        source = os.path.join(folder, "model.onnx")
+        if os.path.exists(source):
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            target = os.path.join(folder, "model_int8.onnx")
+            queue_message(f"INFO: Quantizing reranker {source} to int8 (one-time)")
+            quantize_dynamic(source, target, weight_type=QuantType.QInt8)
+            return target
+    raise FileNotFoundError(f"No ONNX model found in {model_dir}")
+
+class OnnxReranker:
+    """
+    Cross-encoder executed with ONNX Runtime on int8-quantized weights.
+
+    `model` is a local directory with an ONNX export (`model.onnx`, e.g. from
+    `optimum-cli export onnx --task text-classification`) plus tokenizer files, or a
+    HuggingFace repo id that ships one under `onnx/`. Without a quantized file,
+    `model.onnx` is quantized once with dynamic int8 quantization and saved next to
+    it. predict() matches CrossEncoder.predict for single-logit models (sigmoid scores).
+    """
+    def __init__(self, model: str, max_length: int = 256, threads: int = 0):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_dir = model
+        if not os.path.isdir(model_dir):
+            from huggingface_hub import snapshot_download
+            model_dir = snapshot_download(model, allow_patterns=["*.json", "*.txt", "*.model", "onnx/*"])
+
+        self.model_path = find_onnx_model(model_dir)
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(self.model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+
+    def predict(self, pairs, batch_size: int = 32, **kwargs) -> np.ndarray:
+        """
+        Relevance scores for (query, document) pairs.
+
+        Parameters:
+        - pairs (list): [query, document] text pairs.
+        - batch_size (int): Pairs per inference call.
+
+        Returns:
+        - np.ndarray: One score per pair.
+        """
+        scores = []
+        for offset in range(0, len(pairs), batch_size):
+            batch = pairs[offset:offset + batch_size]
+            encoded = self.tokenizer(
+                [pair[0] for pair in batch], [pair[1] for pair in batch],
+                padding=True, truncation=True, max_length=self.max_length, return_tensors="np",
+            )
+            feeds = {name: encoded[name].astype(np.int64) for name in self.input_names if name in encoded}
+            logits = np.asarray(self.session.run(None, feeds)[0], dtype=np.float32)
+            logits = logits[:, 0] if logits.ndim == 2 else logits.reshape(-1)
+            scores.append(1.0 / (1.0 + np.exp(-logits)))
+        return np.concatenate(scores) if scores else np.empty(0, dtype=np.float32)
+
+def load_reranker(backend: str = "cross_encoder", model: str = "BAAI/bge-reranker-base", max_length: int = 256, device: str = None):
+    """
+    Load a reranker with a CrossEncoder-compatible predict(pairs).
+
+    Parameters:
+    - backend (str): 'cross_encoder', 'onnx' or 'none'.
+    - model (str): Model name or local path.
+    - max_length (int): Maximum tokens per (query, document) pair.
+    - device (str, optional): Torch device for the cross_encoder backend (CUDA if
+      available by default). torch and sentence-transformers are only imported
+      when that backend is loaded.
+
+    Returns:
+    - object or None: The reranker, or None for backend 'none'. An ONNX model that
+      fails to load falls back to the cross_encoder backend.
+    """
+    backend = (backend or "none").lower()
+    if backend not in RERANKER_BACKENDS:
+        queue_message(f"WARNING: Unknown reranker backend '{backend}', using cross_encoder")
+        backend = "cross_encoder"
+    if backend == "none":
+        return None
+
+    if backend == "onnx":
+        try:
+            reranker = OnnxReranker(model, max_length=max_length)
+            queue_message(f"INFO: ONNX int8 reranker loaded from {reranker.model_path}")
+            return reranker
+        except Exception as e:
+            queue_message(f"WARNING: Failed to load ONNX reranker {model}: {e}. Falling back to CrossEncoder.")
+
+    import torch
+    from sentence_transformers import CrossEncoder
+    if device is None:
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    reranker = CrossEncoder(model, device=device, max_length=max_length)
+    queue_message(f"INFO: Reranker model {model} loaded successfully")
+    return reranker
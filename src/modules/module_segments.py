@@ -0,0 +1,372 @@
+"""
+module_segments.py
+
+Time-partitioned memory segments for TARS-AI HyperDB.
+
+A long-lived character accumulates memories without bound, and a single flat
+HyperDB keeps all of them in RAM and scores every one per query. SegmentedHyperDB
+splits memory by age:
+- the hot segment is the regular read-write HyperDB (write-ahead log, in RAM) and
+  holds the most recent turns;
+- once it holds 2 x `segment_size` memories, the oldest `segment_size` are sealed
+  into a read-only `.memdb` segment: vectors memory-mapped (optionally int8 or
+  float16 quantized), with its own BM25 / vector index, listed in `segments.json`.
+
+Queries fan out to every segment whose time span can match the filters and merge
+the per-segment top-k; in hybrid mode the merged RRF candidates are reranked once.
+
+What sealing bounds is the vectors: a sealed segment's vectors are mapped, so only
+the query's working set of pages stays resident. Its documents are still loaded
+into RAM when the segment is opened, and in hybrid mode so is its BM25 index
+(rebuilt from the documents), so RAM still grows with the total amount of text.
+"""
+
+# === Standard Libraries ===
+import os
+import json
+import itertools
+
+import numpy as np
+
+from modules.module_hyperdb import QuantizedArena, normalize_rows, cosine_similarity
+from modules.module_memstore import atomic_write, save_mmap_snapshot
+from modules.module_metadata import MetadataColumns, parse_timestamp
+from modules.module_messageQue import queue_message
+
+SEGMENTS_MANIFEST = "segments.json"
+
+# Segment number of the hot segment in result handles
+HOT_SEGMENT = -1
+
+class SegmentedHyperDB:
+    """
+    Hot HyperDB plus sealed, memory-mapped segments of older memories.
+
+    Result rows are (segment, key) handles for get_window() that stay valid while
+    memories are sealed: a sealed segment's number is its position in `segments`
+    (oldest first; segments are only ever appended) and `key` its row, which never
+    changes. For the hot segment, `segment` is HOT_SEGMENT and `key` the stable
+    doc id (HyperDB.doc_id), which still resolves after the memory was sealed.
+
+    The hot segment's lock (HyperDB.lock) guards the segment list as well: queries
+    hold it, and seal() takes it only to swap a written segment in.
+    """
+    def __init__(self, hot, directory: str, segment_size: int = 0, segment_storage: str = "int8", segment_factory=None):
+        """
+        Parameters:
+        - hot (HyperDB): The read-write database new memories go to.
+        - directory (str): Folder holding the sealed `.memdb` segments and their manifest.
+        - segment_size (int): Memories per sealed segment (0 disables sealing).
+        - segment_storage (str): Vector storage of sealed segments: 'float32', 'float16' or 'int8'.
+        - segment_factory (callable): Returns an empty HyperDB configured for a sealed
+          segment (its vector_storage should match segment_storage).
+        """
+        self.hot = hot
+        self.directory = directory
+        self.segment_size = max(0, segment_size)
+        self.segment_storage = segment_storage
+        self.segment_factory = segment_factory
+        self.entries = []   # manifest entries, oldest first
+        self.segments = []  # opened HyperDB per entry
+        self.next_number = 0
+        # (segment number, hot doc ids) of the segments sealed by this process, for stale hot handles
+        self._sealed_ids = []
+
+    def open(self, storage_file: str):
+        """
+        Open the sealed segments listed in the manifest (vectors are mapped, not read).
+
+        Parameters:
+        - storage_file (str): Path of the hot segment's snapshot, re-saved if memories
+          left behind by an interrupted seal are dropped from it.
+        """
+        manifest_path = os.path.join(self.directory, SEGMENTS_MANIFEST)
+        if not os.path.exists(manifest_path):
+            return
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+        self.next_number = manifest.get("next", 0)
+        for entry in manifest.get("segments", []):
+            segment = self._open_segment(entry)
+            if segment is not None:
+                self.entries.append(entry)
+                self.segments.append(segment)
+        if self.segments:
+            total = sum(entry["count"] for entry in self.entries)
+            queue_message(f"LOAD: Opened {len(self.segments)} sealed memory segments ({total} memories)")
+            if self._drop_sealed_duplicates():
+                self.hot.save(storage_file)
+
+    def _open_segment(self, entry: dict):
+        segment = self.segment_factory()
+        if not segment.load(os.path.join(self.directory, entry["name"]), journal=False):
+            queue_message(f"ERROR: Failed to open memory segment {entry['name']}; skipping it")
+            return None
+        # Query embeddings are computed once, and the reranker model loaded once, for all segments
+        segment.embedding_cache = self.hot.embedding_cache
+        segment.reranker = getattr(self.hot, "reranker", None)
+        return segment
+
+    def _drop_sealed_duplicates(self) -> bool:
+        """Remove memories from the hot segment that an interrupted seal() already wrote to a segment."""
+        sealed = self.segments[-1].documents
+        head = list(self.hot.view()[:len(sealed)])
+        if len(head) != len(sealed) or head != sealed:
+            return False
+        queue_message(f"LOAD: Dropping {len(sealed)} memories already sealed into {self.entries[-1]['name']}")
+        self.hot.remove_documents(list(itertools.islice(self.hot.view().rows(), len(sealed))))
+        self.hot.compact()
+        return True
+
+    def _write_manifest(self):
+        manifest = {"format": 1, "next": self.next_number, "segments": self.entries}
+
+        def write(path):
+            with open(path, "w") as f:
+                json.dump(manifest, f, indent=1)
+
+        atomic_write(os.path.join(self.directory, SEGMENTS_MANIFEST), write)
+
+    @property
+    def live_count(self) -> int:
+        """Memories across all segments."""
+        with self.hot.lock:
+            return self.hot.live_count + sum(segment.live_count for segment in self.segments)
+
+    def seal_due(self) -> bool:
+        """True when the hot segment has grown enough to seal its oldest memories."""
+        return self.segment_size > 0 and self.hot.live_count >= 2 * self.segment_size
+
+    def maybe_seal(self, storage_file: str) -> int:
+        """
+        Seal the oldest hot memories into segments while the hot segment is over its size.
+
+        Parameters:
+        - storage_file (str): Path of the hot segment's snapshot, re-saved after sealing.
+
+        Returns:
+        - int: Number of segments written.
+        """
+        sealed = 0
+        while self.seal_due():
+            self.seal()
+            sealed += 1
+        if sealed:
+            self.hot.save(storage_file)
+        return sealed
+
+    def seal(self):
+        """
+        Move the oldest `segment_size` hot memories into a new sealed segment.
+
+        The segment is written to the side while queries keep running, then swapped
+        in under the hot segment's lock: the segment is listed and the memories are
+        removed from the hot segment in one step. The manifest is written before the
+        removal; if that removal is lost to a crash, open() drops the duplicates.
+        The caller saves the hot segment afterwards (see maybe_seal).
+        """
+        hot = self.hot
+        with hot.lock:
+            rows = np.fromiter(itertools.islice(hot.view().rows(), self.segment_size), dtype=np.int64)
+            ids = np.fromiter((hot.doc_id(row) for row in rows), dtype=np.int64, count=rows.shape[0])
+            documents = [hot.documents[row] for row in rows]
+            vectors = np.array(hot._arena.take(rows), dtype=np.float32)
+
+        normalize = hot.similarity_metric is cosine_similarity
+        unit_vectors, quantized = None, None
+        if self.segment_storage != "float32":
+            arena = QuantizedArena.from_array(vectors, self.segment_storage, normalize=normalize)
+            quantized = (arena.storage, arena.codes, arena.scales)
+        elif normalize:
+            unit_vectors = normalize_rows(vectors).view
+
+        name = f"segment-{self.next_number:05d}.memdb"
+        os.makedirs(self.directory, exist_ok=True)
+        save_mmap_snapshot(
+            os.path.join(self.directory, name), vectors, documents, unit_vectors=unit_vectors, quantized=quantized
+        )
+        timestamps = MetadataColumns(documents).timestamps
+        dated = timestamps[~np.isnan(timestamps)]
+        entry = {
+            "name": name,
+            "count": len(documents),
+            "first": float(dated.min()) if dated.size else None,
+            "last": float(dated.max()) if dated.size else None,
+        }
+        segment = self._open_segment(entry)
+        if segment is None:
+            raise RuntimeError(f"sealed memory segment {name} could not be opened")
+
+        with hot.lock:
+            self.next_number += 1
+            self.entries.append(entry)
+            self.segments.append(segment)
+            self._sealed_ids.append((len(self.segments) - 1, ids))
+            self._write_manifest()
+            # By doc id: rows may have moved while the segment was written
+            rows = [row for row in map(hot.row_of, ids.tolist()) if row is not None]
+            hot.remove_documents(rows)
+            hot.compact()
+        queue_message(f"INFO: Sealed {len(documents)} memories into {name}")
+
+    def _databases(self, filters: dict = None):
+        """(segment number, HyperDB) pairs a query must visit, skipping segments outside the filter's time range."""
+        since = until = None
+        if filters:
+            since = None if filters.get("since") is None else parse_timestamp(filters["since"])
+            until = None if filters.get("until") is None else parse_timestamp(filters["until"])
+        selected = []
+        for index, (entry, segment) in enumerate(zip(self.entries, self.segments)):
+            if filters and (since is not None or until is not None):
+                if entry["first"] is None:
+                    continue  # no dated memories, so no time range can match
+                if (since is not None and entry["last"] < since) or (until is not None and entry["first"] >= until):
+                    continue
+            selected.append((index, segment))
+        if self.hot.live_count:
+            selected.append((HOT_SEGMENT, self.hot))
+        return selected
+
+    def _resolve(self, handle):
+        """(position, HyperDB, row) of a handle; position orders the segments oldest first, hot last."""
+        number, key = handle
+        if number != HOT_SEGMENT:
+            return number, self.segments[number], key
+        row = self.hot.row_of(key)
+        if row is not None:
+            return len(self.segments), self.hot, row
+        # Sealed since the query returned it
+        for number, ids in self._sealed_ids:
+            row = int(np.searchsorted(ids, key))
+            if row < ids.shape[0] and ids[row] == key:
+                return number, self.segments[number], row
+        return None, None, None
+
+    def _at(self, position: int):
+        return self.hot if position == len(self.segments) else self.segments[position]
+
+    def query(
+        self, query_text: str, top_k: int = 5, return_similarities: bool = True, return_rows: bool = False,
+        filters: dict = None, query_vector=None
+    ):
+        """
+        Query every relevant segment and merge the results (shaped like HyperDB.query).
+
+        Naive retrieval merges per-segment top-k by similarity. Hybrid retrieval
+        merges the per-segment RRF candidates and reranks them in a single reranker
+        call, so scores from different segments are comparable. The query is embedded
+        once, before the hot segment's lock is taken.
+
+        Returns:
+            List of documents or (document, score) tuples; with return_rows, rows are
+            (segment, key) handles for get_window
+        """
+        if query_vector is None:
+            query_vector = self.hot.embed_query(query_text)
+        with self.hot.lock:
+            return self._query(query_text, query_vector, top_k, return_similarities, return_rows, filters)
+
+    def _query(self, query_text: str, query_vector, top_k: int, return_similarities: bool, return_rows: bool, filters: dict = None):
+        databases = self._databases(filters)
+        if not databases:
+            return []
+        if len(databases) == 1:
+            index, db = databases[0]
+            hits = [
+                (score, index, row, document)
+                for document, score, row in db.query(
+                    query_text, top_k, return_similarities=True, return_rows=True, filters=filters, query_vector=query_vector
+                )
+            ]
+        elif self.hot.rag_strategy == "hybrid":
+            hits = self._hybrid_hits(query_text, query_vector, top_k, databases, filters)
+        else:
+            hits = []
+            for index, db in databases:
+                hits.extend(
+                    (float(score), index, row, document)
+                    for document, score, row in db._vector_query(
+                        query_text, top_k, True, True, filters=filters, query_vector=query_vector
+                    )
+                )
+            hits.sort(key=lambda hit: hit[0], reverse=True)
+        hits = [
+            (score, number, self.hot.doc_id(row) if number == HOT_SEGMENT else row, document)
+            for score, number, row, document in hits[:top_k]
+        ]
+        return self._format_hits(hits, return_similarities, return_rows)
+
+    def _hybrid_hits(self, query_text: str, query_vector, top_k: int, databases, filters: dict = None):
+        hot = self.hot
+        # As in HyperDB._fuse_results: at least top_k fused hits, of which the first
+        # rerank_count are reranked
+        rerank_count = hot.rerank_candidates or top_k * 2
+        candidates = max(top_k, rerank_count)
+        hits = []
+        for index, db in databases:
+            hits.extend(
+                (float(score), index, row, document)
+                for document, score, row in db.hybrid_query(
+                    query_text, top_k=candidates, return_rows=True, filters=filters, rerank=False, query_vector=query_vector
+                )
+            )
+        hits.sort(key=lambda hit: hit[0], reverse=True)
+        hits, rest = hits[:rerank_count], hits[rerank_count:candidates]
+        if not getattr(hot, "reranker", None) or len(hits) < 2:
+            return hits + rest
+
+        # Hot rows are cached under their stable doc id; sealed rows never change, so
+        # they get negative ids that cannot collide with it
+        ids = [
+            hot.doc_id(row) if number == HOT_SEGMENT else -((number << 32) | int(row)) - 1
+            for _, number, row, _ in hits
+        ]
+        with hot.timings.time("rerank"):
+            scores = hot._rerank_scores(query_text, [hit[3] for hit in hits], ids)
+        if scores is None:
+            return hits + rest
+        reranked = [(score,) + hit[1:] for score, hit in zip(scores, hits)]
+        reranked.sort(key=lambda hit: hit[0], reverse=True)
+        return reranked + rest
+
+    @staticmethod
+    def _format_hits(hits, return_similarities: bool, return_rows: bool):
+        if return_rows:
+            if return_similarities:
+                return [(document, score, (index, row)) for score, index, row, document in hits]
+            return [(document, (index, row)) for score, index, row, document in hits]
+        if return_similarities:
+            return [(document, score) for score, index, row, document in hits]
+        return [document for score, index, row, document in hits]
+
+    def get_window(self, handle, before: int = 1, after: int = 1) -> list:
+        """
+        Documents around a query hit (see HyperDB.get_window), continuing into the
+        neighbouring segment when the hit is at a segment boundary.
+
+        Parameters:
+        - handle (tuple): (segment, key) from query(..., return_rows=True).
+        - before (int): Number of preceding documents.
+        - after (int): Number of following documents.
+
+        Returns:
+        - list: The documents of the window (empty if the memory was deleted).
+        """
+        with self.hot.lock:
+            position, db, row = self._resolve(handle)
+            if db is None:
+                return []
+            preceding = db.get_window(row, before=before, after=0)[:-1]
+            following = db.get_window(row, before=0, after=after)
+            centre, following = following[:1], following[1:]
+            if len(preceding) < before and position > 0:
+                missing = before - len(preceding)
+                preceding = list(self._at(position - 1).view()[-missing:]) + preceding
+            if len(following) < after and position < len(self.segments):
+                following += list(self._at(position + 1).view()[:after - len(following)])
+            return preceding + centre + following
+
+    def close(self):
+        """Release the sealed segments (their mappings close once no view references them)."""
+        for segment in self.segments:
+            segment.close()
@@ -0,0 +1,95 @@
+"""
+Shared fixtures for the TARS-AI memory tests.
+
+Run from src/:  python -m pytest tests
+
+Documents and queries are embedded with the deterministic stand-in embeddings of
+module_embedserver, so no embedding model is loaded.
+"""
+
+# === Standard Libraries ===
+import os
+import re
+import sys
+
+import numpy as np
+import pytest
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SRC_DIR)
+
+from modules.module_embedserver import StandInEmbeddingServer, stand_in_embedding
+from modules.module_hyperdb import HyperDB, get_document_text
+
+DIM = 32
+
+def embed(items):
+    """Stand-in embeddings of query texts or documents, as an (N, DIM) matrix."""
+    return np.stack([
+        stand_in_embedding(item if isinstance(item, str) else get_document_text(item), DIM) for item in items
+    ])
+
+def memories(start: int, stop: int) -> list:
+    """Text memories "memory <i>" for i in [start, stop)."""
+    return [{"text": f"memory {i}"} for i in range(start, stop)]
+
+class WordOverlapReranker:
+    """Stand-in cross-encoder scoring (query, text) pairs by shared words; counts the pairs scored."""
+    def __init__(self):
+        self.pairs = 0
+
+    def predict(self, pairs):
+        self.pairs += len(pairs)
+        return [len(set(query.split()) & set(text.split())) for query, text in pairs]
+
+@pytest.fixture
+def make_db():
+    """Factory for HyperDB instances using the stand-in embeddings; closed after the test."""
+    created = []
+
+    def make(**options):
+        options.setdefault("reranker_backend", "none")
+        db = HyperDB(embedding_function=embed, **options)
+        created.append(db)
+        return db
+
+    yield make
+    for db in created:
+        db.close()
+
+def count_words(texts):
+    """Stand-in tokenizer: one token per word and per newline."""
+    return [len(re.findall(r"\S+|\n", text)) for text in texts]
+
+@pytest.fixture
+def memory_manager(tmp_path, monkeypatch):
+    """
+    Factory for MemoryManagers keeping their memory under tmp_path, embedding through
+    the stand-in embeddings server and counting tokens with count_words.
+    """
+    from modules.module_memory import MemoryManager
+
+    (tmp_path / "memory").mkdir()
+    (tmp_path / "src").mkdir()
+    monkeypatch.chdir(tmp_path / "src")  # memory lives in ../memory
+    server = StandInEmbeddingServer(dim=DIM).start()
+    created = []
+
+    def make(**rag):
+        config = {
+            "CHAR": {"user_name": "Joe"},
+            "LLM": {"llm_backend": "ooba", "base_url": server.url, "api_key": ""},
+            "RAG": dict(
+                embedding_backend="remote", embedding_model="stand-in", embedding_warmup=False,
+                reranker_backend="none", memory_write_delay=0.0, **rag,
+            ),
+        }
+        manager = MemoryManager(config, "TARS", "Hello.")
+        monkeypatch.setattr(manager, "_count_tokens", count_words)
+        created.append(manager)
+        return manager
+
+    yield make
+    for manager in created:
+        manager.close()
+    server.stop()
@@ -0,0 +1,69 @@
+"""Tombstone deletion and compaction: queries answer the same before and after."""
+
+import pytest
+
+from conftest import memories
+
+def tag(i: int) -> str:
+    """Distinct alphabetic token for note i (BM25 drops bare numbers)."""
+    return "".join(chr(ord("a") + int(digit)) for digit in f"{i:03d}")
+
+def notes(start: int, stop: int) -> list:
+    return [{"text": f"note {tag(i)}"} for i in range(start, stop)]
+
+CONFIGS = {
+    "naive": dict(),
+    "int8": dict(vector_storage="int8"),
+    "ivf": dict(index_type="ivf", ann_exact_threshold=0, ann_nlist=8, ann_nprobe=8),
+    "hybrid": dict(rag_strategy="hybrid"),
+    "hybrid-rebuild": dict(rag_strategy="hybrid", bm25_mode="rebuild"),
+}
+QUERIES = [f"note {tag(i)}" for i in (3, 43, 151, 199)]
+
+def answers(db):
+    # BM25 breaks score ties arbitrarily at its top-k cutoff, so hybrid results are
+    # compared on the hit both branches agree on
+    top_k = 1 if db.rag_strategy == "hybrid" else 5
+    return [
+        [(document, pytest.approx(score, abs=1e-5)) for document, score in db.query(text, top_k=top_k)]
+        for text in QUERIES
+    ]
+
+@pytest.mark.parametrize("config", CONFIGS)
+def test_results_unchanged_by_compaction(make_db, tmp_path, config):
+    path = str(tmp_path / "memory.pickle.gz")
+    db = make_db(compact_threshold=1.0, **CONFIGS[config])
+    db.add_documents(notes(0, 200))
+    db.save(path)
+    db.remove_documents(list(range(0, 200, 3)))
+    assert db.live_count == 133 and len(db.documents) == 200
+
+    before = answers(db)
+    assert all(document != {"text": f"note {tag(3)}"} for document, _ in before[0])
+    assert [answer[0][0] for answer in before[1:]] == [{"text": f"note {tag(i)}"} for i in (43, 151, 199)]
+    assert db.compact() == 67
+    assert len(db.documents) == 133
+    assert answers(db) == before
+
+    # Compaction is journaled, so a replay arrives at the same rows
+    db.persist(path)
+    reloaded = make_db(compact_threshold=1.0, **CONFIGS[config])
+    reloaded.load(path)
+    assert list(reloaded.view()) == list(db.view())
+    assert answers(reloaded) == before
+
+def test_threshold_triggers_compaction(make_db):
+    db = make_db(compact_threshold=0.25)
+    db.add_documents(memories(0, 100))
+    db.remove_documents(range(0, 20))
+    assert len(db.documents) == 100
+    db.remove_documents(range(20, 30))
+    assert len(db.documents) == 70
+    assert db.query("memory 50", top_k=1, return_similarities=False) == [{"text": "memory 50"}]
+
+def test_windows_skip_deleted_rows(make_db):
+    db = make_db(compact_threshold=1.0)
+    db.add_documents(memories(0, 10))
+    db.remove_documents([4, 6])
+    assert db.get_window(5, before=1, after=1) == [{"text": "memory 3"}, {"text": "memory 5"}, {"text": "memory 7"}]
+    assert list(db.view()) == [m for m in memories(0, 10) if m["text"] not in ("memory 4", "memory 6")]
@@ -0,0 +1,126 @@
+"""Queries running while the memory writer thread inserts, deletes and persists."""
+
+# === Standard Libraries ===
+import threading
+
+import numpy as np
+import pytest
+
+from conftest import embed, memories
+from modules.module_hyperdb import HyperDB
+
+@pytest.mark.parametrize("strategy", ["naive", "hybrid"])
+def test_queries_see_consistent_rows_during_writes(make_db, tmp_path, strategy):
+    path = str(tmp_path / "memory.pickle.gz")
+    db = make_db(rag_strategy=strategy, compact_threshold=0.05)
+    db.add_documents(memories(0, 50))
+    db.save(path)
+
+    errors = []
+    done = threading.Event()
+
+    def writer():
+        try:
+            for start in range(50, 650, 20):
+                db.add_documents(memories(start, start + 20))
+                db.remove_documents(range(0, 3))
+                db.persist(path)
+        except Exception as e:  # surfaced by the assertion below
+            errors.append(e)
+        finally:
+            done.set()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    queries = 0
+    while not done.is_set() or not queries:
+        text = f"memory {queries % 650}"
+        with db.lock:
+            results = db.query(text, top_k=3, return_similarities=True, return_rows=True)
+            windows = [db.get_window(row, before=1, after=1) for _, _, row in results]
+        for (document, score, row), window in zip(results, windows):
+            assert document in window
+            if strategy == "naive":
+                # The score belongs to this document's own vector
+                expected = float(embed([document])[0] @ embed([text])[0])
+                assert score == pytest.approx(expected, abs=1e-4)
+        queries += 1
+    thread.join()
+
+    assert not errors
+    assert queries > 1
+    reloaded = HyperDB(embedding_function=embed, rag_strategy=strategy, reranker_backend="none")
+    assert reloaded.load(path)
+    assert list(reloaded.view()) == list(db.view())
+    reloaded.close()
+
+def test_insert_is_atomic_for_readers(make_db):
+    db = make_db()
+    db.add_documents(memories(0, 10))
+    stop = threading.Event()
+    mismatches = []
+
+    def reader():
+        while not stop.is_set():
+            with db.lock:
+                if len(db.documents) != len(db.vectors):
+                    mismatches.append((len(db.documents), len(db.vectors)))
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    for start in range(10, 2010, 50):
+        db.add_documents(memories(start, start + 50), vectors=embed(memories(start, start + 50)))
+    stop.set()
+    thread.join()
+    assert not mismatches
+
+QUERIES = {
+    "query": lambda db: db.query("slow query", top_k=3, return_similarities=False),
+    "hybrid_query": lambda db: db.hybrid_query("slow query", top_k=3, return_similarities=False),
+    "query_many": lambda db: db.query_many(["slow query", "memory 3"], top_k=3, return_similarities=False)[0],
+}
+
+@pytest.mark.parametrize("method", QUERIES)
+def test_queries_embed_before_taking_the_lock(make_db, method):
+    db = make_db(rag_strategy="hybrid", embedding_cache_mb=0)
+    db.add_documents(memories(0, 20))
+    embedding = threading.Event()
+    release = threading.Event()
+
+    def slow_embed(items):
+        if "slow query" in items:
+            embedding.set()
+            release.wait(10)
+        return embed(items)
+
+    db.embedding_function = slow_embed
+    results = []
+    thread = threading.Thread(target=lambda: results.append(QUERIES[method](db)))
+    thread.start()
+    try:
+        assert embedding.wait(10)
+        # The memory writer can insert while the query is being embedded
+        assert db.lock.acquire(timeout=5)
+        db.add_documents(memories(20, 21))
+        db.lock.release()
+    finally:
+        release.set()
+        thread.join()
+    assert len(results[0]) == 3
+
+def test_prompt_builders_share_the_turn_index(memory_manager):
+    manager = memory_manager()
+    for i in range(30):
+        manager.write_longterm_memory(f"question {i}", f"answer {i}")
+    assert manager.flush(timeout=10)
+
+    lengths = []
+    threads = [
+        threading.Thread(target=lambda: lengths.append(manager.get_shortterm_memories_tokenlimit(10000, return_length=True)[1]))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert lengths == [30 * 7 + 29] * 8
@@ -0,0 +1,116 @@
+"""Near-duplicate suppression at insert time (module_dedup, HyperDB dedup_* options)."""
+
+import numpy as np
+import pytest
+
+from modules.module_dedup import DEDUP_KEY, SimHashIndex
+from modules.module_hyperdb import HyperDB
+
+DIM = 64
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(1)
+
+def near(rng, vector, eps=0.05):
+    return (vector + eps * rng.standard_normal(vector.shape) / np.sqrt(DIM)).astype(np.float32)
+
+def tool(label, timestamp="2025-01-01 00:00:00"):
+    return {"timestamp": timestamp, "bot_response": f"tool {label}"}
+
+def row_of(db, text):
+    return next(row for row, document in enumerate(db.documents) if document["bot_response"] == text)
+
+@pytest.fixture
+def stored(make_db, rng):
+    db = make_db(dedup_threshold=0.97)
+    base = rng.standard_normal((20, DIM)).astype(np.float32)
+    db.add_documents([tool(i) for i in range(20)], base)
+    return db, base
+
+def test_near_duplicate_merges_into_stored_memory(stored, rng):
+    db, base = stored
+    db.add_document(tool("dup", "2025-01-02 00:00:00"), near(rng, base[3]))
+    assert db.live_count == 20
+    assert db.documents[3][DEDUP_KEY] == {"hits": 1, "last_seen": "2025-01-02 00:00:00"}
+    assert db.dedup_suppressed == 1
+
+def test_distinct_memories_and_dialog_are_kept(stored, rng):
+    db, base = stored
+    db.add_document(tool("new"), rng.standard_normal(DIM).astype(np.float32))
+    # Dialog turns are not in the default dedup_kinds
+    db.add_document({"timestamp": "x", "user_input": "hi", "bot_response": "tool 3"}, base[3])
+    assert db.live_count == 22
+
+def test_batch_matches_stored_rows_and_itself(stored, rng):
+    db, base = stored
+    fresh = rng.standard_normal(DIM).astype(np.float32)
+    batch = np.stack([
+        near(rng, base[5]), fresh, near(rng, fresh), near(rng, base[5]), near(rng, fresh),
+        rng.standard_normal(DIM).astype(np.float32),
+    ])
+    db.add_documents([tool(f"b{i}", f"2025-01-03 00:00:0{i}") for i in range(6)], batch)
+
+    assert db.live_count == 22
+    assert db.documents[5][DEDUP_KEY]["hits"] == 2
+    assert db.documents[row_of(db, "tool b1")][DEDUP_KEY] == {"hits": 2, "last_seen": "2025-01-03 00:00:04"}
+    assert db.dedup_suppressed == 4
+
+def test_hits_survive_replay_and_follow_compaction(stored, rng, tmp_path):
+    db, base = stored
+    path = str(tmp_path / "memory.pickle.gz")
+    db.save(path)
+    db.add_document(tool("dup"), near(rng, base[10]))
+    db.persist(path)
+
+    reloaded = HyperDB(dedup_threshold=0.97, reranker_backend="none")
+    reloaded.load(path)
+    assert reloaded.documents == db.documents
+
+    # The survivor of a deleted memory is gone, so its duplicate is stored again
+    reloaded.remove_documents([5])
+    reloaded.compact()
+    reloaded.add_document(tool("again"), near(rng, base[5]))
+    assert reloaded.live_count == 20
+    # Rows after the deleted one moved down; hits still land on the right memory
+    reloaded.add_document(tool("dup 2"), near(rng, base[10]))
+    assert reloaded.documents[9]["bot_response"] == "tool 10"
+    assert reloaded.documents[9][DEDUP_KEY]["hits"] == 2
+    reloaded.close()
+
+def test_skip_mode_and_disabled(make_db, rng):
+    vector = rng.standard_normal(DIM).astype(np.float32)
+    skip = make_db(dedup_threshold=0.97, dedup_mode="skip")
+    skip.add_documents([tool(1), tool(2)], np.stack([vector, near(rng, vector)]))
+    assert skip.live_count == 1
+    assert skip.documents[0][DEDUP_KEY] == {"hits": 1}
+
+    disabled = make_db()
+    disabled.add_documents([tool(1), tool(2)], np.stack([vector, vector]))
+    assert disabled.live_count == 2
+
+def test_hybrid_keeps_bm25_in_step(make_db, rng):
+    db = make_db(dedup_threshold=0.97, rag_strategy="hybrid")
+    base = rng.standard_normal((20, DIM)).astype(np.float32)
+    db.add_documents([tool(i) for i in range(20)], base)
+    db.add_documents([tool("z"), tool("7x")], np.stack([near(rng, base[1]), rng.standard_normal(DIM)]))
+    assert db.live_count == 21
+    assert len(db.corpus_texts) == 21
+
+def test_simhash_index_grows_and_compacts(rng):
+    index = SimHashIndex(DIM)
+    vectors = rng.standard_normal((300, DIM)).astype(np.float32)
+    for start in range(0, 300, 7):
+        rows = np.arange(start, min(start + 7, 300))
+        index.add(rows, index.band_keys(vectors[rows]))
+    assert len(index) == 300
+    assert 42 in index.candidates(index.band_keys(vectors[42:43]))[0]
+
+    keep = np.ones(300, dtype=bool)
+    keep[:100] = False
+    index.compact(keep)
+    assert len(index) == 200
+    # Row 142 is row 42 after compaction
+    assert 42 in index.candidates(index.band_keys(vectors[142:143]))[0]
+    index.add(np.array([200]), index.band_keys(vectors[:1]))
+    assert len(index) == 201
@@ -0,0 +1,106 @@
+"""Metadata-filtered retrieval (module_metadata, HyperDB filters)."""
+
+# === Standard Libraries ===
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pytest
+
+from modules.module_metadata import MetadataColumns, parse_timestamp
+
+START = datetime(2025, 1, 1)
+
+def at(hours: float) -> str:
+    return (START + timedelta(hours=hours)).strftime("%Y-%m-%d %H:%M:%S")
+
+# Row: 0-2 dialog turns an hour apart, 3 a tool note, 4 a greeting without a
+# timestamp, 5 an unparseable timestamp from another source, 6 out of time order
+DOCUMENTS = [
+    {"timestamp": at(0), "user_input": "hi", "bot_response": "hello"},
+    {"timestamp": at(1), "user_input": "weather?", "bot_response": "sunny"},
+    {"timestamp": at(2), "user_input": "bye", "bot_response": "later"},
+    {"timestamp": at(2), "bot_response": "Used tool: weather lookup"},
+    {"text": "TARS: greetings"},
+    {"timestamp": "yesterday-ish", "user_input": "x", "bot_response": "y", "source": "discord"},
+    {"timestamp": at(-5), "user_input": "early", "bot_response": "bird", "kind": "note"},
+]
+
+@pytest.fixture(params=["naive", "int8", "hybrid"])
+def db(request, make_db):
+    options = {"int8": dict(vector_storage="int8"), "hybrid": dict(rag_strategy="hybrid")}.get(request.param, {})
+    db = make_db(compact_threshold=1.0, **options)
+    db.add_documents(DOCUMENTS)
+    return db
+
+def rows(db, **filters):
+    return db.filter_rows(filters).tolist()
+
+def test_time_range_bounds(db):
+    assert rows(db, since=at(1)) == [1, 2, 3]  # inclusive
+    assert rows(db, until=at(2)) == [0, 1, 6]  # exclusive
+    assert rows(db, since=at(1), until=at(1)) == []
+    assert rows(db, since=at(3)) == []
+    assert rows(db, until=START) == [6]
+    # datetime, date, string and epoch seconds are interchangeable
+    assert rows(db, since=START + timedelta(hours=1)) == rows(db, since=parse_timestamp(at(1))) == [1, 2, 3]
+    assert rows(db, since=date(2025, 1, 1), until=at(1)) == [0]
+
+def test_undated_rows_never_match_a_time_range(db):
+    assert 4 not in rows(db, since=0)
+    assert 5 not in rows(db, until=1e12)
+    assert rows(db, kind="text") == [4]
+
+def test_kind_and_source(db):
+    assert rows(db, kind="dialog") == [0, 1, 2, 5]
+    assert rows(db, kind=["tool", "note"]) == [3, 6]
+    assert rows(db, kind="missing") == []
+    assert rows(db, source="discord") == [5]
+    assert rows(db, source="") == [0, 1, 2, 3, 4, 6]
+    assert rows(db, kind="dialog", source=["discord"], since=at(0)) == []
+    assert rows(db, where=lambda columns, candidates: candidates % 2 == 0, kind="dialog") == [0, 2]
+
+def test_no_filters_and_unknown_keys(db):
+    assert db.filter_rows(None) is None and db.filter_rows({}) is None
+    with pytest.raises(ValueError):
+        db.filter_rows({"after": at(0)})
+
+def test_deleted_rows_are_excluded(db):
+    db.remove_documents([1])
+    assert rows(db, kind="dialog") == [0, 2, 5]
+    db.compact()
+    assert rows(db, kind="dialog") == [0, 1, 4]
+    assert rows(db, since=at(1)) == [1, 2]
+
+def test_filtered_queries(db):
+    # The best match overall is filtered out; fewer matches than top_k return them all
+    results = db.query("Used tool: weather lookup", top_k=5, return_rows=True, filters={"kind": "dialog", "since": at(1)})
+    assert sorted(row for *_, row in results) == [1, 2]
+    assert db.query("hi hello", top_k=3, filters={"kind": "missing"}) == []
+    assert db.query("hi hello", top_k=1, return_similarities=False, filters={"until": at(1)}) == [DOCUMENTS[0]]
+    many = db.query_many(["hi hello", "bye later"], top_k=2, filters={"kind": "tool"})
+    assert [[document for document, _ in results] for results in many] == [[DOCUMENTS[3]], [DOCUMENTS[3]]]
+
+def test_columns_follow_appends_and_reloads(make_db, tmp_path):
+    path = str(tmp_path / "memory.pickle.gz")
+    db = make_db()
+    db.add_documents(DOCUMENTS[:3])
+    db.save(path)
+    assert rows(db, since=at(1)) == [1, 2]  # columns built, then extended in place
+    db.add_documents(DOCUMENTS[3:])          # row 6 arrives out of time order
+    db.persist(path)
+    assert rows(db, until=at(0)) == [6]
+
+    reloaded = make_db()
+    reloaded.load(path)
+    for filters in ({"since": at(1)}, {"until": at(0)}, {"kind": "dialog"}, {"source": "discord"}):
+        assert reloaded.filter_rows(filters).tolist() == db.filter_rows(filters).tolist()
+
+def test_metadata_columns_directly():
+    columns = MetadataColumns(DOCUMENTS)
+    assert len(columns) == len(DOCUMENTS)
+    assert np.isnan(columns.timestamps[[4, 5]]).all()
+    keep = np.ones(len(DOCUMENTS), dtype=bool)
+    keep[0] = False
+    columns.compact(keep)
+    assert columns.select({"kind": "dialog"}).tolist() == [0, 1, 4]
+    assert columns.select({"since": at(0)}).tolist() == [0, 1, 2]
@@ -0,0 +1,16 @@
+"""Importing the memory modules must not pull in the heavy model libraries."""
+
+# === Standard Libraries ===
+import subprocess
+import sys
+
+from conftest import SRC_DIR
+
+def test_hyperdb_import_is_lazy():
+    code = (
+        "import sys\n"
+        "import modules.module_hyperdb, modules.module_reranker\n"
+        "print(sorted({'torch', 'sentence_transformers'} & set(sys.modules)))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=SRC_DIR, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,70 @@
+"""Memory-mapped .memdb snapshots: round trips, appends over the mapped base, conversion."""
+
+import numpy as np
+import pytest
+
+from conftest import embed, memories
+from modules.module_hyperdb import convert_pickle_to_mmap
+
+STORAGES = ["float32", "float16", "int8"]
+
+def top(db, text, k=5):
+    return [row for _, _, row in db.query(text, top_k=k, return_rows=True)]
+
+@pytest.mark.parametrize("storage", STORAGES)
+def test_round_trip(make_db, tmp_path, storage):
+    path = str(tmp_path / "memory.memdb")
+    db = make_db(vector_storage=storage)
+    db.add_documents(memories(0, 300))
+    db.remove_documents([7])
+    db.save(path)
+
+    loaded = make_db(vector_storage=storage)
+    assert loaded.load(path)
+    assert isinstance(loaded._arena._base, np.memmap)
+    assert list(loaded.view()) == list(db.view())
+    assert np.array_equal(np.asarray(loaded.vectors), np.asarray(db.vectors))
+    for i in (0, 8, 150, 299):
+        assert top(loaded, f"memory {i}") == top(db, f"memory {i}")
+
+@pytest.mark.parametrize("storage", STORAGES)
+def test_appends_keep_the_base_mapped(make_db, tmp_path, storage):
+    path = str(tmp_path / "memory.memdb")
+    db = make_db(vector_storage=storage)
+    db.add_documents(memories(0, 200))
+    db.save(path)
+
+    loaded = make_db(vector_storage=storage)
+    loaded.load(path)
+    loaded.add_documents(memories(200, 220))
+    db.add_documents(memories(200, 220))
+    assert isinstance(loaded._arena._base, np.memmap)
+    assert loaded._arena.base_rows == 200 and len(loaded._arena) == 220
+    assert np.array_equal(loaded._arena.take(np.array([3, 205, 199, 200])), embed(memories(0, 220))[[3, 205, 199, 200]])
+    for i in (5, 199, 200, 219):
+        assert top(loaded, f"memory {i}") == top(db, f"memory {i}")
+
+    # Saving folds the tail into a new mapped base; the WAL tail replays on top of it
+    loaded.persist(path)
+    loaded.save(path)
+    assert loaded._arena.base_rows == 220
+    loaded.add_documents(memories(220, 225))
+    loaded.persist(path)
+    reloaded = make_db(vector_storage=storage)
+    reloaded.load(path)
+    assert list(reloaded.view()) == memories(0, 225)
+
+def test_convert_pickle_snapshot(make_db, tmp_path):
+    pickle_path = str(tmp_path / "memory.pickle.gz")
+    memdb_path = str(tmp_path / "memory.memdb")
+    db = make_db()
+    db.add_documents(memories(0, 50))
+    db.save(pickle_path)
+    db.add_documents(memories(50, 60))
+    db.persist(pickle_path)
+
+    assert convert_pickle_to_mmap(pickle_path, memdb_path)
+    converted = make_db()
+    assert converted.load(memdb_path)
+    assert list(converted.view()) == memories(0, 60)
+    assert top(converted, "memory 55") == top(db, "memory 55")
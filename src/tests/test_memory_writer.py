@@ -0,0 +1,65 @@
+"""MemoryWriter: batched inserts on one worker thread, flush/close and its metrics."""
+
+# === Standard Libraries ===
+import threading
+
+from conftest import memories
+from modules.module_memstore import MemoryWriter
+
+def test_turns_are_batched_in_order(make_db):
+    db = make_db()
+    batches = []
+
+    def write_batch(documents):
+        batches.append(len(documents))
+        db.add_documents(documents)
+
+    writer = MemoryWriter(write_batch, batch_delay=0.2, max_batch=8)
+    for document in memories(0, 20):
+        writer.submit(document)
+    assert writer.flush(timeout=5)
+
+    assert db.documents == memories(0, 20)
+    assert sum(batches) == 20 and max(batches) <= 8 and len(batches) < 20
+    stats = writer.stats()
+    assert stats["written"] == 20 and stats["failed"] == 0 and stats["depth"] == 0
+    writer.close()
+
+def test_concurrent_submitters_share_one_writer(make_db):
+    db = make_db()
+    writer_threads = set()
+
+    def write_batch(documents):
+        writer_threads.add(threading.current_thread().name)
+        db.add_documents(documents)
+
+    writer = MemoryWriter(write_batch, batch_delay=0.05)
+    submitters = [
+        threading.Thread(target=lambda start=start: [writer.submit(m) for m in memories(start, start + 25)])
+        for start in range(0, 100, 25)
+    ]
+    for thread in submitters:
+        thread.start()
+    for thread in submitters:
+        thread.join()
+    writer.close()
+
+    assert writer_threads == {"MemoryWriter"}
+    assert sorted(db.documents, key=lambda m: int(m["text"].split()[1])) == memories(0, 100)
+
+def test_failed_batches_are_counted_and_writer_keeps_going():
+    written = []
+
+    def write_batch(items):
+        if "bad" in items:
+            raise ValueError("embedding backend unavailable")
+        written.extend(items)
+
+    writer = MemoryWriter(write_batch, batch_delay=0.0, max_batch=1)
+    for item in ("a", "bad", "b"):
+        writer.submit(item)
+    assert writer.flush(timeout=5)
+    writer.close()
+
+    assert written == ["a", "b"]
+    assert writer.stats()["failed"] == 1 and writer.stats()["written"] == 2
@@ -0,0 +1,70 @@
+"""Token budget of the recent conversation block in the prompt."""
+
+from conftest import count_words
+from modules.module_hyperdb import HyperDB
+from modules.module_memory import TOKEN_COUNTS_KEY, TurnTokenIndex, turn_text
+
+def test_turn_text_matches_prompt_format():
+    document = {"user_input": "hi", "bot_response": "hello"}
+    assert turn_text(document) == "{user}: hi\n{char}: hello"
+    assert turn_text(document, "Ann", "TARS") == "Ann: hi\nTARS: hello"
+    assert turn_text({"text": "Used tool: weather"}) == ""
+
+def test_budget_counts_joining_newlines():
+    index = TurnTokenIndex("key", separator_tokens=1)
+    for n, tokens in enumerate([3, 4, 5]):
+        index.append({"n": n}, tokens)
+
+    # The newest two turns need 4 + 1 + 5 tokens once joined
+    assert index.newest_within(9) == [{"n": 2}]
+    assert index.newest_within(10) == [{"n": 1}, {"n": 2}]
+    assert index.length(2) == 10
+    assert index.length(3) == 14
+    assert index.length(0) == 0
+    assert index.newest_within(4) == []
+
+def test_memory_length_matches_the_formatted_block(memory_manager):
+    manager = memory_manager()
+    for i in range(12):
+        manager.write_longterm_memory(f"question {i} about the weather", f"answer {i} is {'very ' * i}sunny")
+    manager.write_tool_used("Used tool: weather lookup")
+    assert manager.flush(timeout=10)
+
+    for limit in (0, 9, 40, 200, 10000):
+        memory, length = manager.get_shortterm_memories_tokenlimit(limit, return_length=True)
+        formatted = memory.replace("{user}", "Joe").replace("{char}", "TARS")
+        assert length == (count_words([formatted])[0] if memory else 0)
+        assert length <= limit
+    assert memory.count("question") == 12
+
+def conversation(start: int, stop: int) -> list:
+    return [{"user_input": f"question {i}", "bot_response": f"answer {i}"} for i in range(start, stop)]
+
+def test_recent_memories_hide_cached_counts(memory_manager):
+    manager = memory_manager()
+    for turn in conversation(0, 3):
+        manager.write_longterm_memory(turn["user_input"], turn["bot_response"])
+    assert manager.flush(timeout=10)
+    assert TOKEN_COUNTS_KEY in manager.hyper_db.documents[-1]
+
+    recent = manager.get_shortterm_memories_recent(2)
+    assert [document["user_input"] for document in recent] == ["question 1", "question 2"]
+    assert all(TOKEN_COUNTS_KEY not in document for document in recent)
+
+def test_lazy_counts_are_journaled(memory_manager):
+    manager = memory_manager()
+    # Imported without counts, as by load_initial_memory
+    manager.hyper_db.add_documents(conversation(0, 5))
+    manager.hyper_db.persist(manager.memory_db_path)
+
+    _, length = manager.get_shortterm_memories_tokenlimit(1000, return_length=True)
+    assert length == 5 * 7 + 4  # "Joe: question i\nTARS: answer i" and joining newlines
+    key = manager._turn_key()
+    assert [document[TOKEN_COUNTS_KEY] for document in list(manager.hyper_db.view())[1:]] == [{key: 7}] * 5
+
+    # The counts replay from the write-ahead log after a crash
+    manager.hyper_db.persist(manager.memory_db_path)
+    recovered = HyperDB(rag_strategy="naive", reranker_backend="none")
+    assert recovered.load(manager.memory_db_path)
+    assert [document.get(TOKEN_COUNTS_KEY) for document in list(recovered.view())[1:]] == [{key: 7}] * 5
+    recovered.close()
@@ -0,0 +1,64 @@
+"""RemoteEmbeddingProvider against the stand-in /v1/embeddings server (module_embedserver)."""
+
+import numpy as np
+import pytest
+import requests
+
+from conftest import memories
+from modules.module_embedding import RemoteEmbeddingProvider
+from modules.module_embedserver import StandInEmbeddingServer, stand_in_embedding
+from modules.module_hyperdb import HyperDB, get_document_text
+
+DIM = 48
+TEXTS = [f"memory number {i}" for i in range(23)]
+
+@pytest.fixture
+def server():
+    with StandInEmbeddingServer(dim=DIM) as server:
+        yield server
+
+def provider_for(server, **options):
+    return RemoteEmbeddingProvider("stand-in", server.url, **options)
+
+def expected(texts):
+    return np.stack([stand_in_embedding(text, DIM) for text in texts])
+
+@pytest.mark.parametrize("encoding_format", ["base64", "float"])
+def test_embeddings_decode_in_order(server, encoding_format):
+    provider = provider_for(server, batch_size=5, concurrency=3, encoding_format=encoding_format)
+    vectors = provider.encode(TEXTS)
+    assert vectors.dtype == np.float32 and vectors.shape == (len(TEXTS), DIM)
+    np.testing.assert_allclose(vectors, expected(TEXTS), rtol=1e-6)
+    assert server.requests == 5 and server.inputs == len(TEXTS)
+    assert provider.encode("memory number 3").shape == (DIM,)
+
+def test_requests_are_bounded_by_characters(server):
+    provider = provider_for(server, batch_size=100, max_batch_chars=40)
+    provider.encode(TEXTS)
+    # Each text is 15-16 characters, so two fit in a request
+    assert server.requests == 12
+    assert provider.encode([]).shape[0] == 0
+
+def test_falls_back_to_float_embeddings():
+    with StandInEmbeddingServer(dim=DIM, support_base64=False) as server:
+        provider = provider_for(server)
+        np.testing.assert_allclose(provider.encode(TEXTS[:3]), expected(TEXTS[:3]), rtol=1e-6)
+        assert provider.encoding_format == "float"
+        provider.encode(TEXTS[3:6])
+        assert server.requests == 2  # the rejected base64 request never reached the counter
+
+def test_rejected_request_raises():
+    with StandInEmbeddingServer(dim=DIM, max_inputs=4) as server:
+        with pytest.raises(requests.exceptions.RequestException):
+            provider_for(server, batch_size=8).encode(TEXTS[:8])
+
+def test_hyperdb_over_remote_embeddings(server):
+    provider = provider_for(server, batch_size=16)
+
+    def embed(items):
+        return provider.encode([item if isinstance(item, str) else get_document_text(item) for item in items])
+
+    db = HyperDB(embedding_function=embed, reranker_backend="none")
+    db.add_documents(memories(0, 40))
+    assert server.inputs == 40
+    assert db.query("memory 17", top_k=1, return_similarities=False) == [{"text": "memory 17"}]
@@ -0,0 +1,13 @@
+"""Reranking of fused hybrid candidates: rerank_candidates bounds the cross-encoder, not the results."""
+
+from conftest import WordOverlapReranker, memories
+
+def test_fewer_rerank_candidates_than_top_k(make_db):
+    db = make_db(rag_strategy="hybrid", rerank_candidates=2, rerank_cache_mb=0)
+    db.reranker = WordOverlapReranker()
+    db.add_documents(memories(0, 40))
+
+    results = db.query("memory 17", top_k=6, return_similarities=False)
+    assert len(results) == 6 and len(set(map(str, results))) == 6
+    assert results[0] == {"text": "memory 17"}
+    assert db.reranker.pairs == 2
@@ -0,0 +1,174 @@
+"""Sealed memory segments (module_segments): sealing, merged queries, windows, recovery."""
+
+# === Standard Libraries ===
+import os
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import WordOverlapReranker, embed
+from modules.module_hyperdb import HyperDB, get_document_text
+from modules.module_segments import HOT_SEGMENT, SegmentedHyperDB
+
+START = datetime(2025, 1, 1)
+
+def turns(start: int, stop: int) -> list:
+    return [
+        {
+            "timestamp": (START + timedelta(hours=i)).strftime("%Y-%m-%d %H:%M:%S"),
+            "user_input": f"question q{i} about topic {i % 13}",
+            "bot_response": f"answer {i} fruit {i % 7}",
+        }
+        for i in range(start, stop)
+    ]
+
+def text(i: int) -> str:
+    """Query text that embeds exactly like turn i."""
+    return get_document_text(turns(i, i + 1)[0])
+
+def number(document) -> int:
+    return int(document["user_input"].split()[1][1:])
+
+class Memory:
+    """A hot HyperDB, its snapshot and the SegmentedHyperDB over it, opened from `directory`."""
+    def __init__(self, directory, storage="int8", strategy="naive", segment_size=50):
+        options = dict(embedding_function=embed, rag_strategy=strategy, reranker_backend="none")
+        self.path = os.path.join(directory, "hot.pickle.gz")
+        self.hot = HyperDB(**options)
+        if os.path.exists(self.path):
+            self.hot.load(self.path)
+        else:
+            self.hot.save(self.path)
+        self.segments = SegmentedHyperDB(
+            self.hot, os.path.join(directory, "segments"), segment_size=segment_size, segment_storage=storage,
+            segment_factory=lambda: HyperDB(vector_storage=storage, **options),
+        )
+        self.segments.open(self.path)
+
+    def write(self, documents):
+        self.hot.add_documents(documents)
+        self.hot.persist(self.path)
+        self.segments.maybe_seal(self.path)
+
+    def close(self):
+        self.segments.close()
+        self.hot.close()
+
+@pytest.fixture
+def memory(tmp_path):
+    opened = []
+
+    def open_memory(**options):
+        opened.append(Memory(str(tmp_path), **options))
+        return opened[-1]
+
+    yield open_memory
+    for memory in opened:
+        memory.close()
+
+@pytest.mark.parametrize("storage", ["float32", "int8"])
+@pytest.mark.parametrize("strategy", ["naive", "hybrid"])
+def test_sealed_queries_match_a_flat_database(memory, storage, strategy):
+    mem = memory(storage=storage, strategy=strategy)
+    flat = HyperDB(embedding_function=embed, rag_strategy=strategy, reranker_backend="none")
+    for start in range(0, 260, 20):
+        mem.write(turns(start, start + 20))
+        flat.add_documents(turns(start, start + 20))
+
+    assert len(mem.segments.segments) == 4
+    assert mem.hot.live_count == 60
+    assert mem.segments.live_count == 260
+    assert [number(segment.documents[0]) for segment in mem.segments.segments] == [0, 50, 100, 150]
+    for i in (3, 77, 140, 230):
+        top = mem.segments.query(text(i), top_k=1, return_similarities=False)
+        assert top == flat.query(text(i), top_k=1, return_similarities=False)
+        assert number(top[0]) == i
+    flat.close()
+
+def test_time_filters_skip_segments(memory):
+    mem = memory()
+    mem.write(turns(0, 260))
+    filters = {"since": START + timedelta(hours=60), "until": START + timedelta(hours=90)}
+    assert [number for number, _ in mem.segments._databases(filters)] == [1, HOT_SEGMENT]
+    results = mem.segments.query("question about topic", top_k=5, return_rows=True, filters=filters)
+    assert len(results) == 5
+    assert all(60 <= number(document) < 90 and handle[0] == 1 for document, _, handle in results)
+
+def test_windows_cross_segment_boundaries(memory):
+    mem = memory()
+    mem.write(turns(0, 260))
+    window = lambda handle, before, after: [number(document) for document in mem.segments.get_window(handle, before, after)]
+    assert window((0, 49), 1, 1) == [48, 49, 50]
+    assert window((1, 0), 1, 0) == [49, 50]
+    assert window((HOT_SEGMENT, mem.hot.doc_id(0)), 2, 1) == [198, 199, 200, 201]
+    assert window((3, 49), 0, 2) == [199, 200, 201]
+
+def test_hot_handles_survive_sealing(memory):
+    mem = memory()
+    mem.write(turns(0, 99))
+    [(document, _, handle)] = mem.segments.query(text(60), top_k=1, return_rows=True)
+    assert number(document) == 60 and handle[0] == HOT_SEGMENT
+
+    mem.write(turns(99, 100))  # seals 0-49 and renumbers the hot rows
+    assert len(mem.segments.segments) == 1
+    assert [number(d) for d in mem.segments.get_window(handle, 1, 1)] == [59, 60, 61]
+
+    [(document, _, handle)] = mem.segments.query(text(10), top_k=1, return_rows=True)
+    mem.write(turns(100, 150))  # 10 is sealed, so a hot handle from before would point at it
+    assert [number(d) for d in mem.segments.get_window(handle, 1, 1)] == [9, 10, 11]
+
+def test_reopen_and_interrupted_seal(memory, tmp_path):
+    mem = memory()
+    mem.write(turns(0, 99))
+    mem.segments.seal()  # crash before the hot segment is saved: the WAL still holds rows 0-49
+    mem.close()
+
+    reopened = memory()
+    assert len(reopened.segments.segments) == 1
+    assert reopened.hot.live_count == 49
+    assert reopened.segments.live_count == 99
+    assert number(reopened.hot.documents[0]) == 50
+    assert not os.path.exists(str(tmp_path / "segments" / "segment-00000.memdb.wal"))
+
+def test_queries_while_sealing(memory):
+    mem = memory(segment_size=40)
+    mem.write(turns(0, 40))
+    errors = []
+    done = threading.Event()
+
+    def writer():
+        try:
+            for start in range(40, 400, 10):
+                mem.write(turns(start, start + 10))
+        except Exception as e:  # surfaced by the assertion below
+            errors.append(e)
+        finally:
+            done.set()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    checked = 0
+    while not done.is_set() or not checked:
+        results = mem.segments.query(text(checked % 40), top_k=1, return_rows=True)
+        for document, _, handle in results:
+            numbers = [number(d) for d in mem.segments.get_window(handle, 1, 1)]
+            assert number(document) in numbers
+            assert numbers == list(range(numbers[0], numbers[0] + len(numbers)))
+        checked += 1
+    thread.join()
+
+    assert not errors
+    assert mem.segments.live_count == 400
+
+def test_fewer_rerank_candidates_than_top_k(memory):
+    mem = memory(strategy="hybrid")
+    for start in range(0, 120, 20):
+        mem.write(turns(start, start + 20))
+    assert mem.segments.segments
+    mem.hot.rerank_candidates = 2
+    mem.hot.reranker = WordOverlapReranker()
+
+    results = mem.segments.query(text(7), top_k=6, return_similarities=False)
+    assert len(results) == 6 and number(results[0]) == 7
+    assert mem.hot.reranker.pairs == 2
@@ -0,0 +1,76 @@
+"""Write-ahead log: replay after a crash, torn tails and log compaction."""
+
+# === Standard Libraries ===
+import os
+
+import pytest
+
+from conftest import memories
+
+@pytest.fixture
+def journaled(make_db, tmp_path):
+    """A saved database with three persisted batches and a persisted delete after the snapshot."""
+    path = str(tmp_path / "memory.pickle.gz")
+    db = make_db(wal_compact_every=1000)
+    db.add_documents(memories(0, 10))
+    db.save(path)
+    for start in (10, 20, 30):
+        db.add_documents(memories(start, start + 10))
+        db.persist(path)
+    db.remove_documents([4])
+    db.persist(path)
+    return db, path
+
+def reload(make_db, path):
+    db = make_db(wal_compact_every=1000)
+    assert db.load(path)
+    return db
+
+def test_replay_after_crash(journaled, make_db):
+    db, path = journaled
+    assert os.path.getsize(path + ".wal") > 0
+    # No close(): the process died right after the last persist
+    recovered = reload(make_db, path)
+    assert list(recovered.view()) == list(db.view())
+    assert {"text": "memory 4"} not in list(recovered.view())
+    assert recovered.query("memory 27", top_k=1, return_similarities=False) == [{"text": "memory 27"}]
+
+def test_torn_tail_is_dropped_and_truncated(journaled, make_db):
+    db, path = journaled
+    wal = path + ".wal"
+    intact = os.path.getsize(wal)
+    with open(wal, "ab") as f:
+        f.write(b"\x40\x00\x00\x00\x01\x02\x03\x04partial")  # header promising 64 bytes, then a crash
+
+    recovered = reload(make_db, path)
+    assert list(recovered.view()) == list(db.view())
+    assert os.path.getsize(wal) == intact
+
+    # The log keeps working after the truncation
+    recovered.add_documents(memories(40, 41))
+    recovered.persist(path)
+    assert list(reload(make_db, path).view())[-1] == {"text": "memory 40"}
+
+def test_corrupt_last_record_is_dropped(journaled, make_db):
+    db, path = journaled
+    wal = path + ".wal"
+    with open(wal, "r+b") as f:
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last[0] ^ 0xFF]))
+
+    # The last record was the delete of memory 4
+    recovered = reload(make_db, path)
+    assert recovered.live_count == db.live_count + 1
+    assert {"text": "memory 4"} in list(recovered.view())
+
+def test_log_is_compacted_into_the_snapshot(make_db, tmp_path):
+    path = str(tmp_path / "memory.pickle.gz")
+    db = make_db(wal_compact_every=3)
+    db.save(path)
+    for start in range(0, 50, 10):
+        db.add_documents(memories(start, start + 10))
+        db.persist(path)
+    assert db._wal.records < 3
+    assert list(reload(make_db, path).view()) == memories(0, 50)